@@ -0,0 +1,290 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from itertools import repeat
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# cafe_tycoon은 창을 열지 않고 상수/규칙만 씁니다. (pygame 환영 문구는 cafe_tycoon이 가져오기 전에 끕니다)
+from cafe_tycoon import (INITIAL_INTERVAL, INITIAL_TIME_LIMIT, SPAWN_DECAY, MIN_CUSTOMER_INTERVAL,
+                         MAX_FAILED_ORDERS, SCORE_SCALE, BOT_SERVE_TIME, HEADLESS_DT, MAX_SHIFT_SECONDS)
+
+# --- 1. 설정 ---
+
+DEFAULT_BATCH_SHIFTS = 100_000
+# 프로세스 하나가 배열 하나로 한꺼번에 돌리는 판 수
+SHARD_SIZE = 10_000
+# 살아 있는 판이 배열 크기의 이 비율 아래로 줄면 끝난 판을 배열에서 빼냅니다.
+COMPACT_RATIO = 0.5
+# 버틴 시간 분포로 보고할 백분위
+SURVIVAL_QUANTILES = (10, 25, 50, 75, 90, 99)
+# 생존 곡선(이 시각까지 게임 오버가 나지 않은 판의 비율)을 찍을 게임 시각 (초)
+SURVIVAL_POINTS = (60, 120, 180, 300, 600, 1200)
+
+
+# --- 2. 난이도 설정과 플레이어 정책 ---
+
+@dataclass(frozen=True)
+class ShiftParams:
+    """한 판의 난이도 설정 (CafeSimulation 인자와 같은 뜻)"""
+    initial_interval: float = INITIAL_INTERVAL
+    time_limit: float = INITIAL_TIME_LIMIT
+    spawn_decay: float = SPAWN_DECAY
+    min_interval: float = MIN_CUSTOMER_INTERVAL
+    max_failed: int = MAX_FAILED_ORDERS
+    score_scale: float = SCORE_SCALE
+
+    @property
+    def order_slots(self) -> int:
+        """한 판에 동시에 쌓일 수 있는 최대 주문 수 (도착 간격의 하한과 제한 시간으로 정해집니다)"""
+        shortest = min(self.initial_interval, self.min_interval)
+        return int(np.ceil(self.time_limit / shortest)) + 2
+
+
+@dataclass(frozen=True)
+class PlayerPolicy:
+    """스크립트 플레이어 (play_bot_shift의 봇을 일반화)
+
+    가장 오래된 주문부터 한 잔씩, reaction초 뒤에 만들기 시작해 serve_time x (1 ± jitter)초 걸려 냅니다.
+    error_rate 확률로 틀린 음료를 내면 컵이 돌아오므로 같은 주문을 처음부터 다시 만듭니다.
+    다른 정책은 prep_times / mistakes / reaction을 가진 객체면 됩니다. (프로세스 풀로 넘기므로 pickle 가능해야 함)
+    """
+    name: str
+    serve_time: float = BOT_SERVE_TIME
+    jitter: float = 0.3
+    reaction: float = 0.0
+    error_rate: float = 0.0
+
+    def prep_times(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """n잔의 제작 시간 (초)"""
+        if not self.jitter:
+            return np.full(n, self.serve_time)
+        return self.serve_time * rng.uniform(1 - self.jitter, 1 + self.jitter, n)
+
+    def mistakes(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """n잔 중 틀린 음료를 낸 잔 (bool 배열)"""
+        if not self.error_rate:
+            return np.zeros(n, dtype=bool)
+        return rng.random(n) < self.error_rate
+
+
+POLICIES = {
+    # 한 잔 4초, 실수 없음
+    "perfect": PlayerPolicy("perfect", serve_time=4.0, jitter=0.0),
+    # cafe_tycoon --headless의 봇과 같은 플레이어
+    "bot": PlayerPolicy("bot"),
+    # 주문을 보고 3초 뒤에야 만들기 시작하는 플레이어
+    "delayed": PlayerPolicy("delayed", reaction=3.0),
+    # 다섯 잔에 한 잔꼴로 틀리는 플레이어
+    "error_prone": PlayerPolicy("error_prone", error_rate=0.2),
+}
+
+
+# --- 3. 배열 시뮬레이터 ---
+
+RESULT_FIELDS = ("seconds", "score", "customers", "served", "failed", "game_over")
+
+def simulate_batch(shifts: int, seed=0, policy: PlayerPolicy = POLICIES["bot"], params: ShiftParams = ShiftParams(),
+                   dt: float = HEADLESS_DT, max_seconds: float = MAX_SHIFT_SECONDS) -> Dict[str, np.ndarray]:
+    """shifts판을 NumPy 배열로 한꺼번에 진행합니다. 모든 판이 같은 게임 시각으로 나란히 dt씩 움직입니다.
+
+    규칙은 CafeSimulation.step과 같고(도착 -> 시간 초과 -> 게임 오버), 플레이어는 play_bot_shift처럼
+    쉬고 있으면 가장 오래된 주문을 잡고, 다 만들었으면 냅니다. 주문은 판마다 order_slots칸짜리 마감 시각 배열이며
+    빈 칸은 inf입니다. 칸이 모자라면 배열을 넓힙니다. seed는 정수나 np.random.SeedSequence입니다.
+
+    반환: 판별 결과 배열 {"seconds", "score", "customers", "served", "failed", "game_over"}
+    """
+    rng = np.random.default_rng(seed)
+    results = {
+        "seconds": np.zeros(shifts),
+        "score": np.zeros(shifts, dtype=np.int64),
+        "customers": np.zeros(shifts, dtype=np.int32),
+        "served": np.zeros(shifts, dtype=np.int32),
+        "failed": np.zeros(shifts, dtype=np.int32),
+        "game_over": np.zeros(shifts, dtype=bool),
+    }
+
+    ids = np.arange(shifts)
+    deadlines = np.full((shifts, params.order_slots), np.inf)
+    last_customer = np.zeros(shifts)
+    interval = np.full(shifts, float(params.initial_interval))
+    # 만들고 있는 주문의 칸 번호 (-1: 쉬는 중)와 완성 시각
+    target = np.full(shifts, -1)
+    ready_at = np.zeros(shifts)
+    score = np.zeros(shifts, dtype=np.int64)
+    customers = np.zeros(shifts, dtype=np.int32)
+    served = np.zeros(shifts, dtype=np.int32)
+    failed = np.zeros(shifts, dtype=np.int32)
+    alive = np.ones(shifts, dtype=bool)
+
+    def record(rows, now, game_over):
+        out = ids[rows]
+        results["seconds"][out] = now
+        results["score"][out] = score[rows]
+        results["customers"][out] = customers[rows]
+        results["served"][out] = served[rows]
+        results["failed"][out] = failed[rows]
+        results["game_over"][out] = game_over
+
+    now = 0.0
+    while len(ids) and now < max_seconds:
+        now += dt
+        rows = np.arange(len(ids))
+
+        # 1. 손님 도착
+        due = alive & (now - last_customer > interval)
+        if due.any():
+            r = np.nonzero(due)[0]
+            free = np.isinf(deadlines[r])
+            if not free.any(axis=1).all():
+                # 빈 칸이 없는 판이 있으면 (order_slots 추정보다 주문이 많이 쌓인 경우) 모든 판에 한 칸을 붙입니다.
+                # 한 스텝에 판마다 최대 한 명만 도착하므로 한 칸이면 충분합니다.
+                deadlines = np.hstack([deadlines, np.full((len(deadlines), 1), np.inf)])
+                free = np.isinf(deadlines[r])
+            deadlines[r, free.argmax(axis=1)] = now + params.time_limit
+            last_customer[r] = now
+            interval[r] = np.maximum(params.min_interval, interval[r] * params.spawn_decay)
+            customers[r] += 1
+
+        # 2. 시간 초과: 만들던 주문이 사라졌으면 쉬는 상태로 돌아갑니다.
+        expired = deadlines <= now
+        if expired.any():
+            failed += expired.sum(axis=1, dtype=np.int32)
+            deadlines[expired] = np.inf
+            target[(target >= 0) & np.isinf(deadlines[rows, target])] = -1
+
+        # 3. 게임 오버
+        over = alive & (failed >= params.max_failed)
+        if over.any():
+            record(over, now, True)
+            alive &= ~over
+            deadlines[over] = np.inf
+            target[over] = -1
+
+        # 4. 쉬고 있으면 가장 오래된 주문을 잡습니다. (잡은 스텝에는 내지 않습니다)
+        start = alive & (target < 0) & np.isfinite(deadlines).any(axis=1)
+        if start.any():
+            r = np.nonzero(start)[0]
+            target[r] = deadlines[r].argmin(axis=1)
+            ready_at[r] = now + policy.reaction + policy.prep_times(rng, len(r))
+        else:
+            r = np.empty(0, dtype=np.int64)
+
+        # 5. 다 만든 음료를 냅니다. 틀렸으면 다시 만듭니다.
+        done = (target >= 0) & (ready_at <= now)
+        done[r] = False
+        if done.any():
+            d = np.nonzero(done)[0]
+            wrong = policy.mistakes(rng, len(d))
+            if wrong.any():
+                ready_at[d[wrong]] = now + policy.prep_times(rng, int(wrong.sum()))
+            ok = d[~wrong]
+            remaining = deadlines[ok, target[ok]] - now
+            score[ok] += (params.time_limit * params.score_scale / np.maximum(1, remaining)).astype(np.int64)
+            deadlines[ok, target[ok]] = np.inf
+            served[ok] += 1
+            target[ok] = -1
+
+        # 끝난 판이 많아지면 배열을 줄여 남은 판만 계산합니다.
+        if alive.sum() < COMPACT_RATIO * len(ids):
+            keep = alive
+            ids, deadlines, last_customer, interval = ids[keep], deadlines[keep], last_customer[keep], interval[keep]
+            target, ready_at, score, customers = target[keep], ready_at[keep], score[keep], customers[keep]
+            served, failed, alive = served[keep], failed[keep], alive[keep]
+
+    # max_seconds까지 버틴 판 (생존 시간 분포에서는 중도 절단으로 봅니다)
+    if len(ids):
+        record(alive, now, False)
+    return results
+
+def run_batch(shifts: int, seed: int = 0, policy: PlayerPolicy = POLICIES["bot"], params: ShiftParams = ShiftParams(),
+              dt: float = HEADLESS_DT, max_seconds: float = MAX_SHIFT_SECONDS, workers: Optional[int] = None,
+              shard_size: int = SHARD_SIZE) -> Dict[str, np.ndarray]:
+    """shifts판을 shard_size판씩 나눠 프로세스 풀에서 돌리고 결과 배열을 이어 붙입니다. (workers=1이면 현재 프로세스에서)
+
+    조각마다 SeedSequence(seed).spawn으로 독립된 난수열을 쓰므로, 같은 seed와 shard_size면 workers 수와 상관없이 결과가 같습니다.
+    """
+    sizes = [min(shard_size, shifts - start) for start in range(0, shifts, shard_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (sizes, seeds, repeat(policy), repeat(params), repeat(dt), repeat(max_seconds))
+    if workers == 1 or len(sizes) <= 1:
+        parts = list(map(simulate_batch, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(simulate_batch, *args))
+    return {field: np.concatenate([p[field] for p in parts]) for field in RESULT_FIELDS}
+
+
+# --- 4. 보고서 ---
+
+def summarize_batch(results: Dict[str, np.ndarray], max_seconds: float = MAX_SHIFT_SECONDS) -> Dict[str, Any]:
+    """버틴 시간 분포(백분위, 생존 곡선)와 판당 평균"""
+    seconds = results["seconds"]
+    count = len(seconds) or 1
+    return {
+        "shifts": len(seconds),
+        "orders": int(results["customers"].sum()),
+        "game_over_rate": float(results["game_over"].mean()) if len(seconds) else 0.0,
+        "censored": int((~results["game_over"]).sum()),
+        "survival_mean": float(seconds.mean()) if len(seconds) else 0.0,
+        "survival_quantiles": {str(q): float(np.percentile(seconds, q)) for q in SURVIVAL_QUANTILES} if len(seconds) else {},
+        "survival_curve": {str(t): float((seconds > t).sum() / count) for t in SURVIVAL_POINTS if t < max_seconds},
+        "mean_score": float(results["score"].mean()) if len(seconds) else 0.0,
+        "mean_served": float(results["served"].mean()) if len(seconds) else 0.0,
+        "serve_rate": float(results["served"].sum() / max(1, results["customers"].sum())),
+    }
+
+def format_summary(name: str, summary: Dict[str, Any], elapsed: float) -> str:
+    quantiles = " ".join(f"p{q}:{v:.0f}" for q, v in summary["survival_quantiles"].items())
+    curve = " ".join(f"{t}s:{v:.1%}" for t, v in summary["survival_curve"].items())
+    return "\n".join([
+        f"[{name}] {summary['shifts']}판 / 주문 {summary['orders']}개 ({elapsed:.2f}초, "
+        f"분당 주문 {summary['orders'] / max(elapsed, 1e-9) * 60:,.0f}개)",
+        f"  버틴 시간(초) 평균 {summary['survival_mean']:.1f} | {quantiles} | 게임 오버 {summary['game_over_rate']:.1%}"
+        f" (중도 절단 {summary['censored']}판)",
+        f"  생존 곡선 {curve}",
+        f"  평균 점수 {summary['mean_score']:.1f} | 평균 서빙 {summary['mean_served']:.1f}잔 | 서빙 비율 {summary['serve_rate']:.1%}",
+    ])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="카페 타이푼 난이도 몬테카를로: 여러 판을 배열로 한꺼번에 시뮬레이션합니다.")
+    parser.add_argument("--shifts", type=int, default=DEFAULT_BATCH_SHIFTS, help="정책마다 돌릴 판 수")
+    parser.add_argument("--seed", type=int, default=0, help="난수 시드")
+    parser.add_argument("--policy", default="all", choices=["all", *POLICIES], help="플레이어 정책 (all: 모두 비교)")
+    parser.add_argument("--workers", type=int, default=None, help="프로세스 수 (기본: CPU 수, 1이면 현재 프로세스)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="프로세스 하나가 한 번에 돌리는 판 수")
+    parser.add_argument("--dt", type=float, default=HEADLESS_DT, help="스텝 간격 (초)")
+    parser.add_argument("--max-seconds", type=float, default=MAX_SHIFT_SECONDS, help="한 판을 끊는 게임 시간 (초)")
+    parser.add_argument("--interval", type=float, default=INITIAL_INTERVAL, help="첫 손님 도착 간격 (초)")
+    parser.add_argument("--time-limit", type=float, default=INITIAL_TIME_LIMIT, help="주문 제한 시간 (초)")
+    parser.add_argument("--decay", type=float, default=SPAWN_DECAY, help="손님마다 도착 간격에 곱하는 감소율")
+    parser.add_argument("--min-interval", type=float, default=MIN_CUSTOMER_INTERVAL, help="도착 간격의 하한 (초)")
+    parser.add_argument("--max-failed", type=int, default=MAX_FAILED_ORDERS, help="게임 오버까지 허용하는 실패 수")
+    parser.add_argument("--score-scale", type=float, default=SCORE_SCALE, help="서빙 점수 계수")
+    parser.add_argument("--save", default=None, help="요약을 JSON으로 저장할 경로")
+    args = parser.parse_args(argv)
+
+    params = ShiftParams(args.interval, args.time_limit, args.decay, args.min_interval, args.max_failed,
+                         args.score_scale)
+    names = list(POLICIES) if args.policy == "all" else [args.policy]
+    report = {"params": asdict(params), "policies": {}}
+    for name in names:
+        started = time.perf_counter()
+        results = run_batch(args.shifts, args.seed, POLICIES[name], params, args.dt, args.max_seconds,
+                            args.workers, args.shard_size)
+        summary = summarize_batch(results, args.max_seconds)
+        print(format_summary(name, summary, time.perf_counter() - started))
+        report["policies"][name] = summary
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
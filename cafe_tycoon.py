@@ -1,18 +1,26 @@
-import pygame
+import os
 import time
 import random
+import re
 import sys
+from collections import OrderedDict
+from functools import lru_cache
+
+# pygame 환영 문구가 헤드리스/봇 출력에 섞이지 않게 합니다. (pygame을 가져오기 전에 정해야 합니다)
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame
 
-# --- 1. 기본 환경 설정 및 Pygame 초기화 ---
-pygame.init()
+# --- 1. 기본 환경 설정 ---
+# 창과 폰트는 init_display()에서 만듭니다. import만으로는 창을 열지 않으므로 헤드리스 시뮬레이션에서도 가져다 쓸 수 있습니다.
 
 # 화면 설정
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("카페 타이푼: LLM 오더 - 최종 버전")
-clock = pygame.time.Clock()
 FPS = 60
+# 게임 규칙은 화면 프레임과 상관없이 이 간격(초)의 고정 스텝으로만 진행합니다.
+FIXED_DT = 1.0 / FPS
+# 한 프레임에 따라잡을 최대 스텝 수. 창을 끌거나 멈췄다 돌아왔을 때 밀린 시간을 한꺼번에 돌지 않고 버립니다.
+MAX_STEPS_PER_FRAME = 10
 
 # 색상
 WHITE = (255, 255, 255)
@@ -29,20 +37,38 @@ GRAY = (200, 200, 200)
 # macOS 예시: '/System/Library/Fonts/Supplemental/AppleGothic.ttf'
 KOREAN_FONT_PATH = 'C:/Windows/Fonts/malgunbd.ttf' 
 
-try:
-    font_small = pygame.font.Font(KOREAN_FONT_PATH, 18)
-    font_medium = pygame.font.Font(KOREAN_FONT_PATH, 24)
-    font_large = pygame.font.Font(KOREAN_FONT_PATH, 48)
-except FileNotFoundError:
-    print("Warning: 한글 폰트 파일을 찾을 수 없습니다. 기본 폰트로 대체합니다.")
-    font_small = pygame.font.Font(None, 18)
-    font_medium = pygame.font.Font(None, 24)
-    font_large = pygame.font.Font(None, 48)
+# init_display()가 채웁니다.
+screen = None
+clock = None
+font_small = font_medium = font_large = None
+
+def init_display():
+    """Pygame을 초기화하고 게임 창과 폰트를 준비합니다."""
+    global screen, clock, font_small, font_medium, font_large
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("카페 타이푼: LLM 오더 - 최종 버전")
+    clock = pygame.time.Clock()
+
+    try:
+        font_small = pygame.font.Font(KOREAN_FONT_PATH, 18)
+        font_medium = pygame.font.Font(KOREAN_FONT_PATH, 24)
+        font_large = pygame.font.Font(KOREAN_FONT_PATH, 48)
+    except FileNotFoundError:
+        print("Warning: 한글 폰트 파일을 찾을 수 없습니다. 기본 폰트로 대체합니다.")
+        font_small = pygame.font.Font(None, 18)
+        font_medium = pygame.font.Font(None, 24)
+        font_large = pygame.font.Font(None, 48)
 
 # --- 2. 게임 데이터 및 상수 ---
 MAX_FAILED_ORDERS = 3
 INITIAL_TIME_LIMIT = 30.0
 INITIAL_INTERVAL = 15.0 
+# 손님이 올 때마다 도착 간격에 곱하는 감소율과 간격의 하한 (초)
+SPAWN_DECAY = 0.95
+MIN_CUSTOMER_INTERVAL = 5.0
+# 서빙 점수 = int(제한 시간 x SCORE_SCALE / max(1, 남은 시간))
+SCORE_SCALE = 10
 
 INGREDIENTS = {
     'ICE': '얼음', 'WATER': '물', 'MILK': '우유', 'SHOT': '샷',
@@ -72,21 +98,28 @@ INGREDIENT_POSITIONS = {
 INGREDIENT_SIZE = 80
 TRASH_SIZE = 80
 
+# 레시피 서명에 들어가는 재료 순서. 서명 = (이 순서의 재료 개수 튜플, 믹서기 사용 여부)
+RECIPE_KEYS = ('ICE', 'WATER', 'MILK', 'SHOT', 'SYRUP_S', 'SYRUP_M', 'SYRUP_G', 'SODA', 'WHIP', 'CHIP')
+RECIPE_SLOT = {key: i for i, key in enumerate(RECIPE_KEYS)}
+EMPTY_SIGNATURE = ((0,) * len(RECIPE_KEYS), False)
+
 # --- 3. 클래스 정의 ---
 
 class Order:
     """손님의 주문 정보와 제한 시간을 관리하는 클래스"""
-    def __init__(self, menu_name, required_steps):
+    def __init__(self, menu_name, required_steps, start_time, time_limit=INITIAL_TIME_LIMIT, signature=None):
         self.menu_name = menu_name
         self.required_steps = required_steps
-        self.start_time = time.time()
-        self.time_limit = INITIAL_TIME_LIMIT
+        self.signature = signature or recipe_signature(required_steps)
+        self.start_time = start_time
+        self.time_limit = time_limit
+        self.deadline = start_time + time_limit
 
-    def get_remaining_time(self):
-        return self.time_limit - (time.time() - self.start_time)
+    def get_remaining_time(self, now):
+        """now: 시뮬레이션 시각 (CafeSimulation.now)"""
+        return self.deadline - now
 
-    def get_time_color(self):
-        remaining = self.get_remaining_time()
+    def get_time_color(self, remaining):
         if remaining > 20: return GREEN
         elif remaining > 10: return YELLOW
         elif remaining > 5: return ORANGE
@@ -99,6 +132,9 @@ class PlayerCup:
     """플레이어가 조작하는 컵과 그 내용물을 관리하는 클래스"""
     def __init__(self, x, y, width=50, height=80):
         self.contents = {}
+        self._counts = [0] * len(RECIPE_KEYS)
+        # 내용물의 레시피 서명. 재료를 넣을 때마다 갱신하므로 주문과 비교할 때는 ==만 하면 됩니다.
+        self.signature = EMPTY_SIGNATURE
         self.rect = pygame.Rect(x, y, width, height)
         self.is_dragging = False
         self.offset_x, self.offset_y = 0, 0
@@ -110,40 +146,19 @@ class PlayerCup:
                 self.contents['BLENDED'] = True
         else:
             self.contents[ingredient_key] = self.contents.get(ingredient_key, 0) + 1
+            if ingredient_key in RECIPE_SLOT:
+                self._counts[RECIPE_SLOT[ingredient_key]] += 1
+        self.signature = (tuple(self._counts), bool(self.contents.get('BLENDED')))
         
     def reset(self):
         self.contents = {}
+        self._counts = [0] * len(RECIPE_KEYS)
+        self.signature = EMPTY_SIGNATURE
         self.rect.topleft = self.original_pos
 
     def check_match(self, order):
-        """현재 컵의 내용물이 주문에 맞는지 확인"""
-        required = order.required_steps.copy()
-        current = self.contents.copy()
-
-        # 1. 믹서기 처리 확인
-        if required.get('BLENDER'):
-            if not current.get('BLENDED'): return False
-            del required['BLENDER']
-            if 'BLENDED' in current: del current['BLENDED']
-        elif 'BLENDED' in current and current['BLENDED']:
-            return False
-
-        # 2. 필수 재료 확인
-        for key, count in required.items():
-            if current.get(key, 0) != count:
-                return False
-
-        # 3. 불필요한 재료 확인
-        required_keys = set(required.keys())
-        current_keys = set(k for k, v in current.items() if v > 0)
-        
-        if 'BLENDED' in current_keys: current_keys.remove('BLENDED')
-        
-        for key in current_keys:
-            if key not in required_keys:
-                return False
-
-        return True
+        """현재 컵의 내용물이 주문에 맞는지 확인 (재료 개수가 모두 같고 믹서기 여부가 같아야 함)"""
+        return self.signature == order.signature
     
     def get_layer_config(self):
         """컵 내용물의 시각적 레이어 정보를 반환"""
@@ -194,121 +209,369 @@ class PlayerCup:
 
 # --- 4. 주문 파싱 및 생성 로직 ---
 
+# 주문 문장에서 찾는 낱말. 한 번의 정규식 검색으로 나온 낱말 집합으로 레시피를 정합니다.
+_MENU_KEYWORDS = re.compile("ice|아이스|에이드|스무디|아메리카노|라떼|딸기|망고|청포도|휘핑크림|초코칩")
+# 생성기 메뉴 선택지 (generate_llm_order와 RECIPE_INDEX가 같이 씁니다)
+COFFEE_TEMPS = ('ice', 'hot')
+COFFEE_BASES = ('아메리카노', '라떼')
+COFFEE_TOPPINGS = ('', ' 휘핑크림 토핑 추가', ' 초코칩 토핑 추가')
+SYRUP_FLAVORS = (('딸기', 'SYRUP_S'), ('망고', 'SYRUP_M'), ('청포도', 'SYRUP_G'))
+NONCOFFEE_STYLES = ('에이드', '스무디')
+# 처음 보는 주문 문장(실제 LLM 출력 등)의 파싱 결과를 기억해 둘 개수
+RECIPE_CACHE_SIZE = 4096
+
+def recipe_signature(steps):
+    """재료 개수 dict(레시피 또는 컵 내용물)를 (RECIPE_KEYS 순서의 개수 튜플, 믹서기 여부)로 바꿉니다.
+
+    해시 가능한 값이라 == 한 번이나 dict 조회로 음료가 같은지 비교할 수 있습니다.
+    """
+    counts = [0] * len(RECIPE_KEYS)
+    for key, count in steps.items():
+        if key in RECIPE_SLOT:
+            counts[RECIPE_SLOT[key]] = count
+    return tuple(counts), bool(steps.get('BLENDER') or steps.get('BLENDED'))
+
 def parse_order_to_steps(order_text):
     steps = {}
-    text = order_text.lower()
+    words = set(_MENU_KEYWORDS.findall(order_text.lower()))
+    is_ade = '에이드' in words
+    is_smoothie = '스무디' in words
     
     # 1. 온도 처리 (아이스는 논커피 포함 기본으로 간주)
-    is_ice = 'ice' in text or '아이스' in text or '에이드' in text or '스무디' in text
+    is_ice = 'ice' in words or '아이스' in words or is_ade or is_smoothie
     if is_ice:
         steps['ICE'] = 1
 
     # 2. 베이스 음료 처리 (샷 추가 제거, 샷 1개 고정)
-    if '아메리카노' in text:
+    if '아메리카노' in words:
         steps['WATER'] = 1
         steps['SHOT'] = 1 
-    elif '라떼' in text:
+    elif '라떼' in words:
         steps['MILK'] = 1
         steps['SHOT'] = 1
     
-    # 3. 논커피 시럽 처리
-    syrups = []
-    if '딸기' in text and ('에이드' in text or '스무디' in text): syrups.append('SYRUP_S')
-    if '망고' in text and ('에이드' in text or '스무디' in text): syrups.append('SYRUP_M')
-    if '청포도' in text and ('에이드' in text or '스무디' in text): syrups.append('SYRUP_G')
-    
-    if len(syrups) >= 1: 
-        steps[syrups[0]] = 1
+    # 3. 논커피 시럽 처리 (여러 개면 첫 번째 시럽)
+    if is_ade or is_smoothie:
+        syrup_key = next((key for flavor, key in SYRUP_FLAVORS if flavor in words), None)
+        if syrup_key:
+            steps[syrup_key] = 1
     
     # 4. 논커피 제조 방식
-    if '에이드' in text:
+    if is_ade:
         steps['SODA'] = 1
-    elif '스무디' in text:
+    elif is_smoothie:
         steps['WATER'] = steps.get('WATER', 0) + 1
         steps['BLENDER'] = 1
         
     # 5. 토핑 추가
-    if '휘핑크림' in text:
+    if '휘핑크림' in words:
         steps['WHIP'] = 1
-    elif '초코칩' in text:
+    elif '초코칩' in words:
         steps['CHIP'] = 1
 
     return steps
 
-def generate_llm_order():
-    """랜덤한 메뉴 텍스트를 생성하여 LLM의 주문을 모방합니다."""
-    menu_type = random.choice(['coffee', 'noncoffee'])
+@lru_cache(maxsize=RECIPE_CACHE_SIZE)
+def _compile_recipe(order_text):
+    steps = parse_order_to_steps(order_text)
+    return tuple(steps.items()), recipe_signature(steps)
+
+def compile_recipe(order_text):
+    """(재료 개수 dict, 레시피 서명). 같은 문장은 한 번만 파싱합니다. dict는 호출마다 새로 만들어 돌려줍니다."""
+    steps, signature = RECIPE_INDEX.get(order_text) or _compile_recipe(order_text)
+    return dict(steps), signature
+
+def generator_menus():
+    """generate_llm_order가 만들 수 있는 모든 주문 문장"""
+    for temp in COFFEE_TEMPS:
+        for base in COFFEE_BASES:
+            for topping in COFFEE_TOPPINGS:
+                yield f"{temp} {base}{topping} 주세요."
+    for flavor, _ in SYRUP_FLAVORS:
+        for style in NONCOFFEE_STYLES:
+            yield f"{flavor} {style} 만들어주세요."
+
+# 생성기 메뉴는 import할 때 한 번 미리 컴파일해 둡니다. {주문 문장: (재료 (키, 개수) 튜플, 레시피 서명)}
+RECIPE_INDEX = {menu: _compile_recipe(menu) for menu in generator_menus()}
+
+def generate_llm_order(rng=random):
+    """랜덤한 메뉴 텍스트를 생성하여 LLM의 주문을 모방합니다. (rng: 시드를 고정한 random.Random을 넘길 수 있음)
+
+    (주문 문장, 재료 개수 dict, 레시피 서명)을 반환합니다.
+    """
+    menu_type = rng.choice(['coffee', 'noncoffee'])
     
     if menu_type == 'coffee':
-        temp = random.choice(['ice', 'hot'])
-        base = random.choice(['아메리카노', '라떼']) 
-        topping = random.choice(['', ' 휘핑크림 토핑 추가', ' 초코칩 토핑 추가'])
+        temp = rng.choice(COFFEE_TEMPS)
+        base = rng.choice(COFFEE_BASES) 
+        topping = rng.choice(COFFEE_TOPPINGS)
         
         menu_text = f"{temp} {base}{topping} 주세요." 
     else: # noncoffee
-        syrup = random.choice(['딸기', '망고', '청포도'])
-        style = random.choice(['에이드', '스무디'])
+        syrup = rng.choice([flavor for flavor, _ in SYRUP_FLAVORS])
+        style = rng.choice(NONCOFFEE_STYLES)
         
         menu_text = f"{syrup} {style} 만들어주세요."
         
-    required_steps = parse_order_to_steps(menu_text)
-    return menu_text, required_steps
-
-
-# --- 5. 게임 초기화 및 변수 ---
-orders = []
-player_cup = PlayerCup(SCREEN_WIDTH // 2 - 25, SCREEN_HEIGHT - 120)
-last_customer_time = time.time()
-customer_interval = INITIAL_INTERVAL
-failed_orders_count = 0
-score = 0
-game_over = False
-
+    required_steps, signature = compile_recipe(menu_text)
+    return menu_text, required_steps, signature
+
+
+# --- 5. 시뮬레이션 ---
+
+class CafeSimulation:
+    """창과 벽시계 없이 돌아가는 게임 규칙 (손님 도착, 주문 시간 초과, 서빙, 점수, 게임 오버)
+
+    시간(now)은 step(dt)로만 흐르므로 실제 시간보다 빠르게 돌릴 수 있습니다.
+    창 모드에서는 advance()가 주입된 clock으로 잰 실제 경과 시간을 FIXED_DT 스텝으로 나눠 진행합니다.
+    """
+    def __init__(self, seed=None, clock=time.perf_counter, initial_interval=INITIAL_INTERVAL,
+                 time_limit=INITIAL_TIME_LIMIT, spawn_decay=SPAWN_DECAY,
+                 min_interval=MIN_CUSTOMER_INTERVAL, max_failed=MAX_FAILED_ORDERS):
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.time_limit = time_limit
+        self.spawn_decay = spawn_decay
+        self.min_interval = min_interval
+        self.max_failed = max_failed
+
+        self.now = 0.0
+        self.orders = []
+        # {레시피 서명: 그 음료의 열린 주문 목록 (오래된 순)}. 컵 하나를 열린 주문 전체와 dict 조회 한 번으로 맞춰 봅니다.
+        self.open_recipes = {}
+        self.cup = PlayerCup(SCREEN_WIDTH // 2 - 25, SCREEN_HEIGHT - 120)
+        self.last_customer_time = 0.0
+        self.customer_interval = initial_interval
+        self.customers = 0
+        self.served_count = 0
+        self.failed_orders_count = 0
+        self.score = 0
+        self.game_over = False
+
+        self._last_clock = None
+        self._accumulator = 0.0
+
+    def step(self, dt=FIXED_DT):
+        """게임 시간을 dt초 진행합니다."""
+        if self.game_over:
+            return
+        self.now += dt
+
+        if self.now - self.last_customer_time > self.customer_interval:
+            menu_text, required_steps, signature = generate_llm_order(self.rng)
+            order = Order(menu_text, required_steps, self.now, self.time_limit, signature)
+            self.orders.append(order)
+            self.open_recipes.setdefault(signature, []).append(order)
+            self.customers += 1
+            self.last_customer_time = self.now
+            self.customer_interval = max(self.min_interval, self.customer_interval * self.spawn_decay)
+
+        # 주문은 도착 순서대로 쌓이고 제한 시간이 모두 같으므로 마감도 앞에서부터 옵니다.
+        while self.orders and self.orders[0].deadline <= self.now:
+            self._remove_order(0)
+            self.failed_orders_count += 1
+
+        if self.failed_orders_count >= self.max_failed:
+            self.game_over = True
+
+    def advance(self):
+        """지난 호출 이후 clock으로 흐른 시간만큼 고정 스텝을 돌립니다. 진행한 스텝 수를 반환"""
+        current = self.clock()
+        if self._last_clock is None:
+            self._last_clock = current
+            return 0
+        self._accumulator += current - self._last_clock
+        self._last_clock = current
+
+        steps = 0
+        while self._accumulator >= FIXED_DT and steps < MAX_STEPS_PER_FRAME:
+            self.step(FIXED_DT)
+            self._accumulator -= FIXED_DT
+            steps += 1
+        if steps == MAX_STEPS_PER_FRAME:
+            self._accumulator = 0.0
+        return steps
+
+    def remaining_time(self, order):
+        return order.get_remaining_time(self.now)
+
+    def _remove_order(self, index):
+        order = self.orders.pop(index)
+        same_recipe = self.open_recipes[order.signature]
+        same_recipe.remove(order)
+        if not same_recipe:
+            del self.open_recipes[order.signature]
+        return order
+
+    def matching_order(self):
+        """지금 컵으로 낼 수 있는 가장 오래된 주문의 위치 (없으면 None)"""
+        same_recipe = self.open_recipes.get(self.cup.signature)
+        return self.orders.index(same_recipe[0]) if same_recipe else None
+
+    def serve(self, index):
+        """컵을 index번째 주문에 냅니다. 맞으면 점수를 더하고 컵을 비운 뒤 True, 틀리거나 게임이 끝났으면 False"""
+        if self.game_over:
+            return False
+        order = self.orders[index]
+        if not self.cup.check_match(order):
+            return False
+        self.score += int(order.time_limit * SCORE_SCALE / max(1, self.remaining_time(order)))
+        self._remove_order(index)
+        self.cup.reset()
+        self.served_count += 1
+        return True
 
-# --- 6. 드로잉 함수 ---
 
-def draw_table():
+# --- 6. 헤드리스 시뮬레이션 ---
+
+# 봇이 음료 한 잔을 만드는 평균 시간 (초). 매 잔마다 이 값의 0.7 ~ 1.3배가 걸립니다.
+BOT_SERVE_TIME = 6.0
+# 헤드리스 스텝 간격 (초). 화면의 타이머 표시 단위와 같습니다.
+HEADLESS_DT = 0.1
+# 게임 오버가 나지 않는 설정에서 한 판을 끊는 게임 시간 (초)
+MAX_SHIFT_SECONDS = 3600.0
+
+def play_bot_shift(sim, serve_time=BOT_SERVE_TIME, dt=HEADLESS_DT, max_seconds=MAX_SHIFT_SECONDS):
+    """창 없이 한 판을 끝까지 돌립니다. 봇은 가장 오래된 주문부터 한 잔씩 만들어 냅니다.
+
+    만드는 도중 그 주문이 시간 초과로 사라지면 다음 주문을 처음부터 다시 만듭니다.
+    """
+    making, ready_at = None, 0.0
+    while not sim.game_over and sim.now < max_seconds:
+        sim.step(dt)
+        if sim.game_over:
+            break
+        if making is not None and making not in sim.orders:
+            making = None
+        if making is None:
+            if sim.orders:
+                making = sim.orders[0]
+                ready_at = sim.now + serve_time * sim.rng.uniform(0.7, 1.3)
+            continue
+        if sim.now >= ready_at:
+            sim.cup.reset()
+            for key, count in making.required_steps.items():
+                for _ in range(count):
+                    sim.cup.add_ingredient(key)
+            sim.serve(sim.orders.index(making))
+            making = None
+    return {"seconds": sim.now, "score": sim.score, "customers": sim.customers,
+            "served": sim.served_count, "failed": sim.failed_orders_count, "game_over": sim.game_over}
+
+def run_headless(shifts, seed=0, serve_time=BOT_SERVE_TIME, dt=HEADLESS_DT, **params):
+    """seed ~ seed + shifts - 1번 시드로 한 판씩 돌린 결과 목록. params는 CafeSimulation 인자 (initial_interval 등)"""
+    return [play_bot_shift(CafeSimulation(seed=seed + i, **params), serve_time, dt) for i in range(shifts)]
+
+def summarize_shifts(results):
+    count = len(results) or 1
+    return {
+        "shifts": len(results),
+        "mean_seconds": sum(r["seconds"] for r in results) / count,
+        "mean_score": sum(r["score"] for r in results) / count,
+        "mean_served": sum(r["served"] for r in results) / count,
+        "game_over_rate": sum(r["game_over"] for r in results) / count,
+    }
+
+
+# --- 7. 렌더 캐시 ---
+
+# 글자 surface 캐시 크기. 주문 타이머는 0.1초마다 문자열이 바뀌므로 한 주문 수명(300개)보다 넉넉하게 잡습니다.
+TEXT_CACHE_SIZE = 512
+# True면 바뀐 영역만 다시 그려 display.update(rects)로 내보내고, False면 매 프레임 전체를 그리고 flip합니다.
+DIRTY_RECT_RENDERING = True
+# 한 프레임에 바뀐 넓이가 화면의 이 비율을 넘으면 부분 갱신 대신 전체를 다시 그립니다.
+FULL_REDRAW_RATIO = 0.5
+# 컵 위 토핑 글자: (재료 키, 글자, 컵 왼쪽에서의 x 오프셋)
+TOPPING_LABELS = (('WHIP', "휘핑", 5), ('CHIP', "초코", 30))
+
+class TextCache:
+    """(폰트, 문자열, 색)별로 렌더한 글자 surface를 재사용하는 LRU 캐시
+
+    폰트 래스터화가 프레임 비용의 대부분이므로, 같은 문자열은 값이 바뀔 때만 다시 렌더합니다.
+    """
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+text_cache = TextCache()
+
+
+def render_static_scene():
+    """매 프레임 똑같은 배경(흰 바탕, 카운터, 재료 줄과 이름)을 한 장의 surface로 한 번만 그립니다.
+
+    (배경 surface, 재료별 (키, 충돌 영역) 목록)을 반환합니다.
+    """
+    background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+    background.fill(WHITE)
+    draw_table(background)
+    ingredient_rects = list(draw_ingredients(background))
+    return background, ingredient_rects
+
+
+# --- 8. 드로잉 함수 ---
+
+def draw_table(surface=None):
+    surface = surface or screen
     table_rect = pygame.Rect(0, SCREEN_HEIGHT // 2, SCREEN_WIDTH, 150)
-    pygame.draw.rect(screen, BROWN, table_rect)
-    pygame.draw.line(screen, BLACK, (0, SCREEN_HEIGHT // 2), (SCREEN_WIDTH, SCREEN_HEIGHT // 2), 3)
+    pygame.draw.rect(surface, BROWN, table_rect)
+    pygame.draw.line(surface, BLACK, (0, SCREEN_HEIGHT // 2), (SCREEN_WIDTH, SCREEN_HEIGHT // 2), 3)
 
-def draw_ingredients():
+def draw_ingredients(surface=None):
+    surface = surface or screen
     for key, pos in INGREDIENT_POSITIONS.items():
         rect = pygame.Rect(pos[0] - INGREDIENT_SIZE // 2, pos[1] - INGREDIENT_SIZE // 2, INGREDIENT_SIZE, INGREDIENT_SIZE)
         
         color, visual_text = INGREDIENT_VISUALS[key][:3], INGREDIENT_VISUALS[key][3]
         
-        pygame.draw.rect(screen, color, rect, 0, 5)
-        pygame.draw.rect(screen, BLACK, rect, 2, 5)
+        pygame.draw.rect(surface, color, rect, 0, 5)
+        pygame.draw.rect(surface, BLACK, rect, 2, 5)
         
         # 텍스트는 하나만 중앙에 표시
-        name_text = font_medium.render(visual_text, True, BLACK)
+        name_text = text_cache.render(font_medium, visual_text, BLACK)
         name_rect = name_text.get_rect(center=rect.center)
-        screen.blit(name_text, name_rect)
+        surface.blit(name_text, name_rect)
         
         yield key, rect
 
-def draw_orders():
-    for i, order in enumerate(orders):
-        x = 10 + i * 250
-        y = 10
-        order_rect = pygame.Rect(x, y, 240, 80)
-        color = order.get_time_color()
-        
-        pygame.draw.rect(screen, color, order_rect, 0, 5)
-        pygame.draw.rect(screen, BLACK, order_rect, 2, 5)
-        
-        name_text = font_medium.render(order.get_display_text(), True, BLACK)
-        time_text = font_medium.render(f"{order.get_remaining_time():.1f}s", True, BLACK)
-        
-        screen.blit(name_text, (x + 5, y + 5))
-        screen.blit(time_text, (x + 5, y + 40))
-        
-        yield i, order_rect
+def order_rect(index):
+    """index번째 주문 카드가 차지하는 화면 영역"""
+    return pygame.Rect(10 + index * 250, 10, 240, 80)
+
+def order_time_label(remaining):
+    return f"{remaining:.1f}s"
+
+def draw_order_card(index, order, remaining):
+    card_rect = order_rect(index)
+    x, y = card_rect.topleft
+    
+    pygame.draw.rect(screen, order.get_time_color(remaining), card_rect, 0, 5)
+    pygame.draw.rect(screen, BLACK, card_rect, 2, 5)
+    
+    # 타이머 문자열은 표시되는 0.1초 단위가 바뀔 때만 새로 렌더됩니다.
+    name_text = text_cache.render(font_medium, order.get_display_text(), BLACK)
+    time_text = text_cache.render(font_medium, order_time_label(remaining), BLACK)
+    
+    screen.blit(name_text, (x + 5, y + 5))
+    screen.blit(time_text, (x + 5, y + 40))
 
-def draw_player_cup():
-    cup_rect = player_cup.rect
-    contents = player_cup.contents
+def draw_player_cup(cup):
+    cup_rect = cup.rect
     
     cup_inner_height = cup_rect.height - 6
     cup_inner_width = cup_rect.width - 6
@@ -319,7 +582,7 @@ def draw_player_cup():
     pygame.draw.rect(screen, (240, 240, 255), (cup_inner_x, cup_inner_y, cup_inner_width, cup_inner_height), 0, 5)
     
     # 2. 층 그리기
-    layer_config = player_cup.get_layer_config()
+    layer_config = cup.get_layer_config()
     current_y = cup_inner_y + cup_inner_height
     
     for layer in reversed(layer_config): 
@@ -333,32 +596,165 @@ def draw_player_cup():
     pygame.draw.rect(screen, BLACK, cup_rect, 3, 5)
     
     # 4층: 토핑 시각화 (컵 위에 텍스트)
-    if contents.get('WHIP', 0) > 0:
-        whip_text = font_small.render("휘핑", True, BLACK)
-        screen.blit(whip_text, (cup_rect.x + 5, cup_rect.y - 20))
-    if contents.get('CHIP', 0) > 0:
-        chip_text = font_small.render("초코", True, BLACK)
-        screen.blit(chip_text, (cup_rect.x + 30, cup_rect.y - 20))
-        
-    # 현재 실패 횟수 표시
-    fail_text = font_medium.render(f"실패: {failed_orders_count}/{MAX_FAILED_ORDERS}", True, RED)
-    screen.blit(fail_text, (SCREEN_WIDTH - 200, 10))
+    for topping_text, topping_rect in topping_labels(cup):
+        screen.blit(topping_text, topping_rect)
+
+def topping_labels(cup):
+    """컵 위에 표시할 토핑 글자 (surface, 영역) 목록"""
+    cup_rect = cup.rect
+    labels = []
+    for key, label, offset_x in TOPPING_LABELS:
+        if cup.contents.get(key, 0) > 0:
+            text = text_cache.render(font_small, label, BLACK)
+            labels.append((text, text.get_rect(topleft=(cup_rect.x + offset_x, cup_rect.y - 20))))
+    return labels
+
+def player_cup_bounds(cup):
+    """컵과 그 위 토핑 글자를 모두 덮는 화면 영역"""
+    bounds = cup.rect.copy()
+    for _, topping_rect in topping_labels(cup):
+        bounds.union_ip(topping_rect)
+    return bounds
+
+def hud_texts(sim):
+    """(surface, 영역) 목록: 현재 실패 횟수와 점수"""
+    fail_text = text_cache.render(font_medium, f"실패: {sim.failed_orders_count}/{sim.max_failed}", RED)
+    score_text = text_cache.render(font_medium, f"점수: {sim.score}", BLACK)
+    return [(fail_text, fail_text.get_rect(topleft=(SCREEN_WIDTH - 200, 10))),
+            (score_text, score_text.get_rect(topleft=(SCREEN_WIDTH - 200, 40)))]
+
+def draw_hud(sim):
+    for text, rect in hud_texts(sim):
+        screen.blit(text, rect)
+
+def hud_bounds(sim):
+    texts = hud_texts(sim)
+    return texts[0][1].unionall([rect for _, rect in texts[1:]])
+
+def game_over_texts(sim):
+    game_over_text = text_cache.render(font_large, "GAME OVER", RED)
+    score_final_text = text_cache.render(font_large, f"최종 점수: {sim.score}", BLACK)
     
-    # 점수 표시
-    score_text = font_medium.render(f"점수: {score}", True, BLACK)
-    screen.blit(score_text, (SCREEN_WIDTH - 200, 40))
-
-
-# --- 7. 메인 게임 루프 ---
-
-def run_game():
-    global orders, last_customer_time, customer_interval, failed_orders_count, score, game_over
+    rect_go = game_over_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50))
+    rect_score = score_final_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50))
+    return [(game_over_text, rect_go), (score_final_text, rect_score)]
+
+def draw_game_over(sim):
+    for text, rect in game_over_texts(sim):
+        screen.blit(text, rect)
+
+
+# --- 9. 부분 갱신 렌더러 ---
+
+def merge_rects(rects):
+    """겹치는 영역을 합쳐서, 같은 픽셀을 두 번 그리거나 내보내지 않게 합니다."""
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        # 합친 영역이 다른 영역과 새로 겹칠 수 있으므로 더 이상 겹치는 것이 없을 때까지 반복합니다.
+        while True:
+            index = rect.collidelist(merged)
+            if index < 0:
+                break
+            rect.union_ip(merged.pop(index))
+        merged.append(rect)
+    return merged
+
+class DirtyRenderer:
+    """바뀐 영역(주문 카드, 컵, HUD)만 다시 그리고 pygame.display.update(rects)로 그 영역만 내보내는 렌더러
+
+    요소마다 (상태 서명, 화면 영역)을 기억해 두고, 둘 중 하나라도 바뀐 요소의 이전/현재 영역만 배경으로 지운 뒤
+    그 영역에 걸치는 요소를 z 순서대로 다시 그립니다. 아무것도 바뀌지 않은 프레임은 그리지도 내보내지도 않습니다.
+    레이아웃이 바뀌었거나(invalidate) 바뀐 넓이가 FULL_REDRAW_RATIO를 넘으면 전체를 그리고 flip합니다.
+    """
+
+    def __init__(self, surface, background):
+        self.surface = surface
+        self.background = background
+        self.needs_full = True
+        self.previous = {}
+        self.full_frames = 0
+        self.partial_frames = 0
+        self.idle_frames = 0
+
+    def invalidate(self):
+        """다음 프레임을 전체 다시 그리기로 만듭니다. (게임 오버, 창 노출 등 레이아웃이 바뀔 때)"""
+        self.needs_full = True
+
+    def render(self, elements):
+        """elements: z 순서대로 (키, 상태 서명, 화면 영역, 그리기 함수) 목록"""
+        current = {key: (signature, rect) for key, signature, rect, _ in elements}
+        screen_rect = self.surface.get_rect()
+        dirty = []
+        if not self.needs_full:
+            for key, state in self.previous.items():
+                if current.get(key) != state:
+                    dirty.append(state[1])
+            for key, state in current.items():
+                if self.previous.get(key) != state:
+                    dirty.append(state[1])
+            dirty = [rect for rect in merge_rects(r.clip(screen_rect) for r in dirty) if rect.w and rect.h]
+            if sum(rect.w * rect.h for rect in dirty) > FULL_REDRAW_RATIO * screen_rect.w * screen_rect.h:
+                self.needs_full = True
+        self.previous = current
+
+        if self.needs_full:
+            self.needs_full = False
+            self.surface.blit(self.background, (0, 0))
+            for *_, draw in elements:
+                draw()
+            pygame.display.flip()
+            self.full_frames += 1
+            return
+
+        if not dirty:
+            self.idle_frames += 1
+            return
+
+        for area in dirty:
+            self.surface.set_clip(area)
+            self.surface.blit(self.background, area, area)
+            for _, _, rect, draw in elements:
+                if rect.colliderect(area):
+                    draw()
+        self.surface.set_clip(None)
+        pygame.display.update(dirty)
+        self.partial_frames += 1
+
+def frame_elements(sim):
+    """이번 프레임에 그릴 요소 목록 (DirtyRenderer.render 입력)"""
+    elements = []
+    for i, order in enumerate(sim.orders):
+        remaining = sim.remaining_time(order)
+        # 화면에 보이는 값(문구, 0.1초 단위 시간, 색)이 바뀔 때만 다시 그립니다.
+        signature = (order.get_display_text(), order_time_label(remaining), order.get_time_color(remaining))
+        elements.append((('order', id(order)), signature, order_rect(i),
+                         lambda i=i, order=order, remaining=remaining: draw_order_card(i, order, remaining)))
+    cup = sim.cup
+    cup_signature = (cup.rect.topleft, cup.signature)
+    elements.append(('cup', cup_signature, player_cup_bounds(cup), lambda: draw_player_cup(cup)))
+    elements.append(('hud', (sim.failed_orders_count, sim.score), hud_bounds(sim), lambda: draw_hud(sim)))
+    if sim.game_over:
+        texts = game_over_texts(sim)
+        bounds = texts[0][1].unionall([rect for _, rect in texts[1:]])
+        elements.append(('game_over', sim.score, bounds, lambda: draw_game_over(sim)))
+    return elements
+
+
+# --- 10. 메인 게임 루프 ---
+
+def run_game(sim=None):
+    """창을 열고 게임을 실행합니다. sim을 넘기면 그 시뮬레이션(시드, 난이도 설정)으로 진행합니다."""
+    init_display()
+    sim = sim or CafeSimulation()
+    player_cup = sim.cup
     
-    current_ingredient_rects = list(draw_ingredients())
+    # 카운터와 재료 줄은 바뀌지 않으므로 한 번 그려 둔 배경을 매 프레임 복사만 합니다.
+    background, current_ingredient_rects = render_static_scene()
+    renderer = DirtyRenderer(screen, background)
 
     running = True
     while running:
-        current_time = time.time()
         mouse_pos = pygame.mouse.get_pos()
         
         # --- 이벤트 처리 ---
@@ -366,7 +762,11 @@ def run_game():
             if event.type == pygame.QUIT:
                 running = False
             
-            elif not game_over:
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # 창이 다시 보이면 화면 내용이 지워졌을 수 있으므로 전체를 다시 그립니다.
+                renderer.invalidate()
+            
+            elif not sim.game_over:
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if player_cup.rect.collidepoint(mouse_pos):
                         player_cup.is_dragging = True
@@ -394,69 +794,60 @@ def run_game():
                         
                         # C. 주문 목록에 드롭: 완료 시도
                         if not ingredient_added:
-                            for i, order_rect in draw_orders():
-                                if order_rect.collidepoint(event.pos):
-                                    order = orders[i]
-                                    if player_cup.check_match(order):
-                                        # 성공!
-                                        score += int(order.time_limit * 10 / max(1, order.get_remaining_time()))
-                                        orders.pop(i)
-                                        player_cup.reset() 
-                                        break
-                                    else:
+                            for i in range(len(sim.orders)):
+                                if order_rect(i).collidepoint(event.pos):
+                                    if not sim.serve(i):
                                         # 실패! 
                                         player_cup.rect.topleft = player_cup.original_pos
                                         print("❌ 잘못된 메뉴입니다!")
-                                        break
+                                    break
                         
         # --- 업데이트 로직 ---
-        if not game_over:
+        if not sim.game_over:
             
             if player_cup.is_dragging:
                 player_cup.rect.x = mouse_pos[0] + player_cup.offset_x
                 player_cup.rect.y = mouse_pos[1] + player_cup.offset_y
                 
-            if current_time - last_customer_time > customer_interval:
-                menu_text, required_steps = generate_llm_order()
-                orders.append(Order(menu_text, required_steps))
-                last_customer_time = current_time
-                customer_interval = max(5, customer_interval * 0.95) 
-
-            orders_to_remove = []
-            for i, order in enumerate(orders):
-                if order.get_remaining_time() <= 0:
-                    orders_to_remove.append(i)
-                    failed_orders_count += 1
-            
-            for index in sorted(orders_to_remove, reverse=True):
-                orders.pop(index)
-
-            if failed_orders_count >= MAX_FAILED_ORDERS:
-                game_over = True
+            sim.advance()
+            if sim.game_over:
+                renderer.invalidate()
 
         # --- 드로잉 ---
-        screen.fill(WHITE)
-
-        draw_table()
-        current_ingredient_rects = list(draw_ingredients())
-        list(draw_orders())
-        draw_player_cup()
-
-        if game_over:
-            game_over_text = font_large.render("GAME OVER", True, RED)
-            score_final_text = font_large.render(f"최종 점수: {score}", True, BLACK)
-            
-            rect_go = game_over_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50))
-            rect_score = score_final_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50))
-            
-            screen.blit(game_over_text, rect_go)
-            screen.blit(score_final_text, rect_score)
+        if not DIRTY_RECT_RENDERING:
+            renderer.invalidate()
+        renderer.render(frame_elements(sim))
 
-        pygame.display.flip()
         clock.tick(FPS)
 
     pygame.quit()
     sys.exit()
 
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="카페 타이푼: 창 모드로 플레이하거나 헤드리스로 난이도를 시뮬레이션합니다.")
+    parser.add_argument("--headless", action="store_true", help="창 없이 봇으로 여러 판을 빠르게 돌리고 통계를 출력")
+    parser.add_argument("--shifts", type=int, default=1000, help="헤드리스로 돌릴 판 수")
+    parser.add_argument("--seed", type=int, default=None, help="난수 시드 (헤드리스는 seed ~ seed + shifts - 1, 기본 0)")
+    parser.add_argument("--interval", type=float, default=INITIAL_INTERVAL, help="첫 손님 도착 간격 (초)")
+    parser.add_argument("--time-limit", type=float, default=INITIAL_TIME_LIMIT, help="주문 제한 시간 (초)")
+    parser.add_argument("--decay", type=float, default=SPAWN_DECAY, help="손님마다 도착 간격에 곱하는 감소율")
+    parser.add_argument("--serve-time", type=float, default=BOT_SERVE_TIME, help="봇이 한 잔을 만드는 평균 시간 (초)")
+    args = parser.parse_args(argv)
+
+    params = {"initial_interval": args.interval, "time_limit": args.time_limit, "spawn_decay": args.decay}
+    if not args.headless:
+        run_game(CafeSimulation(seed=args.seed, **params))
+        return
+
+    started = time.perf_counter()
+    summary = summarize_shifts(run_headless(args.shifts, args.seed or 0, args.serve_time, **params))
+    elapsed = time.perf_counter() - started
+    print(f"{summary['shifts']}판 ({elapsed:.2f}초, 초당 {summary['shifts'] / max(elapsed, 1e-9):.0f}판)")
+    print(f"평균 버틴 시간 {summary['mean_seconds']:.1f}초 | 평균 점수 {summary['mean_score']:.1f} | "
+          f"평균 서빙 {summary['mean_served']:.1f}잔 | 게임 오버 비율 {summary['game_over_rate']:.1%}")
+
 if __name__ == '__main__':
-    run_game()
\ No newline at end of file
+    main()
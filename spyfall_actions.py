@@ -0,0 +1,189 @@
+import os
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, FrozenSet
+
+import numpy as np
+
+from spyfall_embeddings import LocationIndex
+from spyfall_history import Turn
+
+# --- 1. 설정 ---
+
+# 이 턴 수(질문+답변)가 지나기 전에는 액션을 고려하지 않습니다.
+ACTION_MIN_TURNS = 4
+# 스파이 장소 추측: 1위 장소 확률이 이 값 이상일 때만 추측합니다.
+# (스텁 봇전 기준 단서가 없으면 1/장소 수 ≈ 0.07, 장소 이름이 두어 번 나오면 0.5를 넘깁니다.)
+GUESS_MIN_PROB = float(os.environ.get("SPYFALL_GUESS_MIN_PROB", "0.5"))
+# 장소 단서 점수 1점이 로그 확률에 주는 무게 (2-gram 점수 / 임베딩 코사인 유사도)
+BELIEF_SHARPNESS = 1.0
+EMBEDDING_SHARPNESS = 15.0
+# 임베딩 유사도는 (장소 평균 대비) 이만큼 넘는 부분만 단서로 칩니다. 일반적인 답변의 잡음이 쌓이지 않게 합니다.
+EMBEDDING_MARGIN = 0.12
+# 비스파이 지목: 1위 용의자의 의심 점수와 2위와의 차이 기준
+# 의심 점수는 2-gram 단서 점수 단위라서 다른 장소 이름을 한 번 언급하면 2~3점, 역할을 흘린 비스파이는 음수가 됩니다.
+ACCUSE_MIN_SCORE = float(os.environ.get("SPYFALL_ACCUSE_MIN_SCORE", "2.0"))
+ACCUSE_MIN_MARGIN = float(os.environ.get("SPYFALL_ACCUSE_MIN_MARGIN", "1.0"))
+
+
+@dataclass(frozen=True)
+class ActionDecision:
+    """결정 단계의 결과: handle_game_action(action_type, action_data, player)에 그대로 넘길 값"""
+    action_type: str  # "accuse_spy" 또는 "guess_location"
+    action_data: str
+    confidence: float
+
+
+def _bigrams(text: str) -> FrozenSet[str]:
+    """공백을 뺀 글자 2-gram 집합 (한국어는 형태소 분석 없이도 장소/역할 단어 겹침을 잡기에 충분)"""
+    compact = "".join(text.split())
+    return frozenset(compact[i:i + 2] for i in range(len(compact) - 1))
+
+
+# --- 2. 장소 단서 모델 ---
+
+class LocationModel:
+    """장소 도감(장소 이름 + 역할)으로 만든 2-gram x 장소 가중치 행렬
+
+    여러 장소에 함께 나오는 2-gram은 그 수만큼 나눠 약하게 칩니다.
+    텍스트 하나의 장소별 단서 점수는 행 몇 개를 더하는 것으로 끝나므로 대화 길이와 무관합니다.
+    """
+
+    def __init__(self, locations: Dict[str, List[str]]):
+        self.locations = list(locations)
+        self.index = {location: i for i, location in enumerate(self.locations)}
+        profiles = [_bigrams(" ".join([location, *roles])) for location, roles in locations.items()]
+
+        vocab = sorted(set().union(*profiles))
+        self.vocab = {gram: i for i, gram in enumerate(vocab)}
+        weights = np.zeros((len(vocab), len(self.locations)), dtype=np.float32)
+        for j, profile in enumerate(profiles):
+            weights[[self.vocab[g] for g in profile], j] = 1.0
+        weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1.0)
+        self.weights = weights
+
+    def evidence(self, text: str) -> np.ndarray:
+        """text의 장소별 단서 점수 (길이 = 장소 수)"""
+        ids = [self.vocab[g] for g in _bigrams(text) if g in self.vocab]
+        if not ids:
+            return np.zeros(len(self.locations), dtype=np.float32)
+        return self.weights[ids].sum(axis=0)
+
+
+# --- 3. 플레이어별 믿음 추적 ---
+
+class BeliefTracker:
+    """플레이어마다 장소 확률 벡터와 다른 플레이어 의심 점수를 턴 단위로 갱신하는 클래스
+
+    발언자별 누적 단서(players x 장소)와 전체 합만 들고 있으므로 새 턴 하나는 O(장소 수)로 반영되고,
+    누구의 관점이든 "전체 - 자기 발언"으로 바로 계산됩니다. 지난 대화를 다시 읽지 않습니다.
+    embedding_index가 있으면 턴마다 한 번 임베딩해 장소 유사도도 같은 방식으로 누적하고, 장소 확률은 이것으로 계산합니다.
+    """
+
+    def __init__(self, model: LocationModel, player_names: List[str],
+                 embedding_index: Optional[LocationIndex] = None):
+        self.model = model
+        self.embedding_index = embedding_index
+        self.player_index = {name: i for i, name in enumerate(player_names)}
+        self.player_names = list(player_names)
+        shape = (len(player_names), len(model.locations))
+        self.spoken = np.zeros(shape, dtype=np.float32)
+        self.total = np.zeros(shape[1], dtype=np.float32)
+        self.embedded = np.zeros(shape, dtype=np.float32)
+        self.embedded_total = np.zeros(shape[1], dtype=np.float32)
+
+    def reset(self) -> None:
+        for array in (self.spoken, self.total, self.embedded, self.embedded_total):
+            array.fill(0.0)
+
+    def observe(self, turn: Turn) -> None:
+        """질문/답변 한 턴을 반영합니다. (액션은 단서가 아니므로 무시)"""
+        if turn.kind == "action" or turn.speaker not in self.player_index:
+            return
+        evidence = self.model.evidence(turn.text)
+        speaker = self.player_index[turn.speaker]
+        self.spoken[speaker] += evidence
+        self.total += evidence
+        if self.embedding_index is not None:
+            similarity = self.embedding_index.scores(self.embedding_index.embed(turn.text))
+            similarity = np.maximum(similarity - similarity.mean() - EMBEDDING_MARGIN, 0.0)
+            self.embedded[speaker] += similarity
+            self.embedded_total += similarity
+
+    def location_probs(self, observer: str) -> np.ndarray:
+        """observer가 자기 말을 뺀 대화로 추정한 장소 확률"""
+        i = self.player_index[observer]
+        if self.embedding_index is not None:
+            logits = EMBEDDING_SHARPNESS * (self.embedded_total - self.embedded[i])
+        else:
+            logits = BELIEF_SHARPNESS * (self.total - self.spoken[i])
+        probs = np.exp(logits - logits.max())
+        return probs / probs.sum()
+
+    def top_locations(self, observer: str, k: int) -> List[str]:
+        """observer가 보기에 가장 유력한 장소 k곳. 아직 단서가 없으면 빈 목록"""
+        probs = self.location_probs(observer)
+        if probs.max() - probs.min() < 1e-6:
+            return []
+        return [self.model.locations[i] for i in np.argsort(probs)[::-1][:k]]
+
+    def suspicion(self, chosen_location: str) -> np.ndarray:
+        """장소를 아는 비스파이 관점의 플레이어별 의심 점수
+
+        다른 장소를 가리키는 단서가 실제 장소 단서보다 많을수록 높습니다.
+        """
+        true_index = self.model.index[chosen_location]
+        on_location = self.spoken[:, true_index]
+        off_location = np.delete(self.spoken, true_index, axis=1).max(axis=1)
+        return off_location - on_location
+
+
+# --- 4. 액션 결정기 ---
+
+class ActionDecider:
+    """BeliefTracker의 점수만 보고 AI의 게임 종료 액션(스파이 지목/장소 추측)을 정하는 가벼운 결정기
+
+    LLM을 다시 부르지 않습니다. 확신이 부족하면 None을 돌려주고 평소처럼 질문을 이어 갑니다.
+    """
+
+    def __init__(self, locations: Dict[str, List[str]], min_turns: int = ACTION_MIN_TURNS,
+                 embedding_index: Optional[LocationIndex] = None, guess_min_prob: float = GUESS_MIN_PROB,
+                 accuse_min_score: float = ACCUSE_MIN_SCORE, accuse_min_margin: float = ACCUSE_MIN_MARGIN):
+        self.min_turns = min_turns
+        self.guess_min_prob = guess_min_prob
+        self.accuse_min_score = accuse_min_score
+        self.accuse_min_margin = accuse_min_margin
+        self.model = LocationModel(locations)
+        self.embedding_index = embedding_index
+        if embedding_index is not None and embedding_index.locations != self.model.locations:
+            raise ValueError("임베딩 인덱스의 장소 목록이 도감과 다릅니다.")
+
+    def new_tracker(self, player_names: List[str]) -> BeliefTracker:
+        return BeliefTracker(self.model, player_names, self.embedding_index)
+
+    def decide(self, tracker: BeliefTracker, player: Dict[str, Any], chosen_location: Optional[str],
+               turn_count: int) -> Optional[ActionDecision]:
+        """player 차례에 할 액션. 확신이 없으면 None"""
+        if turn_count < self.min_turns:
+            return None
+        if player["is_spy"]:
+            return self._decide_guess(tracker, player["name"])
+        return self._decide_accuse(tracker, player["name"], chosen_location)
+
+    def _decide_guess(self, tracker: BeliefTracker, name: str) -> Optional[ActionDecision]:
+        probs = tracker.location_probs(name)
+        best = int(probs.argmax())
+        if probs[best] < self.guess_min_prob:
+            return None
+        return ActionDecision("guess_location", self.model.locations[best], float(probs[best]))
+
+    def _decide_accuse(self, tracker: BeliefTracker, name: str,
+                       chosen_location: Optional[str]) -> Optional[ActionDecision]:
+        if chosen_location not in self.model.index:
+            return None
+        scores = tracker.suspicion(chosen_location)
+        scores[tracker.player_index[name]] = -np.inf
+        order = np.argsort(scores)[::-1]
+        top, second = float(scores[order[0]]), float(scores[order[1]]) if len(order) > 1 else 0.0
+        if top < self.accuse_min_score or top - second < self.accuse_min_margin:
+            return None
+        return ActionDecision("accuse_spy", tracker.player_names[order[0]], top / (top + max(second, 0.0) + 1.0))
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import sys
+import time
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+import numpy as np
+
+from spyfall_engine import SpyfallEngine, BOT_PLAYER_NAMES, DEFAULT_MAX_TURNS
+from spyfall_history import count_tokens, count_message_tokens
+from spyfall_llm import LLMBackend, LLMResult, run_sync
+
+# 기본 시드 묶음: 0 ~ 19번 게임
+DEFAULT_BENCH_GAMES = 20
+# 프롬프트 크기 증가 곡선을 보여 줄 LLM 호출 순번
+GROWTH_POINTS = (1, 2, 4, 8, 16, 32, 48)
+# 기준 결과보다 이 비율 이상 나빠지면 회귀로 봅니다.
+DEFAULT_TOLERANCE = 0.10
+# 회귀 검사 대상 (높을수록 나쁨). 토큰 지표는 같은 시드/백엔드면 결정적이라 좁은 기준으로 봅니다.
+REGRESSION_METRICS = ("prompt_tokens_per_turn", "completion_tokens_per_turn", "max_prompt_tokens")
+# 시간 지표는 같은 코드로 연달아 돌려도 10~20%씩 흔들리므로 (스텁 게임 한 판이 십여 ms)
+# 따로 넓은 비율과 절대 잡음 하한(ms)을 둘 다 넘을 때만 회귀로 봅니다.
+TIMING_METRICS = ("step_latency_p95_ms", "wall_per_game_ms")
+DEFAULT_TIMING_TOLERANCE = 0.50
+TIMING_NOISE_FLOOR_MS = 5.0
+
+
+# --- 1. 측정용 백엔드 ---
+
+class MeteredBackend(LLMBackend):
+    """inner 백엔드 호출마다 지연 시간과 프롬프트/응답 토큰 수를 기록하는 래퍼
+
+    토큰 수는 백엔드 보고값 대신 spyfall_history.count_tokens로 직접 세어, 백엔드가 달라도 같은 기준으로 비교합니다.
+    """
+
+    def __init__(self, inner: LLMBackend):
+        super().__init__(inner.model)
+        self.inner = inner
+        self.name = inner.name
+        self.calls: List[Dict[str, float]] = []
+
+    def _record(self, messages, content: str, started: float) -> None:
+        self.calls.append({
+            "latency": time.perf_counter() - started,
+            "prompt_tokens": count_message_tokens(messages),
+            "completion_tokens": count_tokens(content) if content else 0,
+        })
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        started = time.perf_counter()
+        result = await self.inner.chat(messages, temperature=temperature, max_tokens=max_tokens,
+                                       stop=stop, tools=tools, tool_choice=tool_choice)
+        self._record(messages, result.content, started)
+        return result
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        parts = []
+        async with aclosing(self.inner.stream_chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop, info=info)) as stream:
+            async for piece in stream:
+                parts.append(piece)
+                yield piece
+        self._record(messages, "".join(parts), started)
+
+
+# --- 2. 벤치마크 ---
+
+async def bench_game(backend: LLMBackend, seed: int, max_turns: int = DEFAULT_MAX_TURNS,
+                     pack: Optional[str] = None) -> Dict[str, Any]:
+    """seed 게임 한 판을 진행하며 단계별 지연 시간, LLM 호출 기록, 대화 기록 해시를 잽니다."""
+    metered = MeteredBackend(backend)
+    engine = SpyfallEngine(metered, player_names=BOT_PLAYER_NAMES, human_name=None, pack=pack, seed=seed)
+    engine.start()
+
+    step_latencies = []
+    started = time.perf_counter()
+    while engine.game_phase != "finished" and engine.turn_count < max_turns:
+        step_started = time.perf_counter()
+        if not await engine.astep():
+            raise RuntimeError(f"게임 진행 불가 (seed={seed}, {engine.pending_step()}): {engine.last_error}")
+        step_latencies.append(time.perf_counter() - step_started)
+    # 최대 턴에 닿았으면 엔진 규칙대로 마무리합니다.
+    summary = await engine.arun_to_completion(max_turns=max_turns)
+    wall = time.perf_counter() - started
+
+    transcript = json.dumps([[t.kind, t.speaker, t.target, t.text] for t in engine.turns], ensure_ascii=False)
+    return {
+        "seed": seed,
+        "summary": summary,
+        "wall": wall,
+        "step_latencies": step_latencies,
+        "calls": metered.calls,
+        "transcript_sha": hashlib.sha256(transcript.encode("utf-8")).hexdigest()[:16],
+    }
+
+def _percentile_ms(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q) * 1000) if values else 0.0
+
+def summarize_bench(games: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """게임별 측정값을 한 보고서로 묶습니다."""
+    steps = [latency for g in games for latency in g["step_latencies"]]
+    turns = sum(g["summary"]["turns"] for g in games) or 1
+    calls = [c for g in games for c in g["calls"]]
+
+    # 프롬프트 크기 증가 곡선: 게임 안에서 k번째 LLM 호출의 평균 프롬프트 토큰 수
+    growth = {}
+    for k in GROWTH_POINTS:
+        sizes = [g["calls"][k - 1]["prompt_tokens"] for g in games if len(g["calls"]) >= k]
+        if sizes:
+            growth[str(k)] = float(np.mean(sizes))
+
+    return {
+        "games": len(games),
+        "turns": turns,
+        "llm_calls": len(calls),
+        "step_latency_p50_ms": _percentile_ms(steps, 50),
+        "step_latency_p95_ms": _percentile_ms(steps, 95),
+        "step_latency_p99_ms": _percentile_ms(steps, 99),
+        "llm_latency_p50_ms": _percentile_ms([c["latency"] for c in calls], 50),
+        "llm_latency_p95_ms": _percentile_ms([c["latency"] for c in calls], 95),
+        "prompt_tokens_per_turn": sum(c["prompt_tokens"] for c in calls) / turns,
+        "completion_tokens_per_turn": sum(c["completion_tokens"] for c in calls) / turns,
+        "max_prompt_tokens": max((c["prompt_tokens"] for c in calls), default=0),
+        "prompt_growth": growth,
+        "wall_per_game_ms": float(np.mean([g["wall"] for g in games]) * 1000) if games else 0.0,
+        "wall_per_game_p95_ms": _percentile_ms([g["wall"] for g in games], 95),
+        "transcripts": {str(g["seed"]): g["transcript_sha"] for g in games},
+    }
+
+async def arun_bench(backend: LLMBackend, seeds: List[int], max_turns: int = DEFAULT_MAX_TURNS,
+                     pack: Optional[str] = None) -> Dict[str, Any]:
+    """시드 묶음을 한 판씩 차례로 재생합니다. (동시 실행하지 않아 지연 시간 측정이 서로 섞이지 않습니다)"""
+    games = []
+    for seed in seeds:
+        games.append(await bench_game(backend, seed, max_turns, pack))
+    return summarize_bench(games)
+
+def run_bench(backend: LLMBackend, seeds: List[int], max_turns: int = DEFAULT_MAX_TURNS,
+              pack: Optional[str] = None) -> Dict[str, Any]:
+    return run_sync(arun_bench(backend, seeds, max_turns, pack))
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        tolerance: float = DEFAULT_TOLERANCE, timing_tolerance: float = DEFAULT_TIMING_TOLERANCE,
+                        noise_floor_ms: float = TIMING_NOISE_FLOOR_MS) -> List[str]:
+    """기준 결과보다 나빠진 지표 목록 (문구)
+
+    토큰 지표는 tolerance 비율, 시간 지표는 timing_tolerance 비율과 noise_floor_ms를 모두 넘어야 회귀입니다.
+    """
+    checks = [(metric, tolerance, 1e-9) for metric in REGRESSION_METRICS]
+    checks += [(metric, timing_tolerance, noise_floor_ms) for metric in TIMING_METRICS]
+    regressions = []
+    for metric, ratio, floor in checks:
+        old, new = baseline.get(metric), report.get(metric)
+        if old is None or new is None:
+            continue
+        if new > old * (1 + ratio) and new - old > floor:
+            regressions.append(f"{metric}: {old:.2f} -> {new:.2f} (+{(new / old - 1) if old else float('inf'):.1%})")
+    return regressions
+
+def format_report(report: Dict[str, Any]) -> str:
+    growth = " ".join(f"#{k}:{v:.0f}" for k, v in report["prompt_growth"].items())
+    return "\n".join([
+        f"게임 수: {report['games']} | 턴: {report['turns']} | LLM 호출: {report['llm_calls']}",
+        f"단계 지연(ms) p50 {report['step_latency_p50_ms']:.2f} / p95 {report['step_latency_p95_ms']:.2f} / "
+        f"p99 {report['step_latency_p99_ms']:.2f} | LLM 지연(ms) p50 {report['llm_latency_p50_ms']:.2f} / "
+        f"p95 {report['llm_latency_p95_ms']:.2f}",
+        f"턴당 토큰: 프롬프트 {report['prompt_tokens_per_turn']:.1f} / 응답 {report['completion_tokens_per_turn']:.1f} | "
+        f"최대 프롬프트 {report['max_prompt_tokens']}",
+        f"프롬프트 크기 증가 (k번째 호출: 평균 토큰): {growth}",
+        f"게임당 시간(ms): 평균 {report['wall_per_game_ms']:.1f} / p95 {report['wall_per_game_p95_ms']:.1f}",
+    ])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    from dotenv import load_dotenv
+    from spyfall_llm import create_backend, CACHE_MODES
+
+    parser = argparse.ArgumentParser(description="고정 시드 묶음을 재생하는 스파이폴 성능 회귀 벤치마크")
+    parser.add_argument("--games", type=int, default=DEFAULT_BENCH_GAMES, help="재생할 시드 수")
+    parser.add_argument("--seed-base", type=int, default=0, help="첫 시드 (seed-base ~ seed-base + games - 1)")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="게임당 최대 턴 수")
+    parser.add_argument("--pack", default=None, help="장소 팩 이름")
+    parser.add_argument("--backend", default="stub", help="LLM 백엔드 (기본 stub)")
+    parser.add_argument("--model", default=None, help="모델 이름")
+    parser.add_argument("--cache", default=None, help="녹화된 LLM 응답 캐시 경로 (--cache-mode replay와 함께)")
+    parser.add_argument("--cache-mode", default=None, choices=CACHE_MODES, help="캐시 모드")
+    parser.add_argument("--save", default=None, help="결과를 JSON으로 저장할 경로")
+    parser.add_argument("--baseline", default=None, help="비교할 기준 결과 JSON 경로")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="회귀로 볼 토큰 지표 악화 비율")
+    parser.add_argument("--timing-tolerance", type=float, default=DEFAULT_TIMING_TOLERANCE,
+                        help=f"회귀로 볼 시간 지표 악화 비율 (차이가 {TIMING_NOISE_FLOOR_MS:g}ms 이하면 무시)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    backend = create_backend(args.backend, args.model, cache_path=args.cache, cache_mode=args.cache_mode)
+    report = run_bench(backend, list(range(args.seed_base, args.seed_base + args.games)), args.max_turns, args.pack)
+    print(format_report(report))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = [seed for seed, sha in report["transcripts"].items() if baseline.get("transcripts", {}).get(seed) != sha]
+        if changed:
+            print(f"참고: 기준 결과와 대화 내용이 다른 시드 {len(changed)}개 ({', '.join(changed[:10])})")
+        regressions = compare_to_baseline(report, baseline, args.tolerance, args.timing_tolerance)
+        if regressions:
+            print("성능 회귀:\n" + "\n".join(f"- {r}" for r in regressions), file=sys.stderr)
+            sys.exit(1)
+        print("기준 결과 대비 회귀 없음")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import warnings
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# --- 1. 설정 ---
+
+# 임베더: "hashing"(기본, 결정적) 또는 sentence-transformers 모델 이름 (로컬 CPU)
+DEFAULT_EMBEDDER = os.environ.get("SPYFALL_EMBEDDER", "hashing")
+# 인덱스를 저장/메모리 매핑할 디렉터리 (지정하지 않으면 메모리에서만 만듭니다)
+DEFAULT_INDEX_DIR = os.environ.get("SPYFALL_EMBEDDING_INDEX")
+# 해싱 임베더 차원과 글자 n-gram 길이
+HASHING_DIM = 2048
+HASHING_NGRAMS = (2, 3)
+
+
+# --- 2. 임베더 ---
+
+@lru_cache(maxsize=65536)
+def _hash_gram(gram: str) -> int:
+    return int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEmbedder:
+    """글자 n-gram을 고정 차원에 해싱하는 결정적 임베더 (모델/네트워크 불필요)"""
+
+    def __init__(self, dim: int = HASHING_DIM, ngrams=HASHING_NGRAMS):
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+        self.name = f"hashing-{dim}-{'-'.join(map(str, self.ngrams))}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            compact = "".join(text.split())
+            for n in self.ngrams:
+                for i in range(len(compact) - n + 1):
+                    h = _hash_gram(compact[i:i + n])
+                    # 최하위 비트로 부호를 정해 충돌이 서로 상쇄되게 합니다.
+                    vectors[row, (h >> 1) % self.dim] += 1.0 if h & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
+
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers 모델을 CPU에서 돌리는 임베더"""
+
+    def __init__(self, model_name: str):
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+def create_embedder(kind: Optional[str] = None):
+    kind = kind or DEFAULT_EMBEDDER
+    if kind == "hashing":
+        return HashingEmbedder()
+    if SentenceTransformer is None:
+        # 출력(CLI 보고서, 벤치마크 결과)에 섞이지 않도록 print 대신 경고로 알립니다.
+        warnings.warn(f"sentence-transformers를 찾을 수 없습니다. '{kind}' 대신 해싱 임베더를 사용합니다.",
+                      RuntimeWarning, stacklevel=2)
+        return HashingEmbedder()
+    return SentenceTransformerEmbedder(kind)
+
+
+# --- 3. 장소/역할 임베딩 인덱스 ---
+
+class LocationIndex:
+    """장소마다 (장소 이름 + 역할) 임베딩, 역할마다 "역할 (장소)" 임베딩을 미리 계산해 둔 인덱스
+
+    답변 임베딩 하나의 장소별 점수는 행렬-벡터 곱 두 번으로 나옵니다.
+    index_dir를 주면 .npy로 저장해 두고, 다음 실행부터는 메모리 매핑으로 바로 읽습니다.
+    """
+
+    def __init__(self, locations: List[str], location_vectors: np.ndarray, role_vectors: np.ndarray,
+                 role_locations: np.ndarray, embedder):
+        self.locations = locations
+        self.location_vectors = location_vectors
+        self.role_vectors = role_vectors
+        self.role_locations = role_locations
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, catalogue: Dict[str, List[str]], embedder) -> "LocationIndex":
+        locations = list(catalogue)
+        location_vectors = embedder.embed([" ".join([location, *roles]) for location, roles in catalogue.items()])
+        role_texts, role_locations = [], []
+        for i, (location, roles) in enumerate(catalogue.items()):
+            for role in roles:
+                role_texts.append(f"{role} ({location})")
+                role_locations.append(i)
+        role_vectors = embedder.embed(role_texts)
+        return cls(locations, location_vectors, role_vectors, np.asarray(role_locations, dtype=np.int32), embedder)
+
+    @classmethod
+    def load_or_build(cls, catalogue: Dict[str, List[str]], embedder=None,
+                      index_dir: Optional[str] = DEFAULT_INDEX_DIR) -> "LocationIndex":
+        embedder = embedder or create_embedder()
+        if not index_dir:
+            return cls.build(catalogue, embedder)
+
+        # 도감이나 임베더가 바뀌면 파일 이름이 달라져 새로 만듭니다.
+        digest = hashlib.sha256(json.dumps([embedder.name, catalogue], ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        stem = os.path.join(index_dir, f"locations-{digest}")
+        paths = {part: f"{stem}.{part}.npy" for part in ("locations", "roles", "role_locations")}
+        if all(os.path.exists(p) for p in paths.values()):
+            return cls(list(catalogue),
+                       np.load(paths["locations"], mmap_mode="r"),
+                       np.load(paths["roles"], mmap_mode="r"),
+                       np.load(paths["role_locations"]),
+                       embedder)
+
+        index = cls.build(catalogue, embedder)
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(paths["locations"], index.location_vectors)
+        np.save(paths["roles"], index.role_vectors)
+        np.save(paths["role_locations"], index.role_locations)
+        return index
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embedder.embed([text])[0]
+
+    def scores(self, vector: np.ndarray) -> np.ndarray:
+        """임베딩 하나의 장소별 유사도: 장소 자체 유사도와 그 장소 역할 중 최고 유사도 중 큰 값"""
+        scores = self.location_vectors @ vector
+        role_best = np.full(len(self.locations), -1.0, dtype=np.float32)
+        np.maximum.at(role_best, self.role_locations, self.role_vectors @ vector)
+        return np.maximum(scores, role_best)
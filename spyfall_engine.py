@@ -0,0 +1,763 @@
+import asyncio
+import random
+import sys
+import time
+import uuid
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Sequence, Tuple
+
+from spyfall_actions import ActionDecider, ActionDecision
+from spyfall_embeddings import LocationIndex
+from spyfall_generation import TURN_POLICY
+from spyfall_history import (
+    Turn, TurnLog, HistoryWindow, count_tokens, DEFAULT_WINDOW_TURNS, DEFAULT_TOKEN_BUDGET
+)
+from spyfall_locations import LocationPack, DEFAULT_PACK, load_pack
+from spyfall_store import GameStore, STATE_COLUMNS, DEFAULT_GAME_DB
+from spyfall_telemetry import Telemetry, TELEMETRY, timed_chat, timed_stream
+from spyfall_llm import (
+    LLMBackend, CachedBackend, StreamInfo, CACHE_MODES, create_backend, backend_missing_config,
+    submit, run_sync, iterate_sync
+)
+
+# --- 1. 상수 및 데이터 정의 ---
+
+# 8명의 플레이어 (AI 7명 + 나 1명)
+PLAYER_NAMES = ["카더가든", "넉살", "오존", "목사님", "코드쿤스트", "키드밀리", "빠니보틀", "나"]
+
+# 사람 없이 AI 8명이 겨루는 봇전용 플레이어 목록
+BOT_PLAYER_NAMES = PLAYER_NAMES[:-1] + ["딘딘"]
+
+# 사람 플레이어 이름
+HUMAN_PLAYER_NAME = "나"
+
+# 봇전에서 아무도 액션을 하지 않을 때 게임을 끊는 최대 턴 수 (질문+답변 = 1턴)
+DEFAULT_MAX_TURNS = 24
+
+# 장소 및 역할 데이터는 spyfall_locations의 장소 팩(locations/*.txt)에서 필요할 때 읽습니다.
+# 예전 모듈 상수(SPYFALL_LOCATIONS_DATA 등)는 아래 __getattr__가 기본 팩에서 만들어 줍니다.
+_DEFAULT_PACK_ATTRS = {
+    "SPYFALL_LOCATIONS_DATA": lambda pack: pack.data,
+    "LOCATION_NAMES": lambda pack: list(pack.locations),
+    "LOCATION_LIST_FOR_DISPLAY": lambda pack: pack.display_list,
+}
+
+def __getattr__(name: str):
+    if name in _DEFAULT_PACK_ATTRS:
+        return _DEFAULT_PACK_ATTRS[name](load_pack(DEFAULT_PACK))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 스파이 시스템 프롬프트에는 도감 전체 대신 그 게임 팩의 장소 이름만 넣고, 역할은 유력 후보 몇 곳만 지시문에 붙입니다.
+SPY_CANDIDATE_COUNT = 3
+
+# 스파이 프롬프트에 들어가는 질문 예시
+QUESTION_EXAMPLES = [
+    "여기서 보통 몇 시에 퇴근(혹은 귀가)하니? 구체적인 시간을 말해 줘.",
+    "일 년 중 어느 계절에 사람들이 이곳을 가장 많이 방문하니?",
+    "이곳까지 대중교통을 이용해서 올 수 있어? 걸리는 시간은 얼마나 돼?",
+    "이곳의 시설 규모는 어느 정도야?",
+    "이곳에서 특별히 제공되는 서비스나 이벤트 같은 게 있니?",
+]
+
+# 질문/답변 지시문 몫으로 토큰 예산에서 미리 빼 두는 토큰 수
+TURN_PROMPT_RESERVE_TOKENS = 200
+
+# --- 2. LLM 로직 함수 ---
+
+def create_system_prompt(player_data: Dict[str, Any], chosen_location: str, pack_name: str = DEFAULT_PACK) -> str:
+    return _build_system_prompt(player_data["name"], player_data["role"], player_data["is_spy"], chosen_location,
+                                pack_name)
+
+@lru_cache(maxsize=256)
+def _build_system_prompt(name: str, role: str, is_spy: bool, chosen_location: str, pack_name: str) -> str:
+    """플레이어/장소/팩 조합마다 한 번만 만들어 두는 시스템 프롬프트"""
+
+    if is_spy:
+        # 스파이 프롬프트
+        return (
+            f"당신은 스파이입니다. 당신은 현재 장소 **{chosen_location}**를 모릅니다. "
+            f"**당신은 지금부터 모든 대화에서 친근한 반말(예: ~야, ~하니, ~했어)을 사용해야 합니다. 절대 존댓말을 쓰지 마세요.** "
+            f"당신의 목표는 다른 플레이어들의 대화를 듣고 장소를 추측하거나, 다른 플레이어에게 스파이로 의심받지 않고 게임을 끝내는 것입니다. "
+            f"참고를 위해 **후보 장소 목록**이 제공되고, 대화에서 유력해 보이는 장소와 역할은 매 차례 지시문에 알려 줍니다. 이를 활용하여 장소와 역할을 유추하고, **다른 장소로 오해하도록 유도하는 질문과 답변을 생성**하세요.\n\n"
+            f"**후보 장소 목록:** {load_pack(pack_name).location_list}\n\n"
+            f"당신의 이름은 {name}이며, 자신이 스파이임을 절대 들키지 않도록 "
+            f"최대한 모호하고 자연스럽게 연기해야 합니다. 당신의 답변은 **{TURN_POLICY.word_limit}단어 이내**로 간결해야 합니다.\n"
+            f"**질문 생성 지침:** 다른 플레이어들이 했던 질문이나 답변의 내용을 참고하여 **새롭고 구체적인 질문**을 만드세요. "
+            f"모든 질문은 **반드시 반말로 질문**해야 합니다."
+            f"질문 예시: {'; '.join(QUESTION_EXAMPLES)}"
+        )
+    else:
+        # 비스파이 프롬프트
+        return (
+            f"당신은 **{chosen_location}**의 **{role}**입니다. "
+            f"**당신은 지금부터 모든 대화에서 친근한 반말(예: ~야, ~하니, ~했어)을 사용해야 합니다. 절대 존댓말을 쓰지 마세요.** "
+            f"당신의 이름은 {name}이며, 스파이에게 장소가 들키지 않도록 "
+            f"**장소에 대한 정보를 절대적으로 절제해야 합니다.** "
+            f"**당신의 역할이나 행위가 장소를 직접적으로 유추하게 만들어서는 안 됩니다.** \n"
+            f"**답변 생성 지침:**\n"
+            f"1. **진실만 말하되, 최대한 모호하고 우회적으로 표현**하여 스파이가 장소를 알 수 없게 하세요.\n"
+            f"2. 답변은 **{TURN_POLICY.word_limit}단어 이내**로 간결해야 하며, **반드시 반말로 답변**해야 합니다."
+        )
+
+def candidate_hint(candidates: Optional[Dict[str, Sequence[str]]]) -> str:
+    """스파이 지시문 끝에 붙이는 유력 장소 후보 ({장소: 역할 목록})"""
+    if not candidates:
+        return ""
+    listed = "; ".join(f"{loc}({', '.join(roles)})" for loc, roles in candidates.items())
+    return f" 지금까지 대화로 보아 유력한 장소 후보: {listed}"
+
+def build_messages(system_prompt: str, history: List[Dict[str, str]], turn_prompt: str) -> List[Dict[str, str]]:
+    """LLM에 보낼 메시지 목록
+
+    시스템 프롬프트 + (추가만 되는) 대화 기록이 앞에 오고, 매번 달라지는 지시문은 항상 맨 끝에 둡니다.
+    그래서 같은 플레이어의 연속된 호출은 앞부분이 바이트 단위로 같아 OpenAI/Ollama 프롬프트 캐시가 적중합니다.
+    """
+    return [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": turn_prompt}
+    ]
+
+async def get_ai_response(player_data: Dict[str, Any], history: List[Dict[str, str]],
+                          target_player: str, backend: LLMBackend, chosen_location: str,
+                          system_prompt: Optional[str] = None, candidates: Optional[Dict[str, Sequence[str]]] = None,
+                          telemetry: Optional[Telemetry] = None, game_id: Optional[str] = None) -> str:
+    """AI 질문 생성 (API 오류는 호출한 쪽에서 처리). telemetry를 주면 호출 측정값을 남깁니다."""
+
+    if system_prompt is None:
+        system_prompt = create_system_prompt(player_data, chosen_location)
+
+    current_turn_prompt = (
+        f"현재 당신의 차례야. 당신은 플레이어 '{target_player}'에게 **새롭고 구체적인 질문 하나**를 해야 해. "
+        f"이전에 다른 플레이어가 했던 질문이나 비슷하거나 똑같은 질문은 절대 하지 마. "
+        f"답변은 **[질문] 태그 없이** **실제 질문 내용**을 채워서 생성해. 답변은 **{TURN_POLICY.word_limit}단어 이내**로 간결하게 해야 해. "
+        f"**주의: 모든 질문은 반말을 사용하고, 오직 질문만 해.**"
+    ) + candidate_hint(candidates)
+
+    messages = build_messages(system_prompt, history, current_turn_prompt)
+
+    # 게임 종료 액션은 별도의 결정 단계(ActionDecider)가 정하므로, 질문 호출에는 도구 정의를 보내지 않습니다.
+    # 단어 수 상한에 맞춘 max_tokens/stop으로 길게 늘어지는 응답을 서버에서 끊고, 태그/군더더기는 교정합니다.
+    result = await timed_chat(telemetry, backend, messages, game_id, player_data["name"], "question",
+                              **TURN_POLICY.request_kwargs())
+    return TURN_POLICY.shape(result.content)
+
+def _answer_messages(player_data: Dict[str, Any], history: List[Dict[str, str]],
+                     question_text: str, chosen_location: str,
+                     system_prompt: Optional[str] = None,
+                     candidates: Optional[Dict[str, Sequence[str]]] = None) -> List[Dict[str, str]]:
+    if system_prompt is None:
+        system_prompt = create_system_prompt(player_data, chosen_location)
+    answer_prompt = (
+        f"당신은 질문을 받았어: '{question_text}' "
+        f"당신의 역할과 상기된 답변 지침에 맞게 **{TURN_POLICY.word_limit}단어 이내**로 간결하게 반말로 답변해. 답변은 뒤에 **실제 답변 내용**을 채워서 생성해. 답변 앞에 어떤 식별자나 태그도 붙이지 마. 예: 나는 내 업무를 수행하고 있어."
+    ) + candidate_hint(candidates)
+    return build_messages(system_prompt, history, answer_prompt)
+
+async def get_ai_answer(player_data: Dict[str, Any], history: List[Dict[str, str]],
+                        question_text: str, backend: LLMBackend, chosen_location: str,
+                        system_prompt: Optional[str] = None, candidates: Optional[Dict[str, Sequence[str]]] = None,
+                        telemetry: Optional[Telemetry] = None, game_id: Optional[str] = None) -> str:
+
+    result = await timed_chat(
+        telemetry, backend,
+        _answer_messages(player_data, history, question_text, chosen_location, system_prompt, candidates),
+        game_id, player_data["name"], "answer",
+        **TURN_POLICY.request_kwargs()
+    )
+
+    return TURN_POLICY.shape(result.content)
+
+async def get_ai_answer_stream(player_data: Dict[str, Any], history: List[Dict[str, str]],
+                               question_text: str, backend: LLMBackend, chosen_location: str,
+                               system_prompt: Optional[str] = None, candidates: Optional[Dict[str, Sequence[str]]] = None,
+                               telemetry: Optional[Telemetry] = None, game_id: Optional[str] = None) -> AsyncIterator[str]:
+    """AI 답변을 토큰이 도착하는 대로 조각(str) 단위로 내보냅니다.
+
+    조각은 OutputShaper가 도착하는 즉시 교정합니다. (앞 태그 제거, 한 줄, 단어 수 상한)
+    상한을 넘긴 뒤 문장이 끝나면 남은 생성을 기다리지 않고 스트림을 닫습니다. (info.complete로 캐시에 알림)
+    """
+    info = StreamInfo()
+    stream = timed_stream(
+        telemetry, backend,
+        _answer_messages(player_data, history, question_text, chosen_location, system_prompt, candidates),
+        game_id, player_data["name"], "answer", info=info,
+        **TURN_POLICY.request_kwargs()
+    )
+
+    shaper = TURN_POLICY.shaper()
+    try:
+        async for delta in stream:
+            piece = shaper.feed(delta)
+            if piece:
+                yield piece
+            if shaper.done:
+                info.complete = True
+                break
+        rest = shaper.finish()
+        if rest:
+            yield rest
+    finally:
+        await stream.aclose()
+
+
+# --- 3. 게임 엔진 ---
+
+@lru_cache(maxsize=None)
+def decider_for(pack_name: str) -> ActionDecider:
+    """팩마다 모든 게임이 공유하는 결정기 (장소 단서 행렬과 임베딩 인덱스를 프로세스당 한 번만 준비)"""
+    data = load_pack(pack_name).data
+    return ActionDecider(data, embedding_index=LocationIndex.load_or_build(data))
+
+
+class SpyfallEngine:
+    """UI 없이 스파이폴 한 판의 상태와 턴 진행을 관리하는 클래스"""
+
+    def __init__(self, backend: LLMBackend, player_names: Optional[List[str]] = None,
+                 human_name: Optional[str] = HUMAN_PLAYER_NAME,
+                 window_turns: int = DEFAULT_WINDOW_TURNS, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 speculative: bool = False, decider: Optional[ActionDecider] = None,
+                 pack: Optional[str] = None, store: Optional[GameStore] = None, seed: Optional[int] = None,
+                 telemetry: Optional[Telemetry] = None):
+        self.backend = backend
+        # LLM 호출마다 플레이어/단계/토큰/지연 시간을 남기는 수집기 (기본: 프로세스 공유 TELEMETRY)
+        self.telemetry = telemetry if telemetry is not None else TELEMETRY
+        # 장소/역할/시작 플레이어/질문 대상을 고르는 난수. seed가 같으면 같은 게임이 재현됩니다.
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # 지정하면 게임 시작/턴마다 상태를 저장해 game_id로 이어 할 수 있습니다.
+        self.store = store
+        self.game_id: Optional[str] = None
+        # 이 게임에서 쓰는 장소 팩
+        self.pack: LocationPack = load_pack(pack or DEFAULT_PACK)
+        # True면 AI 답변이 끝나는 즉시 다음 AI 질문을 백그라운드에서 미리 생성합니다.
+        self.speculative = speculative
+        self.player_names_list = list(player_names or PLAYER_NAMES)
+        # 사람 플레이어가 목록에 없으면 전원 AI인 봇전
+        self.human_name = human_name if human_name in self.player_names_list else None
+
+        self.game_phase = "setup"
+        self.players: Dict[str, Dict[str, Any]] = {}
+        self.chosen_location: Optional[str] = None
+        self.turns = TurnLog(self.human_name)
+        self.current_player_index = 0
+        self.current_target: Optional[str] = None
+        self.current_question: Optional[str] = None
+        self.game_result: Optional[str] = None
+        self.winner: Optional[str] = None  # "spy" 또는 "non_spy"
+        self.turn_count = 0
+        self.last_error: Optional[Exception] = None
+        # (플레이어, 장소) -> 시스템 프롬프트. 게임마다 한 번만 만듭니다.
+        self._system_prompts: Dict[tuple, str] = {}
+        # LLM에 보낼 대화 기록 창 (최근 턴 원문 + 이전 턴 요약)
+        self.history_window = HistoryWindow(window_turns, token_budget)
+        # 미리 생성 중인 질문: (질문자, 대상, 생성 시점의 기록 길이, Future)
+        self._speculation: Optional[tuple] = None
+        # 이번 질문 차례에 뽑아 둔 대상: (질문자, 뽑은 시점의 기록 길이, 대상)
+        # 미리 생성을 버려도 같은 대상을 다시 쓰므로, speculative 여부와 관계없이 난수 소비가 같습니다.
+        self._drawn_target: Optional[tuple] = None
+        # AI가 질문 대신 스파이 지목/장소 추측을 할지 정하는 결정기
+        self.decider = decider if decider is not None else decider_for(self.pack.name)
+        # 플레이어별 장소 확률과 의심 점수 (턴마다 증분 갱신)
+        self.beliefs = self.decider.new_tracker(self.player_names_list)
+
+    # --- 상태 조회 ---
+
+    @property
+    def current_player(self) -> str:
+        return self.player_names_list[self.current_player_index]
+
+    @property
+    def game_history(self) -> Tuple[Dict[str, str], ...]:
+        """LLM 메시지 형태의 대화 기록 (턴 기록에서 필요할 때 렌더링, 읽기 전용 튜플)"""
+        return self.turns.messages()
+
+    def is_human(self, name: str) -> bool:
+        return name == self.human_name
+
+    def targets_for(self, questioner_name: str) -> List[str]:
+        """질문자가 질문할 수 있는 대상 목록"""
+        return [n for n in self.player_names_list if n != questioner_name]
+
+    def system_prompt_for(self, name: str) -> str:
+        key = (name, self.chosen_location)
+        prompt = self._system_prompts.get(key)
+        if prompt is None:
+            prompt = create_system_prompt(self.players[name], self.chosen_location, self.pack.name)
+            self._system_prompts[key] = prompt
+        return prompt
+
+    def spy_candidates(self, name: str) -> Optional[Dict[str, Sequence[str]]]:
+        """스파이 지시문에 붙일 유력 장소 후보와 역할 (임베딩/단서 점수 기준). 비스파이는 None"""
+        if not self.players[name]["is_spy"]:
+            return None
+        return {loc: self.pack.roles_of(loc) for loc in self.beliefs.top_locations(name, SPY_CANDIDATE_COUNT)}
+
+    def history_view(self, name: str) -> List[Dict[str, str]]:
+        """name 플레이어의 LLM 호출에 넣을 대화 기록 (토큰 예산 적용)"""
+        reserved = count_tokens(self.system_prompt_for(name)) + TURN_PROMPT_RESERVE_TOKENS
+        return self.history_window.view(self.game_history, reserved_tokens=reserved)
+
+    def pending_step(self) -> str:
+        """다음에 진행해야 할 단계를 반환합니다.
+
+        "ai_question", "ai_answer", "human_question", "human_answer", "finished", "setup" 중 하나입니다.
+        """
+        if self.game_phase in ("setup", "finished"):
+            return self.game_phase
+        if self.game_phase == "human_answer_wait":
+            return "human_answer"
+        if self.current_question is not None:
+            return "human_answer" if self.is_human(self.current_target) else "ai_answer"
+        return "human_question" if self.is_human(self.current_player) else "ai_question"
+
+    # --- 게임 초기화 ---
+
+    def start(self, seed: Optional[int] = None) -> None:
+        """게임 상태를 초기화하고 역할을 분배합니다. seed를 주면 그 값으로 난수를 다시 맞춥니다."""
+        if seed is not None:
+            self.seed = seed
+            self.rng.seed(seed)
+
+        # 1. 장소 및 역할 무작위 선택
+        chosen_location = self.rng.choice(self.pack.locations)
+        location_roles = list(self.pack.roles_of(chosen_location))
+
+        # 2. 플레이어 역할 분배 (총 8명: 스파이 2명, 비스파이 6명)
+        num_non_spies = len(self.player_names_list) - 2
+        roles = ["스파이"] * 2
+        if len(location_roles) >= num_non_spies:
+            non_spy_roles = self.rng.sample(location_roles, num_non_spies)
+        else:
+            non_spy_roles = self.rng.choices(location_roles, k=num_non_spies)
+
+        roles.extend(non_spy_roles)
+        self.rng.shuffle(roles)
+
+        # 3. 상태 저장
+        players = {}
+        for i, name in enumerate(self.player_names_list):
+            players[name] = {
+                "role": roles[i],
+                "is_spy": roles[i] == "스파이",
+                "name": name,
+                "display_role": roles[i] if roles[i] != "스파이" else "스파이",
+                "is_alive": True
+            }
+
+        self.game_phase = "in_progress"
+        self.players = players
+        self.chosen_location = chosen_location
+        self.turns = TurnLog(self.human_name)
+        self.current_player_index = self.rng.randrange(len(self.player_names_list))
+        self.current_target = None
+        self.current_question = None
+        self.game_result = None
+        self.winner = None
+        self.turn_count = 0
+        self.last_error = None
+        self._system_prompts = {}
+        self.history_window.reset()
+        self.beliefs.reset()
+        self.cancel_speculation()
+        self._drawn_target = None
+        self.game_id = uuid.uuid4().hex[:12]
+        if self.store is not None:
+            self.store.create(self)
+
+    @classmethod
+    def resume(cls, backend: LLMBackend, store: GameStore, game_id: str, **kwargs) -> "SpyfallEngine":
+        """저장된 게임을 불러와 이어 할 수 있는 엔진을 만듭니다. (미리 생성 중이던 질문은 다시 만듭니다)"""
+        state, turns = store.load(game_id)
+        engine = cls(backend, player_names=state["player_names"], human_name=state["human_name"],
+                     pack=state["pack"], store=store, **kwargs)
+        engine.game_id = game_id
+        engine.players = state["players"]
+        engine.chosen_location = state["chosen_location"]
+        for column in STATE_COLUMNS:
+            setattr(engine, column, state[column])
+        if state["rng_state"] is not None:
+            engine.rng.setstate(state["rng_state"])
+        for turn in turns:
+            engine._append_turn(turn)
+        return engine
+
+    # --- 턴 기록 ---
+
+    def _append_turn(self, turn: Turn) -> None:
+        self.turns.append(turn)
+        self.beliefs.observe(turn)
+
+    def _checkpoint(self, turn: Optional[Turn] = None) -> None:
+        """저장소가 있으면 새 턴 한 줄과 바뀐 상태만 씁니다."""
+        if self.store is not None and self.game_id is not None:
+            self.store.checkpoint(self, turn)
+
+    def record_question(self, questioner_name: str, target_name: str, question_text: str) -> None:
+        self.cancel_speculation()
+        turn = Turn("question", questioner_name, target_name, question_text)
+        self._append_turn(turn)
+        self.current_target = target_name
+        self.current_question = question_text
+
+        # 사람에게 질문한 경우 -> 사람이 답변해야 하므로 phase를 변경
+        if self.is_human(target_name):
+            self.game_phase = "human_answer_wait"
+        self._checkpoint(turn)
+
+    def record_answer(self, answerer_name: str, answer_text: str) -> None:
+        turn = Turn("answer", answerer_name, self.current_player, answer_text)
+        self._append_turn(turn)
+
+        # === 핵심 규칙: 답변자(Target)가 다음 질문자가 됩니다. ===
+        self.current_player_index = self.player_names_list.index(answerer_name)
+        self.current_question = None
+        self.game_phase = "in_progress"
+        self.turn_count += 1
+        self._checkpoint(turn)
+
+        # 다음 질문자와 문맥이 정해졌으므로, AI 차례라면 바로 다음 질문 생성을 시작합니다.
+        if self.speculative and not self.is_human(answerer_name):
+            self._start_speculation()
+
+    # --- 다음 질문 미리 생성 ---
+
+    def _draw_target(self, questioner_name: str) -> str:
+        """이번 질문 차례의 대상. 한 차례에 난수를 한 번만 씁니다."""
+        key = (questioner_name, len(self.turns))
+        if self._drawn_target is None or self._drawn_target[:2] != key:
+            self._drawn_target = (*key, self.rng.choice(self.targets_for(questioner_name)))
+        return self._drawn_target[2]
+
+    def _start_speculation(self) -> None:
+        self.cancel_speculation()
+        questioner_name = self.current_player
+        target_name = self._draw_target(questioner_name)
+        # 대화 기록 창은 지금 계산해 두고, 백그라운드 작업에는 복사본만 넘깁니다.
+        future = submit(get_ai_response(
+            self.players[questioner_name],
+            list(self.history_view(questioner_name)),
+            target_name,
+            self.backend,
+            self.chosen_location,
+            self.system_prompt_for(questioner_name),
+            self.spy_candidates(questioner_name),
+            self.telemetry,
+            self.game_id
+        ))
+        self._speculation = (questioner_name, target_name, len(self.turns), future)
+
+    def cancel_speculation(self) -> None:
+        """미리 생성 중인 질문을 버립니다. (사람이 끼어들거나 게임이 끝난 경우)"""
+        if self._speculation is not None:
+            self._speculation[3].cancel()
+            self._speculation = None
+
+    async def _take_speculation(self, questioner_name: str, target_name: Optional[str]) -> Optional[tuple]:
+        """지금 상황과 일치하는 미리 생성된 질문이 있으면 (대상, 질문)을 돌려줍니다."""
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return None
+        spec_questioner, spec_target, history_len, future = speculation
+        stale = (spec_questioner != questioner_name or history_len != len(self.turns)
+                 or (target_name is not None and target_name != spec_target))
+        if stale:
+            future.cancel()
+            return None
+        try:
+            return spec_target, await asyncio.wrap_future(future)
+        except Exception:
+            # 미리 생성이 실패했으면 평소처럼 다시 호출합니다.
+            return None
+
+    # --- AI 턴 ---
+
+    def decide_ai_action(self) -> Optional[ActionDecision]:
+        """현재 AI 질문자가 질문 대신 할 액션. 확신이 없으면 None"""
+        name = self.current_player
+        if self.game_phase != "in_progress" or self.current_question is not None or self.is_human(name):
+            return None
+        return self.decider.decide(self.beliefs, self.players[name], self.chosen_location, self.turn_count)
+
+    def play_ai_action(self) -> Optional[ActionDecision]:
+        """결정기가 확신하면 액션을 실행하고 그 결정을 반환합니다. 질문 차례 직전에 부릅니다."""
+        decision = self.decide_ai_action()
+        if decision is not None:
+            self.handle_game_action(decision.action_type, decision.action_data, self.current_player)
+        return decision
+
+    async def aplay_ai_question(self, target_name: Optional[str] = None) -> Optional[str]:
+        """AI 턴 로직 처리 (질문). 실패하면 None을 반환하고 last_error에 오류를 남깁니다."""
+
+        questioner_name = self.current_player
+        alive_targets = self.targets_for(questioner_name)
+        if not alive_targets:
+            self.last_error = RuntimeError("질문할 대상이 없습니다. (오류)")
+            return None
+
+        speculation = await self._take_speculation(questioner_name, target_name)
+        if speculation is not None:
+            target_name, question_text = speculation
+            self.record_question(questioner_name, target_name, question_text)
+            return question_text
+
+        if target_name is None:
+            target_name = self._draw_target(questioner_name)
+
+        try:
+            question_text = await get_ai_response(
+                self.players[questioner_name],
+                self.history_view(questioner_name),
+                target_name,
+                self.backend,
+                self.chosen_location,
+                system_prompt=self.system_prompt_for(questioner_name),
+                candidates=self.spy_candidates(questioner_name),
+                telemetry=self.telemetry,
+                game_id=self.game_id
+            )
+        except Exception as e:
+            self.last_error = e
+            return None
+
+        self.record_question(questioner_name, target_name, question_text)
+        return question_text
+
+    async def aplay_ai_answer(self) -> Optional[str]:
+        """마지막 질문에 대한 AI 답변 처리. 실패하면 None을 반환하고 last_error에 오류를 남깁니다. (질문은 그대로 남아 다시 시도할 수 있습니다)"""
+
+        target_name = self.current_target
+        if self.current_question is None or target_name is None or self.is_human(target_name):
+            self.last_error = RuntimeError("시스템 오류: AI 답변 턴이 아닙니다. (Phase 전환 오류)")
+            return None
+
+        try:
+            answer_text = await get_ai_answer(
+                self.players[target_name],
+                self.history_view(target_name),
+                self.current_question,
+                self.backend,
+                self.chosen_location,
+                system_prompt=self.system_prompt_for(target_name),
+                candidates=self.spy_candidates(target_name),
+                telemetry=self.telemetry,
+                game_id=self.game_id
+            )
+        except Exception as e:
+            self.last_error = e
+            return None
+        self.record_answer(target_name, answer_text)
+        return answer_text
+
+    async def astream_ai_answer(self) -> AsyncIterator[str]:
+        """aplay_ai_answer의 스트리밍 버전. 조각을 내보내고, 끝나면 답변을 기록합니다."""
+
+        target_name = self.current_target
+        if self.current_question is None or target_name is None or self.is_human(target_name):
+            raise RuntimeError("시스템 오류: AI 답변 턴이 아닙니다. (Phase 전환 오류)")
+
+        parts = []
+        async for piece in get_ai_answer_stream(
+            self.players[target_name],
+            self.history_view(target_name),
+            self.current_question,
+            self.backend,
+            self.chosen_location,
+            system_prompt=self.system_prompt_for(target_name),
+            candidates=self.spy_candidates(target_name),
+            telemetry=self.telemetry,
+            game_id=self.game_id
+        ):
+            parts.append(piece)
+            yield piece
+
+        self.record_answer(target_name, "".join(parts).strip())
+
+    # 동기 코드(Streamlit)용 래퍼
+    def play_ai_question(self, target_name: Optional[str] = None) -> Optional[str]:
+        return run_sync(self.aplay_ai_question(target_name))
+
+    def play_ai_answer(self) -> Optional[str]:
+        return run_sync(self.aplay_ai_answer())
+
+    def stream_ai_answer(self) -> Iterator[str]:
+        return iterate_sync(self.astream_ai_answer())
+
+    # --- 사람 턴 ---
+
+    def submit_human_answer(self, answer_text: str) -> None:
+        self.record_answer(self.human_name, answer_text)
+
+    def submit_human_question(self, target_name: str, question_text: str) -> None:
+        self.record_question(self.human_name, target_name, question_text)
+
+    # --- 게임 종료 액션 ---
+
+    def handle_game_action(self, action_type: str, action_data: str, questioner_name: str) -> Optional[str]:
+        """스파이 지목 또는 장소 추측 처리. 액션이 무효라 턴이 취소되면 경고 문구를 반환합니다."""
+        self.cancel_speculation()
+        turn = Turn("action", questioner_name, action_data, action_type)
+        self._append_turn(turn)
+        self._checkpoint(turn)
+
+        if action_type == "guess_location":
+            # 스파이의 장소 추측
+            location_name = action_data
+            if not self.players[questioner_name]["is_spy"]:
+                return f"🚨 {questioner_name} (비-스파이)이(가) 뜬금없이 장소 추측을 시도했습니다. 턴이 취소됩니다."
+            if location_name == self.chosen_location:
+                self._finish(f"🎉 **게임 종료!** 스파이 **{questioner_name}**이(가) 장소 **'{location_name}'**을(를) 정확히 맞췄습니다. **스파이 승리!**", "spy")
+            else:
+                self._finish(f"❌ 스파이 **{questioner_name}**이(가) 장소 **'{location_name}'**을(를) 추측했지만 틀렸습니다. (정답: {self.chosen_location})<br>**스파이가 자수했습니다! (비-스파이 승리!)**", "non_spy")
+
+        elif action_type == "accuse_spy":
+            # 비스파이의 스파이 지목
+            accused_player = action_data
+            if self.players[questioner_name]["is_spy"]:
+                return f"🚨 {questioner_name} (스파이)이(가) 자기들끼리 지목을 시도했습니다. 턴이 취소됩니다."
+            if self.players.get(accused_player, {}).get("is_spy"):
+                self._finish(f"🎉 **게임 종료!** 플레이어 **{questioner_name}**이(가) 스파이 **{accused_player}**을(를) 정확히 지목했습니다. **비-스파이 승리!**", "non_spy")
+            else:
+                self._finish(f"😔 플레이어 **{questioner_name}**이(가) **{accused_player}**을(를) 지목했지만, 그는 스파이가 아니었습니다.<br>스파이가 잡히지 않았으므로, **스파이 승리!**", "spy")
+
+        return None
+
+    def _finish(self, game_result: str, winner: str) -> None:
+        self.game_result = game_result
+        self.winner = winner
+        self.game_phase = "finished"
+        self.current_player_index = -1
+        self._checkpoint()
+
+    # --- 봇전 (헤드리스) 진행 ---
+
+    async def astep(self) -> bool:
+        """AI 차례 하나를 진행합니다. 진행할 수 없으면 False를 반환합니다."""
+        step = self.pending_step()
+        if step == "ai_question":
+            if self.play_ai_action() is not None:
+                return True
+            return await self.aplay_ai_question() is not None
+        if step == "ai_answer":
+            return await self.aplay_ai_answer() is not None
+        return False
+
+    async def arun_to_completion(self, max_turns: int = DEFAULT_MAX_TURNS) -> Dict[str, Any]:
+        """AI끼리 게임을 끝까지 진행하고 결과 요약을 반환합니다."""
+        if self.game_phase == "setup":
+            self.start()
+
+        while self.game_phase != "finished":
+            if self.turn_count >= max_turns:
+                # 아무도 액션을 하지 않고 끝까지 가면 스파이가 승리합니다.
+                self._finish(f"⏰ **{max_turns}턴 경과!** 스파이가 끝까지 들키지 않았습니다. **스파이 승리!**", "spy")
+                break
+            if not await self.astep():
+                raise RuntimeError(f"게임 진행 불가 ({self.pending_step()}): {self.last_error}")
+
+        return self.summary()
+
+    def step(self) -> bool:
+        return run_sync(self.astep())
+
+    def run_to_completion(self, max_turns: int = DEFAULT_MAX_TURNS) -> Dict[str, Any]:
+        return run_sync(self.arun_to_completion(max_turns))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "chosen_location": self.chosen_location,
+            "spies": [n for n, p in self.players.items() if p["is_spy"]],
+            "winner": self.winner,
+            "turns": self.turn_count,
+        }
+
+
+async def arun_batch(backend: LLMBackend, num_games: int, max_turns: int = DEFAULT_MAX_TURNS,
+                     concurrency: int = 1, pack: Optional[str] = None,
+                     store: Optional[GameStore] = None, resume: bool = False,
+                     seed: Optional[int] = None) -> Dict[str, Any]:
+    """AI 8명 봇전을 여러 판 돌려 스파이 승률을 집계합니다. 최대 concurrency판을 동시에 진행합니다.
+
+    store를 주면 모든 게임을 저장하고, resume이면 저장소에 남은 끝나지 않은 게임부터 이어서 num_games판을 채웁니다.
+    seed를 주면 새 게임 i는 seed + i로 진행되어 같은 명령이 같은 게임들을 재현합니다.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency))
+    resumed = store.unfinished_games(bots_only=True)[:num_games] if store is not None and resume else []
+
+    async def play_one(game_id: Optional[str], game_seed: Optional[int]) -> Dict[str, Any]:
+        async with limit:
+            if game_id is not None:
+                engine = SpyfallEngine.resume(backend, store, game_id, seed=game_seed)
+            else:
+                engine = SpyfallEngine(backend, player_names=BOT_PLAYER_NAMES, human_name=None, pack=pack, store=store,
+                                       seed=game_seed)
+            return await engine.arun_to_completion(max_turns=max_turns)
+
+    started = time.time()
+    game_ids = resumed + [None] * (num_games - len(resumed))
+    seeds = [None if seed is None else seed + i for i in range(num_games)]
+    results = await asyncio.gather(*(play_one(game_id, game_seed) for game_id, game_seed in zip(game_ids, seeds)))
+    return summarize_results(results, time.time() - started)
+
+def summarize_results(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """게임 요약(summary) 목록을 승률 통계로 묶습니다."""
+    spy_wins = sum(1 for r in results if r["winner"] == "spy")
+    return {
+        "games": len(results),
+        "spy_wins": spy_wins,
+        "non_spy_wins": len(results) - spy_wins,
+        "spy_win_rate": spy_wins / len(results) if results else 0.0,
+        "avg_turns": sum(r["turns"] for r in results) / len(results) if results else 0.0,
+        "elapsed_sec": elapsed,
+    }
+
+def run_batch(backend: LLMBackend, num_games: int, max_turns: int = DEFAULT_MAX_TURNS,
+              concurrency: int = 1, pack: Optional[str] = None,
+              store: Optional[GameStore] = None, resume: bool = False, seed: Optional[int] = None) -> Dict[str, Any]:
+    return run_sync(arun_batch(backend, num_games, max_turns, concurrency, pack, store, resume, seed))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="AI 스파이폴 봇전 헤드리스 시뮬레이션")
+    parser.add_argument("--games", type=int, default=10, help="진행할 게임 수")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="게임당 최대 턴 수")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 진행할 게임 수")
+    parser.add_argument("--backend", default=None, help="LLM 백엔드 (openai / ollama / stub)")
+    parser.add_argument("--model", default=None, help="모델 이름 (생략 시 백엔드 기본값)")
+    parser.add_argument("--batch-max", type=int, default=None, help="마이크로 배치 최대 크기 (1이면 끔)")
+    parser.add_argument("--cache", default=None, help="LLM 응답 캐시 SQLite 파일 경로")
+    parser.add_argument("--cache-mode", default=None, choices=CACHE_MODES, help="캐시 모드")
+    parser.add_argument("--hedge", action="store_true", default=None, help="느린 응답에 헤징 요청을 보냄 (p95 지연 시간 이후)")
+    parser.add_argument("--pack", default=None, help=f"장소 팩 이름 (기본: {DEFAULT_PACK})")
+    parser.add_argument("--store", default=DEFAULT_GAME_DB, help="게임 저장 SQLite 파일 경로")
+    parser.add_argument("--resume", action="store_true", help="저장소에서 끝나지 않은 게임부터 이어서 진행")
+    parser.add_argument("--seed", type=int, default=None, help="난수 시드 (게임 i는 seed + i)")
+    parser.add_argument("--metrics-out", default=None, help="끝난 뒤 LLM 호출 지표를 Prometheus 텍스트 형식으로 쓸 경로")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    missing = None if args.cache_mode == "replay" else backend_missing_config(args.backend)
+    if missing:
+        print(f"환경 변수 '{missing}'를 찾을 수 없습니다.", file=sys.stderr)
+        sys.exit(1)
+
+    backend = create_backend(args.backend, args.model, cache_path=args.cache, cache_mode=args.cache_mode,
+                             batch_max=args.batch_max, hedge=args.hedge)
+    store = GameStore(args.store) if args.store else None
+    stats = run_batch(backend, args.games, args.max_turns, args.concurrency, args.pack, store, args.resume, args.seed)
+    print(f"게임 수: {stats['games']} | 스파이 승리: {stats['spy_wins']} | "
+          f"스파이 승률: {stats['spy_win_rate']:.1%} | 평균 턴: {stats['avg_turns']:.1f} | "
+          f"소요 시간: {stats['elapsed_sec']:.1f}s")
+    if isinstance(backend, CachedBackend):
+        cache = backend.stats()
+        print(f"캐시 적중: {cache['hits']} | 미적중: {cache['misses']} | 적중률: {cache['hit_rate']:.1%} | "
+              f"삭제: {cache['evictions']}")
+    if args.metrics_out:
+        TELEMETRY.write_prometheus(args.metrics_out)
+
+
+if __name__ == "__main__":
+    main()
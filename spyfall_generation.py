@@ -0,0 +1,188 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Any, Tuple
+
+# --- 1. 설정 ---
+
+# 프롬프트가 요구하는 질문/답변 길이 (단어 수)
+DEFAULT_WORD_LIMIT = int(os.environ.get("SPYFALL_WORD_LIMIT", "15"))
+# 단어 수 상한을 넘긴 뒤 문장이 끝나기를 기다려 주는 단어 수. 그 안에 문장이 끝나지 않으면 상한에서 자릅니다.
+GRACE_WORDS = 5
+# 한국어 한 어절이 차지하는 대략적인 토큰 수 (cl100k 기준 3~4). max_tokens = (상한 + 여유 단어) x 이 값 + 태그 몫
+TOKENS_PER_WORD = int(os.environ.get("SPYFALL_TOKENS_PER_WORD", "4"))
+# 모델이 붙이곤 하는 "나의 답변:" 같은 태그 몫
+TAG_RESERVE_TOKENS = 16
+# 대화 기록 형식(🕵️ 질문 / 🤖·🙋‍♂️ 답변)으로 다음 턴을 이어 쓰기 시작하면 멈춥니다. (OpenAI는 최대 4개)
+STOP_SEQUENCES = ("\n\n", "\n🕵️", "\n🤖", "\n🙋")
+
+# 이 글자로 끝나면 문장이 끝난 것으로 봅니다.
+SENTENCE_END = frozenset(".?!。？！~")
+# 앞뒤에서 벗겨 낼 따옴표
+QUOTES = frozenset("\"'“”‘’「」『』")
+
+# 모델이 답변/질문 앞에 붙이곤 하는 식별자 (대화 기록 형식을 흉내 낸 것 포함)
+OUTPUT_TAG_PREFIXES = ("나의 답변:", "[답변]:", "[답변]", "[질문]:", "[질문]")
+_TAG_PATTERN = re.compile(
+    r"^\s*(?:🤖\s*[^:\n]{1,20}의 답변:|🙋(?:‍♂️?)?\s*나의 답변:|🕵️?\s*[^:\n]{1,40}질문:|"
+    r"나의 답변:|\[답변\]:?|\[질문\]:?)\s*"
+)
+# 이 글자로 시작하면 대화 기록 형식 태그일 수 있으므로 ":"가 나올 때까지 (최대 길이만큼) 모아 봅니다.
+_TAG_STARTS = ("🤖", "🙋", "🕵")
+_TAG_MAX_LEN = 48
+
+
+# --- 2. 출력 교정기 ---
+
+class OutputShaper:
+    """스트림 조각을 받는 즉시 검증/교정해서 내보내는 클래스 (응답이 끝나기를 기다리지 않음)
+
+    - 앞쪽 태그와 따옴표는 태그인지 판별될 때까지만 잠깐 모았다가 벗겨 냅니다.
+    - 줄바꿈이 나오면 한 줄 답변이 끝난 것으로 보고 멈춥니다.
+    - 단어 수가 상한에 닿은 뒤 문장이 끝나면 멈춥니다. 상한을 넘는 단어는 문장이 끝날 때까지 내보내지 않고 들고 있다가,
+      grace_words 안에 문장이 끝나면 내보내고, 끝나지 않으면 버리고 상한에서 자릅니다.
+    - 끝의 공백/따옴표는 뒤에 글자가 더 올 때까지 내보내지 않으므로 결과는 따로 strip할 필요가 없습니다.
+    done이 True가 되면 더 받을 필요가 없으니 스트림을 닫으면 됩니다.
+    """
+
+    def __init__(self, word_limit: int, grace_words: int = GRACE_WORDS):
+        self.word_limit = word_limit
+        self.grace_words = grace_words
+        self.done = False
+        self.parts: List[str] = []
+        self._prefix = ""
+        self._prefix_done = False
+        self._held = ""
+        # 상한을 넘긴 뒤 문장이 끝나기를 기다리며 들고 있는 텍스트
+        self._tail: List[str] = []
+        self._words = 0
+        self._in_word = False
+
+    @property
+    def text(self) -> str:
+        """지금까지 내보낸 교정된 텍스트"""
+        return "".join(self.parts)
+
+    def _strip_prefix(self, final: bool) -> Tuple[bool, str]:
+        """(판별 끝 여부, 태그를 벗긴 나머지)"""
+        rest = self._prefix.lstrip()
+        while True:
+            rest = rest.lstrip("".join(QUOTES)).lstrip()
+            match = _TAG_PATTERN.match(rest)
+            if match is None or not match.group(0).strip():
+                break
+            rest = rest[match.end():]
+        if final:
+            return True, rest
+        # 아직 태그의 앞부분일 수 있으면 조금 더 모읍니다.
+        if not rest.strip() or any(tag.startswith(rest) for tag in OUTPUT_TAG_PREFIXES):
+            return False, rest
+        if rest.startswith(_TAG_STARTS) and ":" not in rest and len(rest) < _TAG_MAX_LEN:
+            return False, rest
+        return True, rest
+
+    def feed(self, delta: str) -> str:
+        """조각 하나를 받아 지금 내보내도 되는 교정된 텍스트를 돌려줍니다."""
+        if self.done or not delta:
+            return ""
+        if not self._prefix_done:
+            self._prefix += delta
+            decided, rest = self._strip_prefix(final=False)
+            if not decided:
+                return ""
+            self._prefix_done = True
+            delta = rest
+        return self._emit(delta)
+
+    def finish(self) -> str:
+        """스트림이 끝났을 때 남은 텍스트 (아직 태그 판별 중이던 내용, 상한 뒤 여유 안에서 끝난 마지막 단어들)"""
+        if self.done:
+            return ""
+        text = ""
+        if not self._prefix_done:
+            self._prefix_done = True
+            _, rest = self._strip_prefix(final=True)
+            text = self._emit(rest)
+        if not self.done:
+            text += self._flush_tail()
+            self.done = True
+        return text
+
+    def _flush_tail(self) -> str:
+        text = "".join(self._tail)
+        self._tail = []
+        if text:
+            self.parts.append(text)
+        return text
+
+    def _emit(self, delta: str) -> str:
+        out = []
+        for ch in delta:
+            if ch == "\n" or ch == "\r":
+                if self._words:
+                    # 줄이 끝났으면 답도 끝난 것이므로 여유 안의 단어는 그대로 씁니다.
+                    out.extend(self._tail)
+                    self._tail = []
+                    self.done = True
+                    break
+                continue
+            if ch.isspace() or ch in QUOTES:
+                if self._words:
+                    self._held += ch
+                self._in_word = self._in_word and not ch.isspace()
+                continue
+            if not self._in_word:
+                if self._words >= self.word_limit + self.grace_words:
+                    self.done = True
+                    break
+                self._words += 1
+                self._in_word = True
+            target = self._tail if self._words > self.word_limit else out
+            target.append(self._held)
+            target.append(ch)
+            self._held = ""
+            if ch in SENTENCE_END and self._words >= self.word_limit:
+                out.extend(self._tail)
+                self._tail = []
+                self.done = True
+                break
+        text = "".join(out)
+        if text:
+            self.parts.append(text)
+        return text
+
+
+# --- 3. 생성 정책 ---
+
+@dataclass(frozen=True)
+class GenerationPolicy:
+    """짧은 한 줄 출력(질문/답변)을 위한 생성 옵션과 출력 교정 규칙"""
+    word_limit: int = DEFAULT_WORD_LIMIT
+    temperature: float = 0.8
+    grace_words: int = GRACE_WORDS
+
+    @property
+    def max_tokens(self) -> int:
+        return (self.word_limit + self.grace_words) * TOKENS_PER_WORD + TAG_RESERVE_TOKENS
+
+    @property
+    def stop(self) -> List[str]:
+        return list(STOP_SEQUENCES)
+
+    def request_kwargs(self) -> Dict[str, Any]:
+        """backend.chat / stream_chat에 넘길 생성 옵션"""
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens, "stop": self.stop}
+
+    def shaper(self) -> OutputShaper:
+        return OutputShaper(self.word_limit, self.grace_words)
+
+    def shape(self, text: str) -> str:
+        """스트리밍하지 않은 응답 전체를 같은 규칙으로 교정합니다."""
+        shaper = self.shaper()
+        shaper.feed(text)
+        shaper.finish()
+        return shaper.text
+
+
+# 질문과 답변은 같은 길이 상한과 온도를 씁니다. (프롬프트가 둘 다 같은 단어 수를 요구하므로)
+TURN_POLICY = GenerationPolicy()
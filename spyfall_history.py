@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Optional, Iterator, Sequence, Tuple
+
+# tiktoken은 선택 의존성입니다. 없으면 경고 없이 바이트 수 기반 어림값을 씁니다. (count_tokens 참고)
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# --- 1. 턴 기록 ---
+
+@dataclass(frozen=True, slots=True)
+class Turn:
+    """대화 기록 한 줄
+
+    kind: "question" (speaker -> target 질문), "answer" (speaker의 답변),
+          "action" (speaker가 text 액션을 target 대상으로 시도)
+    """
+    kind: str
+    speaker: str
+    target: Optional[str]
+    text: str
+
+
+class TurnLog:
+    """턴 기록을 원본(Turn)으로 저장하고, LLM용 메시지 목록은 필요할 때 새 턴만 덧붙여 만드는 클래스
+
+    질문자/대상/내용을 문자열에서 다시 파싱할 필요가 없고, 플레이어별로 턴을 바로 찾을 수 있습니다.
+    """
+
+    def __init__(self, human_name: Optional[str] = None):
+        self.human_name = human_name
+        self.turns: List[Turn] = []
+        self._messages: List[Dict[str, str]] = []
+        self._by_player: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __iter__(self) -> Iterator[Turn]:
+        return iter(self.turns)
+
+    def __getitem__(self, index):
+        return self.turns[index]
+
+    def append(self, turn: Turn) -> None:
+        index = len(self.turns)
+        self.turns.append(turn)
+        self._by_player.setdefault(turn.speaker, []).append(index)
+        if turn.target and turn.target != turn.speaker:
+            self._by_player.setdefault(turn.target, []).append(index)
+
+    def by_player(self, name: str) -> List[Turn]:
+        """name이 말했거나 질문/지목 대상이 된 턴"""
+        return [self.turns[i] for i in self._by_player.get(name, [])]
+
+    def render(self, turn: Turn) -> Dict[str, str]:
+        if turn.kind == "question":
+            # 질문 메시지 형식: 🕵️ {질문자}이(가) {대상}에게 질문: {질문 내용}
+            return {"role": "user", "content": f"🕵️ {turn.speaker}이(가) {turn.target}에게 질문: {turn.text}"}
+        if turn.kind == "answer":
+            if turn.speaker == self.human_name:
+                return {"role": "assistant", "content": f"🙋‍♂️ 나의 답변: {turn.text}"}
+            return {"role": "assistant", "content": f"🤖 {turn.speaker}의 답변: {turn.text}"}
+        return {"role": "user", "content": f"액션: {turn.speaker}이(가) {turn.text}({turn.target}) 시도했습니다."}
+
+    def messages(self) -> Tuple[Dict[str, str], ...]:
+        """LLM용 메시지 목록. 이전에 만든 메시지는 재사용하고 새 턴만 렌더링합니다.
+
+        내부 캐시 목록 대신 튜플 복사본을 돌려주므로 호출한 쪽이 목록을 바꿔도 캐시가 깨지지 않습니다.
+        메시지 dict는 캐시와 공유하므로 고치지 말고, 바꿔야 하면 복사해서 쓰세요.
+        """
+        for turn in self.turns[len(self._messages):]:
+            self._messages.append(self.render(turn))
+        return tuple(self._messages)
+
+
+# --- 2. 토큰 계산 ---
+
+# tiktoken 인코딩 이름 (gpt-4 계열)
+TOKENIZER_ENCODING = "cl100k_base"
+
+# False면 tiktoken이 없어 토큰 수를 어림합니다.
+TOKEN_COUNT_EXACT = tiktoken is not None
+
+# 메시지 하나마다 붙는 역할/구분자 토큰 (OpenAI chat 포맷 기준)
+TOKENS_PER_MESSAGE = 4
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    return tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken else None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """텍스트의 토큰 수
+
+    tiktoken이 설치되어 있지 않으면 UTF-8 바이트 수 / 3으로 어림합니다 (한글은 대략 글자당 1토큰).
+    어림값은 실제 토큰 수와 다를 수 있으므로 HistoryWindow의 토큰 예산도 그만큼 근사치가 됩니다.
+    TOKEN_COUNT_EXACT로 어느 쪽인지 확인할 수 있습니다.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, len(text.encode("utf-8")) // 3)
+
+def count_message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) + TOKENS_PER_MESSAGE for m in messages)
+
+
+# --- 3. 대화 기록 창 ---
+
+# 기본값: 최근 8턴(질문+답변)은 원문 유지, 호출당 3000토큰 이내
+DEFAULT_WINDOW_TURNS = 8
+DEFAULT_TOKEN_BUDGET = 3000
+# 창이 이만큼 더 쌓였을 때 한꺼번에 요약으로 넘깁니다 (그 사이에는 앞부분이 그대로라 프롬프트 캐시가 유지됨)
+DEFAULT_FOLD_TURNS = 4
+# 요약 한 줄의 최대 글자 수와 요약 전체의 최대 토큰 수
+SUMMARY_LINE_CHARS = 60
+SUMMARY_TOKEN_BUDGET = 600
+
+SUMMARY_HEADER = "[이전 대화 요약]"
+
+
+class HistoryWindow:
+    """최근 N턴은 원문 그대로, 그 이전 턴은 누적 요약으로 접어서 LLM에 보낼 대화 기록을 만드는 클래스
+
+    대화 기록은 추가만 되므로, 이미 요약에 넣은 메시지 수(folded)만 기억하면 새로 밀려난 메시지만 요약에 덧붙이면 됩니다.
+    토큰 예산은 count_tokens 기준이며, tiktoken이 없으면 바이트 수 기반 어림값으로 지킵니다.
+    """
+
+    def __init__(self, window_turns: int = DEFAULT_WINDOW_TURNS, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 fold_turns: int = DEFAULT_FOLD_TURNS):
+        self.window_messages = window_turns * 2
+        self.fold_messages = max(1, fold_turns * 2)
+        self.token_budget = token_budget
+        self.folded = 0
+        self.summary_lines: List[str] = []
+        self.summary_tokens = 0
+        self._summary_message: Optional[Dict[str, str]] = None
+        self._summary_message_tokens = 0
+
+    def reset(self) -> None:
+        self.folded = 0
+        self.summary_lines = []
+        self.summary_tokens = 0
+        self._summary_message = None
+        self._summary_message_tokens = 0
+
+    def _fold(self, history: Sequence[Dict[str, str]], upto: int) -> None:
+        """history[folded:upto]를 요약에 덧붙입니다."""
+        for message in history[self.folded:upto]:
+            line = message["content"]
+            if len(line) > SUMMARY_LINE_CHARS:
+                line = line[:SUMMARY_LINE_CHARS] + "…"
+            self.summary_lines.append(f"- {line}")
+            self.summary_tokens += count_tokens(line) + 1
+
+        # 요약도 예산을 넘으면 가장 오래된 줄부터 버립니다.
+        while self.summary_tokens > SUMMARY_TOKEN_BUDGET and self.summary_lines:
+            self._drop_summary_line()
+
+        self.folded = upto
+        self._update_summary_message()
+
+    def _drop_summary_line(self) -> None:
+        dropped = self.summary_lines.pop(0)
+        self.summary_tokens -= count_tokens(dropped[2:]) + 1
+
+    def _update_summary_message(self) -> None:
+        if not self.summary_lines:
+            self._summary_message = None
+            self._summary_message_tokens = 0
+            return
+        self._summary_message = {
+            "role": "user",
+            "content": SUMMARY_HEADER + "\n" + "\n".join(self.summary_lines)
+        }
+        self._summary_message_tokens = count_tokens(self._summary_message["content"]) + TOKENS_PER_MESSAGE
+
+    @staticmethod
+    def _turn_boundary(history: Sequence[Dict[str, str]], index: int) -> int:
+        """index 이상에서 가장 가까운 턴 시작 위치. 답변(assistant)은 앞의 질문과 같은 턴이라 그 앞에서 자르지 않습니다."""
+        while index < len(history) and history[index]["role"] == "assistant":
+            index += 1
+        return index
+
+    def view(self, history: Sequence[Dict[str, str]], reserved_tokens: int = 0) -> List[Dict[str, str]]:
+        """LLM 호출에 넣을 대화 기록 (요약 메시지 + 최근 원문)
+
+        reserved_tokens는 시스템 프롬프트와 지시문처럼 같은 호출에 함께 들어갈 토큰 수입니다.
+        요약과 원문을 합친 토큰 수가 token_budget - reserved_tokens를 넘지 않도록, 질문과 답변을 한 턴으로 묶어 접습니다.
+        (액션 턴은 메시지 하나짜리 턴입니다)
+        """
+        # 1. 창이 fold 단위만큼 넘치면 오래된 턴을 요약으로 넘깁니다.
+        if len(history) - self.folded >= self.window_messages + self.fold_messages:
+            self._fold(history, self._turn_boundary(history, len(history) - self.window_messages))
+
+        # 2. 그래도 토큰 예산을 넘으면 원문을 앞에서부터 한 턴씩 더 접습니다.
+        budget = self.token_budget - reserved_tokens
+        recent = history[self.folded:]
+        while recent and self._view_tokens(recent) > budget:
+            self._fold(history, self._turn_boundary(history, self.folded + 1))
+            recent = history[self.folded:]
+
+        # 3. 원문을 모두 접어도 요약 때문에 예산을 넘으면 요약의 오래된 줄을 버립니다.
+        while self.summary_lines and self._view_tokens(recent) > budget:
+            self._drop_summary_line()
+            self._update_summary_message()
+
+        if self._summary_message is None:
+            return list(recent)
+        return [self._summary_message, *recent]
+
+    def _view_tokens(self, recent: Sequence[Dict[str, str]]) -> int:
+        return self._summary_message_tokens + count_message_tokens(recent)
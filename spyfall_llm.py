@@ -0,0 +1,873 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass, replace
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterator
+
+import httpx
+
+# --- 1. 설정 ---
+
+# 사용할 백엔드: "openai" / "ollama" / "stub"
+DEFAULT_BACKEND = os.environ.get("SPYFALL_LLM_BACKEND", "openai")
+
+DEFAULT_OPENAI_MODEL = os.environ.get("SPYFALL_OPENAI_MODEL", "gpt-4-turbo-preview")
+DEFAULT_OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+DEFAULT_OLLAMA_MODEL = os.environ.get("SPYFALL_OLLAMA_MODEL", "EEVE-Korean-10.8B")
+DEFAULT_OLLAMA_BASE_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+
+# 프로세스 전체에서 공유하는 HTTP 연결 풀 크기와 기본 타임아웃(초)
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE = 20
+HTTP_TIMEOUT_SEC = 60.0
+
+# 응답 캐시 (SQLite 파일 경로를 지정하면 켜짐)와 모드: "read_write" / "record" / "replay"
+DEFAULT_CACHE_PATH = os.environ.get("SPYFALL_LLM_CACHE")
+DEFAULT_CACHE_MODE = os.environ.get("SPYFALL_LLM_CACHE_MODE", "read_write")
+DEFAULT_CACHE_MAX_ENTRIES = 50000
+# 캐시 적중 때 last_used 갱신을 메모리에 모아 두었다가 한 번에 쓰는 최대 개수
+CACHE_TOUCH_FLUSH_BATCH = 256
+
+# 마이크로 배치: 한 배치의 최대 요청 수(1이면 끔), 배치를 모으는 최대 대기 시간(ms)
+DEFAULT_BATCH_MAX = int(os.environ.get("SPYFALL_LLM_BATCH_MAX", "1"))
+DEFAULT_BATCH_WAIT_MS = float(os.environ.get("SPYFALL_LLM_BATCH_WAIT_MS", "5"))
+# 로컬 서버가 동시에 처리하는 요청 수 (Ollama의 OLLAMA_NUM_PARALLEL과 맞춥니다)
+DEFAULT_PARALLEL_SLOTS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+
+# 호출 정책: 시도 한 번의 제한 시간과 재시도까지 포함한 전체 마감 시간(초), 최대 재시도 횟수
+DEFAULT_ATTEMPT_TIMEOUT_SEC = float(os.environ.get("SPYFALL_LLM_TIMEOUT_SEC", "30"))
+DEFAULT_DEADLINE_SEC = float(os.environ.get("SPYFALL_LLM_DEADLINE_SEC", "90"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("SPYFALL_LLM_MAX_RETRIES", "2"))
+# 지수 백오프 (base * 2^n, 최대 max)에 전체 지터를 섞습니다.
+RETRY_BACKOFF_BASE_SEC = 0.5
+RETRY_BACKOFF_MAX_SEC = 8.0
+# 서킷 브레이커: 연속 실패가 이 횟수에 닿으면 cooldown 동안 호출하지 않고 바로 실패합니다.
+DEFAULT_BREAKER_THRESHOLD = int(os.environ.get("SPYFALL_LLM_BREAKER_THRESHOLD", "5"))
+DEFAULT_BREAKER_COOLDOWN_SEC = float(os.environ.get("SPYFALL_LLM_BREAKER_COOLDOWN_SEC", "30"))
+# 헤징: 응답이 최근 지연 시간의 이 분위수보다 늦으면 같은 요청을 하나 더 보내 먼저 온 쪽을 씁니다. (기본 끔)
+DEFAULT_HEDGE = os.environ.get("SPYFALL_LLM_HEDGE", "") not in ("", "0")
+HEDGE_QUANTILE = 0.95
+# 분위수를 믿을 만큼 지연 시간 표본이 모이기 전에는 헤징하지 않습니다.
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+
+
+@dataclass
+class LLMResult:
+    """LLM 호출 한 번의 결과"""
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # 이 결과를 얻기까지 다시 시도한 횟수 (재시도하는 백엔드가 채웁니다)
+    retries: int = 0
+
+
+@dataclass
+class StreamInfo:
+    """스트리밍 호출 한 번의 부가 정보
+
+    스트림은 LLMResult를 돌려주지 않으므로, 부르는 쪽이 stream_chat(info=StreamInfo())로 넘기면 백엔드가 채웁니다.
+    래퍼 백엔드는 받은 info를 안쪽 백엔드에 그대로 넘깁니다.
+    """
+    # 첫 조각을 받기까지 다시 시도한 횟수 (재시도하는 백엔드가 채웁니다)
+    retries: int = 0
+    # 받는 쪽이 필요한 만큼 다 받고 일부러 스트림을 닫았는지 (부르는 쪽이 닫기 전에 채웁니다)
+    complete: bool = False
+
+
+# --- 2. 공유 HTTP 클라이언트 및 동기 호출용 이벤트 루프 ---
+
+# (base_url, 이벤트 루프) -> httpx.AsyncClient. 게임/세션마다 새로 만들지 않고 keep-alive 연결을 재사용합니다.
+_HTTP_CLIENTS: Dict[tuple, httpx.AsyncClient] = {}
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    key = (base_url, id(asyncio.get_running_loop()))
+    client = _HTTP_CLIENTS.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=HTTP_TIMEOUT_SEC,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+        _HTTP_CLIENTS[key] = client
+    return client
+
+
+_SYNC_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_SYNC_LOOP_LOCK = threading.Lock()
+
+def get_sync_loop() -> asyncio.AbstractEventLoop:
+    """동기 코드(Streamlit, 헤드리스 CLI)에서 비동기 백엔드를 부를 때 쓰는 백그라운드 이벤트 루프"""
+    global _SYNC_LOOP
+    with _SYNC_LOOP_LOCK:
+        if _SYNC_LOOP is None:
+            _SYNC_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_SYNC_LOOP.run_forever, name="spyfall-llm-loop", daemon=True).start()
+    return _SYNC_LOOP
+
+def submit(coro):
+    """코루틴을 백그라운드 루프에 올리고 concurrent.futures.Future를 돌려줍니다."""
+    return asyncio.run_coroutine_threadsafe(coro, get_sync_loop())
+
+def run_sync(coro):
+    return submit(coro).result()
+
+def iterate_sync(agen: AsyncIterator[str]) -> Iterator[str]:
+    """비동기 제너레이터를 동기 제너레이터로 감쌉니다.
+
+    소비하는 쪽이 중간에 멈추면(Streamlit write_stream 중단, 재실행) 백그라운드 루프에서 agen을 aclose해
+    HTTP 스트림과 측정/캐시 래퍼를 바로 닫습니다.
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(agen.aclose())
+
+
+# --- 3. 백엔드 ---
+
+class LLMBackend:
+    """LLM 백엔드 공통 인터페이스 (채팅 완성 + 스트리밍)"""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: float = 0.8,
+                   max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                   tools: Optional[List[Dict[str, Any]]] = None, tool_choice: Optional[str] = None) -> LLMResult:
+        raise NotImplementedError
+
+    async def stream_chat(self, messages: List[Dict[str, str]], temperature: float = 0.8,
+                          max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                          info: Optional[StreamInfo] = None) -> AsyncIterator[str]:
+        # 스트리밍을 따로 지원하지 않는 백엔드는 전체 응답을 한 조각으로 내보냅니다.
+        result = await self.chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop)
+        if info is not None:
+            info.retries = result.retries
+        yield result.content
+
+    async def chat_batch(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """여러 요청(chat 키워드 인자 dict 목록)을 한 번에 처리합니다.
+
+        배치 엔드포인트가 있는 서버라면 이 메서드를 덮어씁니다. 기본 구현은 요청을 동시에 보내고,
+        각 자리에는 결과 또는 예외가 들어갑니다.
+        """
+        return await asyncio.gather(*(self.chat(**request) for request in requests), return_exceptions=True)
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI 호환 /chat/completions HTTP 백엔드"""
+
+    name = "openai"
+
+    def __init__(self, model: str = DEFAULT_OPENAI_MODEL, api_key: Optional[str] = None,
+                 base_url: str = DEFAULT_OPENAI_BASE_URL):
+        super().__init__(model)
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.base_url = base_url.rstrip("/")
+
+    def _payload(self, messages, temperature, max_tokens, stop, stream, tools=None, tool_choice=None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": self.model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if stop:
+            payload["stop"] = stop
+        if tools:
+            payload["tools"] = tools
+            if tool_choice:
+                payload["tool_choice"] = tool_choice
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        client = get_http_client(self.base_url)
+        response = await client.post("/chat/completions", headers=self._headers(),
+                                     json=self._payload(messages, temperature, max_tokens, stop, False, tools, tool_choice))
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage") or {}
+        return LLMResult(
+            content=data["choices"][0]["message"].get("content") or "",
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        client = get_http_client(self.base_url)
+        async with client.stream("POST", "/chat/completions", headers=self._headers(),
+                                 json=self._payload(messages, temperature, max_tokens, stop, True)) as response:
+            response.raise_for_status()
+            # 서버 전송 이벤트(SSE): "data: {...}" 줄 단위, 마지막은 "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                if choices:
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+
+class OllamaBackend(LLMBackend):
+    """로컬 Ollama /api/chat 백엔드 (EEVE-Korean 등)"""
+
+    name = "ollama"
+
+    def __init__(self, model: str = DEFAULT_OLLAMA_MODEL, base_url: str = DEFAULT_OLLAMA_BASE_URL):
+        super().__init__(model)
+        self.base_url = base_url.rstrip("/")
+
+    def _payload(self, messages, temperature, max_tokens, stop, stream) -> Dict[str, Any]:
+        options: Dict[str, Any] = {"temperature": temperature}
+        if max_tokens is not None:
+            options["num_predict"] = max_tokens
+        if stop:
+            options["stop"] = stop
+        return {"model": self.model, "messages": messages, "stream": stream, "options": options}
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        # tool_choice="none"에 해당하는 옵션이 없으므로 도구 정의는 보내지 않습니다.
+        client = get_http_client(self.base_url)
+        response = await client.post("/api/chat", json=self._payload(messages, temperature, max_tokens, stop, False))
+        response.raise_for_status()
+        data = response.json()
+        return LLMResult(
+            content=data.get("message", {}).get("content", ""),
+            prompt_tokens=data.get("prompt_eval_count", 0),
+            completion_tokens=data.get("eval_count", 0),
+        )
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        client = get_http_client(self.base_url)
+        async with client.stream("POST", "/api/chat",
+                                 json=self._payload(messages, temperature, max_tokens, stop, True)) as response:
+            response.raise_for_status()
+            # 줄마다 JSON 객체 하나 (NDJSON), 마지막 줄은 "done": true
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                delta = data.get("message", {}).get("content")
+                if delta:
+                    yield delta
+                if data.get("done"):
+                    break
+
+
+# 스텁 백엔드가 돌려주는 답변 예시
+STUB_ANSWERS = [
+    "음, 그냥 평소처럼 내 일 하고 있어.",
+    "사람이 많을 때도 있고 한가할 때도 있어.",
+    "딱 잘라 말하긴 어렵지만 꽤 바쁜 편이야.",
+    "아마 다들 비슷하게 느낄걸?",
+    "그건 그날그날 달라.",
+]
+
+STUB_QUESTIONS = [
+    "여기 오면 제일 먼저 뭐 해?",
+    "여기서 입는 옷이 따로 있어?",
+    "여기 분위기를 한 단어로 말하면 뭐야?",
+    "여기는 주로 몇 시에 붐벼?",
+    "여기서 제일 시끄러운 건 뭐야?",
+]
+
+# 스텁 답변 중 이 비율만큼은 장소 단서를 흘립니다. (실제 모델처럼 단서가 대화에 쌓여 결정기가 움직이도록)
+# 비스파이는 자기 역할을, 스파이는 후보 목록의 아무 장소나 언급해 다른 장소로 유도합니다.
+STUB_ROLE_LEAK_RATE = 0.4
+# 비스파이 시스템 프롬프트의 "당신은 **장소**의 **역할**입니다" 부분
+_STUB_ROLE_PATTERN = re.compile(r"당신은 \*\*(.+?)\*\*의 \*\*(.+?)\*\*입니다")
+# 스파이 시스템 프롬프트의 "**후보 장소 목록:** 장소1, 장소2, ..." 부분
+_STUB_CANDIDATES_PATTERN = re.compile(r"\*\*후보 장소 목록:\*\* (.+)")
+
+class StubBackend(LLMBackend):
+    """테스트/벤치마크용 결정적 로컬 백엔드. 같은 메시지에는 항상 같은 응답을 돌려줍니다.
+
+    답변은 STUB_ROLE_LEAK_RATE 비율로 시스템 프롬프트의 역할(비스파이) 또는 후보 장소 하나(스파이)를 언급합니다.
+    """
+
+    name = "stub"
+
+    def __init__(self, model: str = "stub", latency_sec: float = 0.0, role_leak_rate: float = STUB_ROLE_LEAK_RATE):
+        super().__init__(model)
+        self.latency_sec = latency_sec
+        self.role_leak_rate = role_leak_rate
+
+    def _reply(self, messages: List[Dict[str, str]]) -> str:
+        last = messages[-1]["content"]
+        digest = int(hashlib.sha256(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest(), 16)
+        if "질문을 받았어" not in last:
+            return STUB_QUESTIONS[digest % len(STUB_QUESTIONS)]
+        answer = STUB_ANSWERS[digest % len(STUB_ANSWERS)]
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        if (digest >> 16) % 1000 >= self.role_leak_rate * 1000:
+            return answer
+        role = _STUB_ROLE_PATTERN.search(system)
+        if role is not None:
+            return f"나는 {role.group(2)}(으)로 일하니까 {answer}"
+        candidates = _STUB_CANDIDATES_PATTERN.search(system)
+        if candidates is not None:
+            locations = candidates.group(1).split(", ")
+            return f"{locations[(digest >> 32) % len(locations)]} 생각이 나네. {answer}"
+        return answer
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        if self.latency_sec:
+            await asyncio.sleep(self.latency_sec)
+        content = self._reply(messages)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 2
+        return LLMResult(content=content, prompt_tokens=prompt_tokens, completion_tokens=len(content) // 2)
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        result = await self.chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop)
+        for word in result.content.split(" "):
+            yield word + " "
+
+
+# --- 4. 마이크로 배치 ---
+
+class BatchingBackend(LLMBackend):
+    """대기 중인 생성 요청을 몇 ms 동안 모아 inner.chat_batch로 한꺼번에 넘기는 래퍼
+
+    여러 테이블이 동시에 "AI 답변" 단계에 있으면 요청이 한 배치로 묶여 로컬 서버의 병렬 슬롯(parallel_slots)을 채웁니다.
+    결과는 각 호출자에게 따로 돌아갑니다. 배치 하나에 max_batch개까지 모으고, 첫 요청 후 max_wait_ms가 지나면 보냅니다.
+    """
+
+    def __init__(self, inner: LLMBackend, max_batch: int = 8, max_wait_ms: float = DEFAULT_BATCH_WAIT_MS,
+                 parallel_slots: int = DEFAULT_PARALLEL_SLOTS):
+        super().__init__(inner.model)
+        self.inner = inner
+        self.name = inner.name
+        # 배치 하나가 서버의 병렬 슬롯 수를 넘으면 나머지는 서버에서 줄을 서므로, 슬롯 수로 자릅니다.
+        self.max_batch = max(1, min(max_batch, parallel_slots))
+        self.max_wait_sec = max_wait_ms / 1000.0
+        self.parallel_slots = parallel_slots
+        self.batches = 0
+        self.batched_requests = 0
+        # 이벤트 루프 id -> (요청 큐, 수집 태스크, 슬롯 세마포어)
+        self._loops: Dict[int, tuple] = {}
+
+    def _state(self) -> tuple:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(id(loop))
+        if state is None:
+            queue: asyncio.Queue = asyncio.Queue()
+            slots = asyncio.Semaphore(self.parallel_slots)
+            task = loop.create_task(self._collect(queue, slots))
+            state = self._loops[id(loop)] = (queue, task, slots)
+        return state
+
+    async def _collect(self, queue: asyncio.Queue, slots: asyncio.Semaphore) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait_sec
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # 요청 하나가 슬롯 하나를 차지합니다. 슬롯은 이 수집 태스크에서만 여러 개를 잡으므로 교착이 없습니다.
+            for _ in batch:
+                await slots.acquire()
+            loop.create_task(self._dispatch(batch, slots))
+
+    async def _dispatch(self, batch: List[tuple], slots: asyncio.Semaphore) -> None:
+        self.batches += 1
+        self.batched_requests += len(batch)
+        try:
+            results = await self.inner.chat_batch([request for request, _ in batch])
+        finally:
+            for _ in batch:
+                slots.release()
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        queue, _, _ = self._state()
+        future = asyncio.get_running_loop().create_future()
+        request = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens,
+                   "stop": stop, "tools": tools, "tool_choice": tool_choice}
+        await queue.put((request, future))
+        return await future
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        # 스트리밍은 묶지 않고 바로 보내되, 같은 병렬 슬롯을 씁니다.
+        _, _, slots = self._state()
+        async with slots:
+            async with aclosing(self.inner.stream_chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop, info=info)) as stream:
+                async for piece in stream:
+                    yield piece
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.batched_requests,
+            "avg_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+        }
+
+
+# --- 5. 응답 캐시 ---
+
+CACHE_MODES = ("read_write", "record", "replay")
+
+class CacheMiss(LookupError):
+    """replay 모드에서 캐시에 없는 요청을 받았을 때"""
+
+
+class CachedBackend(LLMBackend):
+    """같은 요청(모델, 메시지, 생성 옵션)의 응답을 SQLite에 저장해 재사용하는 래퍼
+
+    - read_write: 캐시에 있으면 재사용, 없으면 호출 후 저장
+    - record: 항상 실제로 호출하고 결과를 저장 (녹화)
+    - replay: 캐시만 사용하고, 없으면 CacheMiss (API 호출 0회)
+    항목 수가 max_entries를 넘으면 가장 오래 쓰이지 않은 항목부터 지웁니다 (LRU).
+    적중 때의 last_used 갱신은 메모리에 모아 두었다가 저장하거나 close할 때 한 번에 씁니다. (replay는 갱신하지 않음)
+    """
+
+    def __init__(self, inner: LLMBackend, path: str, mode: str = "read_write",
+                 max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"알 수 없는 캐시 모드: {mode}")
+        super().__init__(inner.model)
+        self.inner = inner
+        self.name = f"{inner.name}+cache"
+        self.mode = mode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # 아직 DB에 쓰지 않은 last_used 갱신 (key -> 시각)
+        self._touched: Dict[str, float] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, prompt_tokens INTEGER, "
+            "completion_tokens INTEGER, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def cache_key(model: str, messages: List[Dict[str, str]], temperature: float,
+                  max_tokens: Optional[int], stop: Optional[List[str]],
+                  tools: Optional[List[Dict[str, Any]]], tool_choice: Optional[str]) -> str:
+        # 줄 끝 공백 같은 의미 없는 차이는 지우고, 키 순서를 고정한 JSON의 해시를 키로 씁니다.
+        normalized = {
+            "model": model,
+            "messages": [{"role": m["role"], "content": m["content"].strip()} for m in messages],
+            "temperature": round(temperature, 3),
+            "max_tokens": max_tokens,
+            "stop": stop or None,
+            "tools": tools or None,
+            "tool_choice": tool_choice if tools else None,
+        }
+        payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[LLMResult]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, prompt_tokens, completion_tokens FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.mode != "replay":
+                self._touched[key] = time.time()
+                if len(self._touched) >= CACHE_TOUCH_FLUSH_BATCH:
+                    self._flush_touched()
+                    self._db.commit()
+        return LLMResult(content=row[0], prompt_tokens=row[1], completion_tokens=row[2])
+
+    def _flush_touched(self) -> None:
+        """모아 둔 last_used 갱신을 씁니다. (lock을 잡은 채 부르고, commit은 부르는 쪽이 합니다)"""
+        if self._touched:
+            self._db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                 [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _put(self, key: str, result: LLMResult) -> None:
+        with self._lock:
+            # 지울 항목을 고르기 전에 최근 사용 기록부터 반영합니다.
+            self._flush_touched()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, result.content, result.prompt_tokens, result.completion_tokens, time.time())
+            )
+            (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+                self.evictions += overflow
+            self._db.commit()
+
+    def _lookup(self, key: str) -> Optional[LLMResult]:
+        if self.mode == "record":
+            self.misses += 1
+            return None
+        cached = self._get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"replay 모드인데 캐시에 없는 요청입니다: {key[:12]}")
+        return None
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        key = self.cache_key(self.model, messages, temperature, max_tokens, stop, tools, tool_choice)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = await self.inner.chat(messages, temperature=temperature, max_tokens=max_tokens,
+                                       stop=stop, tools=tools, tool_choice=tool_choice)
+        self._put(key, result)
+        return result
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        key = self.cache_key(self.model, messages, temperature, max_tokens, stop, None, None)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield cached.content
+            return
+        parts = []
+        try:
+            async with aclosing(self.inner.stream_chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop, info=info)) as stream:
+                async for piece in stream:
+                    parts.append(piece)
+                    yield piece
+        except GeneratorExit:
+            # 받는 쪽이 충분히 받았다고 알린 경우(info.complete, 생성 정책의 조기 종료)만 그때까지의 내용을 저장합니다.
+            # 조기 종료는 받은 내용만으로 정해지므로 재생해도 같은 답이 됩니다. 그냥 버려진 스트림은 저장하지 않습니다.
+            if parts and info is not None and info.complete:
+                self._put(key, LLMResult(content="".join(parts)))
+            raise
+        # 끝까지 받은 응답을 저장합니다. (오류로 끊긴 응답은 여기까지 오지 않습니다)
+        self._put(key, LLMResult(content="".join(parts)))
+
+    def close(self) -> None:
+        """모아 둔 last_used 갱신을 쓰고 DB를 닫습니다."""
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+# --- 6. 재시도, 타임아웃, 서킷 브레이커, 헤징 ---
+
+class LLMTimeoutError(TimeoutError):
+    """시도 한 번이 제한 시간 안에 끝나지 않았을 때"""
+
+
+class CircuitOpenError(RuntimeError):
+    """연속 실패로 서킷이 열려 호출하지 않고 바로 실패할 때"""
+
+
+# 다시 시도해 볼 만한 HTTP 상태 (요청 과다, 서버 오류)
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+def is_retryable(error: BaseException) -> bool:
+    """일시적인 오류(시간 초과, 연결 오류, 429/5xx)만 재시도합니다. 요청 자체가 잘못된 4xx 등은 바로 올려 보냅니다."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (LLMTimeoutError, asyncio.TimeoutError, httpx.TransportError))
+
+
+class ResilientBackend(LLMBackend):
+    """inner 호출에 제한 시간, 지터 섞인 지수 백오프 재시도, 서킷 브레이커, 헤징을 붙이는 래퍼
+
+    - 시도마다 attempt_timeout, 재시도와 대기까지 합친 전체 호출은 deadline 안에 끝나야 합니다.
+    - 일시적인 오류만 max_retries번까지 다시 시도합니다. 429의 Retry-After가 있으면 그만큼 기다립니다.
+    - 연속 breaker_threshold번 실패하면 cooldown 동안 CircuitOpenError로 바로 실패합니다. cooldown이 지나면
+      시험 호출 하나만 보내고(half-open), 그 결과가 나올 때까지 나머지 호출은 계속 바로 실패시킵니다.
+    - hedge면 시도가 최근 성공 지연 시간의 p95보다 오래 걸릴 때 같은 요청을 하나 더 보내 먼저 끝난 쪽을 씁니다.
+    스트리밍은 첫 조각이 오기 전까지만 재시도합니다. (이미 내보낸 조각은 되돌릴 수 없으므로) 재시도 횟수는 stream_chat에 넘긴 StreamInfo에 남깁니다.
+    """
+
+    def __init__(self, inner: LLMBackend, attempt_timeout: float = DEFAULT_ATTEMPT_TIMEOUT_SEC,
+                 deadline: float = DEFAULT_DEADLINE_SEC, max_retries: int = DEFAULT_MAX_RETRIES,
+                 breaker_threshold: int = DEFAULT_BREAKER_THRESHOLD,
+                 breaker_cooldown: float = DEFAULT_BREAKER_COOLDOWN_SEC, hedge: bool = DEFAULT_HEDGE):
+        super().__init__(inner.model)
+        self.inner = inner
+        self.name = inner.name
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.hedge = hedge
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.breaker_trips = 0
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        # half-open 상태에서 시험 호출이 나가 있는지
+        self._probing = False
+        self._latencies: deque = deque(maxlen=HEDGE_WINDOW)
+        # 지터 전용 난수 (게임 난수와 섞이지 않게 따로 둡니다)
+        self._rng = random.Random()
+
+    # --- 서킷 브레이커 ---
+
+    def _check_breaker(self) -> bool:
+        """호출해도 되면 반환하고, 아니면 CircuitOpenError. 이 호출이 half-open 시험 호출이면 True"""
+        if self._opened_at is None:
+            return False
+        if self._probing or time.monotonic() - self._opened_at < self.breaker_cooldown:
+            raise CircuitOpenError(f"{self.name} 백엔드가 연속 {self._failures}번 실패해 잠시 호출을 멈췄습니다.")
+        self._probing = True
+        return True
+
+    def _end_probe(self, probe: bool) -> None:
+        """시험 호출이 (성공/실패/취소 어느 쪽이든) 끝났습니다. 실패했다면 _on_failure가 이미 cooldown을 다시 시작했습니다."""
+        if probe:
+            self._probing = False
+
+    def _on_success(self, latency: Optional[float] = None) -> None:
+        self._failures = 0
+        self._opened_at = None
+        if latency is not None:
+            self._latencies.append(latency)
+
+    def _on_failure(self) -> None:
+        self._failures += 1
+        # cooldown 뒤 시험 호출이 또 실패하면 (이미 기준을 넘었으므로) 바로 다시 열립니다.
+        if self._failures >= self.breaker_threshold:
+            if self._opened_at is None:
+                self.breaker_trips += 1
+            self._opened_at = time.monotonic()
+
+    # --- 재시도 ---
+
+    def _backoff(self, retry: int, error: BaseException) -> float:
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                return min(float(retry_after), RETRY_BACKOFF_MAX_SEC)
+        return self._rng.uniform(0, min(RETRY_BACKOFF_MAX_SEC, RETRY_BACKOFF_BASE_SEC * 2 ** retry))
+
+    async def _retry_wait(self, retries: int, error: BaseException, deadline_at: float) -> bool:
+        """재시도할 수 있으면 백오프만큼 기다린 뒤 True, 아니면 False"""
+        if not is_retryable(error) or retries >= self.max_retries:
+            return False
+        delay = self._backoff(retries, error)
+        if time.monotonic() + delay >= deadline_at:
+            return False
+        self.retries += 1
+        await asyncio.sleep(delay)
+        return True
+
+    def _attempt_timeout(self, deadline_at: float) -> float:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeoutError(f"LLM 호출이 마감 시간({self.deadline:.1f}초) 안에 끝나지 않았습니다.")
+        return min(self.attempt_timeout, remaining)
+
+    # --- 헤징 ---
+
+    def hedge_delay(self) -> Optional[float]:
+        """지금 두 번째 요청을 보낼 기준 시간(최근 성공 지연 시간의 p95). 헤징을 안 하면 None"""
+        if not self.hedge or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_QUANTILE))]
+
+    async def _hedged(self, request: Dict[str, Any]) -> LLMResult:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self.inner.chat(**request)
+        first = asyncio.ensure_future(self.inner.chat(**request))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.append(asyncio.ensure_future(self.inner.chat(**request)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_wins += task is not first
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 진 쪽 요청은 취소합니다.
+            for task in tasks:
+                task.cancel()
+
+    # --- 호출 ---
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        request = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens,
+                   "stop": stop, "tools": tools, "tool_choice": tool_choice}
+        deadline_at = time.monotonic() + self.deadline
+        retries = 0
+        while True:
+            probe = self._check_breaker()
+            try:
+                timeout = self._attempt_timeout(deadline_at)
+                started = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(self._hedged(request), timeout)
+                except asyncio.TimeoutError:
+                    error: Exception = LLMTimeoutError(f"LLM 응답이 {timeout:.1f}초 안에 오지 않았습니다.")
+                except Exception as e:
+                    error = e
+                else:
+                    self._on_success(time.monotonic() - started)
+                    return replace(result, retries=retries) if retries else result
+
+                if is_retryable(error):
+                    self._on_failure()
+            finally:
+                self._end_probe(probe)
+            if not await self._retry_wait(retries, error, deadline_at):
+                raise error
+            retries += 1
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        deadline_at = time.monotonic() + self.deadline
+        retries = 0
+        while True:
+            probe = self._check_breaker()
+            try:
+                timeout = self._attempt_timeout(deadline_at)
+                stream = self.inner.stream_chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop)
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), timeout)
+                    if probe:
+                        # 시험 호출에 첫 조각이 왔으면 백엔드가 살아난 것이므로 바로 닫힘 상태로 돌립니다.
+                        self._on_success()
+                    break
+                except StopAsyncIteration:
+                    self._on_success()
+                    return
+                except asyncio.TimeoutError:
+                    error: Exception = LLMTimeoutError(f"LLM 첫 응답이 {timeout:.1f}초 안에 오지 않았습니다.")
+                except Exception as e:
+                    error = e
+                await stream.aclose()
+                if is_retryable(error):
+                    self._on_failure()
+            finally:
+                self._end_probe(probe)
+            if not await self._retry_wait(retries, error, deadline_at):
+                raise error
+            retries += 1
+            if info is not None:
+                info.retries = retries
+
+        yield first
+        # 첫 조각 뒤로는 조각 사이 간격에만 제한 시간을 둡니다.
+        try:
+            while True:
+                try:
+                    piece = await asyncio.wait_for(stream.__anext__(), self.attempt_timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError(f"LLM 스트림이 {self.attempt_timeout:.1f}초 동안 멈췄습니다.") from None
+                yield piece
+        except Exception as e:
+            if is_retryable(e):
+                self._on_failure()
+            raise
+        finally:
+            await stream.aclose()
+        self._on_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breaker_trips": self.breaker_trips,
+            "breaker_open": self._opened_at is not None,
+            "breaker_probing": self._probing,
+            "hedge_delay_sec": self.hedge_delay(),
+        }
+
+
+def create_backend(kind: Optional[str] = None, model: Optional[str] = None,
+                   cache_path: Optional[str] = None, cache_mode: Optional[str] = None,
+                   batch_max: Optional[int] = None, hedge: Optional[bool] = None, **kwargs) -> LLMBackend:
+    """이름으로 백엔드를 만듭니다. kind/model/cache/batch/hedge를 생략하면 환경 변수 설정을 따릅니다.
+
+    감싸는 순서: 응답 캐시 -> 재시도/헤징 -> 마이크로 배치 -> 실제 백엔드 (캐시 적중은 재시도나 배치를 거치지 않음)
+    """
+    kind = (kind or DEFAULT_BACKEND).lower()
+    if kind == "openai":
+        backend: LLMBackend = OpenAIBackend(model=model or DEFAULT_OPENAI_MODEL, **kwargs)
+    elif kind == "ollama":
+        backend = OllamaBackend(model=model or DEFAULT_OLLAMA_MODEL, **kwargs)
+    elif kind == "stub":
+        backend = StubBackend(model=model or "stub", **kwargs)
+    else:
+        raise ValueError(f"알 수 없는 LLM 백엔드: {kind}")
+
+    batch_max = batch_max if batch_max is not None else DEFAULT_BATCH_MAX
+    if batch_max > 1:
+        backend = BatchingBackend(backend, max_batch=batch_max)
+
+    backend = ResilientBackend(backend, hedge=DEFAULT_HEDGE if hedge is None else hedge)
+
+    cache_path = cache_path or DEFAULT_CACHE_PATH
+    if cache_path:
+        backend = CachedBackend(backend, cache_path, mode=cache_mode or DEFAULT_CACHE_MODE)
+    return backend
+
+def backend_missing_config(kind: Optional[str] = None) -> Optional[str]:
+    """백엔드를 쓰는 데 필요한 설정이 빠졌으면 그 이름을, 아니면 None을 반환합니다."""
+    kind = (kind or DEFAULT_BACKEND).lower()
+    if DEFAULT_CACHE_MODE == "replay" and DEFAULT_CACHE_PATH:
+        return None
+    if kind == "openai" and not os.environ.get("OPENAI_API_KEY"):
+        return "OPENAI_API_KEY"
+    return None
@@ -0,0 +1,123 @@
+import os
+import sys
+from functools import lru_cache, cached_property
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+# --- 1. 설정 ---
+
+# 장소 팩 파일(<팩 이름>.txt)이 들어 있는 디렉터리
+LOCATION_PACK_DIR = os.environ.get(
+    "SPYFALL_LOCATION_PACKS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "locations")
+)
+DEFAULT_PACK = os.environ.get("SPYFALL_LOCATION_PACK", "classic")
+
+
+# --- 2. 문자열 테이블 ---
+
+class StringTable:
+    """장소/역할 이름을 정수 id로 바꿔 한 번만 저장하는 테이블 (여러 팩에 나오는 같은 역할은 같은 id)"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def intern(self, text: str) -> int:
+        text = sys.intern(text)
+        index = self.ids.get(text)
+        if index is None:
+            index = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def lookup(self, ids) -> Tuple[str, ...]:
+        return tuple(self.strings[i] for i in ids)
+
+
+STRINGS = StringTable()
+
+
+# --- 3. 장소 팩 ---
+
+class LocationPack:
+    """팩 하나의 장소와 역할을 id 배열로 들고 있는 클래스
+
+    역할은 장소 순서대로 이어 붙인 role_ids와, 장소마다 그 구간을 가리키는 role_offsets로 저장합니다.
+    {장소: 역할} dict, 스파이 프롬프트용 장소 이름 목록, 표시용 목록은 처음 쓸 때 한 번만 만듭니다.
+    (역할까지 담은 도감 문자열은 만들지 않습니다. 스파이 프롬프트에는 장소 이름과 유력 후보 몇 곳의 역할만 들어갑니다)
+    """
+
+    def __init__(self, name: str, title: str, location_ids: np.ndarray, role_ids: np.ndarray,
+                 role_offsets: np.ndarray):
+        self.name = name
+        self.title = title
+        self.location_ids = location_ids
+        self.role_ids = role_ids
+        self.role_offsets = role_offsets
+        self.locations: Tuple[str, ...] = STRINGS.lookup(location_ids)
+        self._position = {location: i for i, location in enumerate(self.locations)}
+
+    @classmethod
+    def parse(cls, name: str, text: str) -> "LocationPack":
+        """한 줄에 "장소: 역할, 역할, ..." 형식인 팩 파일을 읽습니다. 첫 "#" 줄은 팩 제목입니다."""
+        title = name
+        location_ids, role_ids, role_offsets = [], [], [0]
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                if len(location_ids) == 0:
+                    title = line.lstrip("#").strip() or name
+                continue
+            location, _, roles = line.partition(":")
+            roles = [r.strip() for r in roles.split(",") if r.strip()]
+            if not location.strip() or not roles:
+                raise ValueError(f"장소 팩 '{name}'의 줄 형식이 잘못되었습니다: {line}")
+            location_ids.append(STRINGS.intern(location.strip()))
+            role_ids.extend(STRINGS.intern(r) for r in roles)
+            role_offsets.append(len(role_ids))
+        return cls(name, title, np.asarray(location_ids, dtype=np.int32), np.asarray(role_ids, dtype=np.int32),
+                   np.asarray(role_offsets, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __contains__(self, location: str) -> bool:
+        return location in self._position
+
+    def roles_of(self, location: str) -> Tuple[str, ...]:
+        i = self._position[location]
+        return STRINGS.lookup(self.role_ids[self.role_offsets[i]:self.role_offsets[i + 1]])
+
+    @cached_property
+    def data(self) -> Dict[str, List[str]]:
+        """{장소: [역할, ...]} (ActionDecider/임베딩 인덱스 입력용)"""
+        return {location: list(self.roles_of(location)) for location in self.locations}
+
+    @cached_property
+    def location_list(self) -> str:
+        """스파이 시스템 프롬프트에 넣는 장소 이름 목록"""
+        return ", ".join(self.locations)
+
+    @cached_property
+    def display_list(self) -> str:
+        """Streamlit 표시용 장소 목록"""
+        return "\n".join(self.locations)
+
+
+def available_packs() -> List[str]:
+    """팩 디렉터리의 팩 이름 목록 (파일을 읽지는 않습니다)"""
+    if not os.path.isdir(LOCATION_PACK_DIR):
+        return []
+    return sorted(entry.name[:-4] for entry in os.scandir(LOCATION_PACK_DIR) if entry.name.endswith(".txt"))
+
+@lru_cache(maxsize=None)
+def load_pack(name: str = DEFAULT_PACK) -> LocationPack:
+    """팩을 처음 요청받을 때 한 번만 읽습니다."""
+    path = os.path.join(LOCATION_PACK_DIR, f"{name}.txt")
+    if not os.path.exists(path):
+        raise ValueError(f"장소 팩 '{name}'을(를) 찾을 수 없습니다. (사용 가능: {', '.join(available_packs())})")
+    with open(path, encoding="utf-8") as f:
+        return LocationPack.parse(name, f.read())
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from spyfall_history import Turn
+
+# 게임 저장 SQLite 파일 경로 (지정하면 게임을 저장하고 id로 이어 할 수 있습니다)
+DEFAULT_GAME_DB = os.environ.get("SPYFALL_GAME_DB")
+
+# 턴마다 바뀌는 게임 상태 열 (엔진 속성 이름과 같습니다)
+STATE_COLUMNS = ("game_phase", "current_player_index", "current_target", "current_question",
+                 "turn_count", "winner", "game_result")
+
+
+class GameStore:
+    """게임 상태를 SQLite에 저장하고 불러오는 클래스
+
+    게임을 시작할 때 플레이어/장소 같은 고정 정보를 한 번 저장하고,
+    이후에는 턴마다 새 턴 한 줄 추가 + 작은 상태 열 갱신만 합니다 (전체를 다시 직렬화하지 않음).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # 턴마다 쓰기가 일어나므로 WAL + NORMAL 동기화로 커밋 비용을 줄입니다.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "id TEXT PRIMARY KEY, pack TEXT NOT NULL, player_names TEXT NOT NULL, human_name TEXT, "
+            "players TEXT NOT NULL, chosen_location TEXT NOT NULL, "
+            "game_phase TEXT NOT NULL, current_player_index INTEGER NOT NULL, current_target TEXT, "
+            "current_question TEXT, turn_count INTEGER NOT NULL, winner TEXT, game_result TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL, rng_state TEXT)"
+        )
+        # rng_state 열이 생기기 전에 만든 파일은 열만 덧붙입니다. (그런 게임은 이어 할 때 난수가 새로 시작됩니다)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(games)")]
+        if "rng_state" not in columns:
+            self._db.execute("ALTER TABLE games ADD COLUMN rng_state TEXT")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "game_id TEXT NOT NULL, seq INTEGER NOT NULL, kind TEXT NOT NULL, speaker TEXT NOT NULL, "
+            "target TEXT, text TEXT NOT NULL, PRIMARY KEY (game_id, seq))"
+        )
+        self._db.commit()
+
+    def _state(self, engine) -> Tuple:
+        return tuple(getattr(engine, column) for column in STATE_COLUMNS)
+
+    def _rng_state(self, engine) -> str:
+        """엔진 난수 상태 (이어 한 게임이 끊기지 않은 게임과 같은 대상/역할을 고르도록)"""
+        return json.dumps(engine.rng.getstate())
+
+    def create(self, engine) -> None:
+        """새 게임의 고정 정보와 초기 상태를 저장합니다."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (engine.game_id, engine.pack.name, json.dumps(engine.player_names_list, ensure_ascii=False),
+                 engine.human_name, json.dumps(engine.players, ensure_ascii=False), engine.chosen_location,
+                 *self._state(engine), now, now, self._rng_state(engine))
+            )
+            self._db.commit()
+
+    def checkpoint(self, engine, turn: Optional[Turn] = None) -> None:
+        """마지막 턴(있으면)을 덧붙이고 상태 열을 갱신합니다. 한 트랜잭션으로 씁니다."""
+        assignments = ", ".join(f"{column} = ?" for column in STATE_COLUMNS)
+        with self._lock:
+            if turn is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO turns VALUES (?, ?, ?, ?, ?, ?)",
+                    (engine.game_id, len(engine.turns) - 1, turn.kind, turn.speaker, turn.target, turn.text)
+                )
+            self._db.execute(f"UPDATE games SET {assignments}, updated = ?, rng_state = ? WHERE id = ?",
+                             (*self._state(engine), time.time(), self._rng_state(engine), engine.game_id))
+            self._db.commit()
+
+    def load(self, game_id: str) -> Tuple[Dict[str, Any], List[Turn]]:
+        """(게임 정보, 턴 목록). 없는 id면 KeyError"""
+        with self._lock:
+            self._db.row_factory = sqlite3.Row
+            try:
+                row = self._db.execute("SELECT * FROM games WHERE id = ?", (game_id,)).fetchone()
+                turn_rows = self._db.execute(
+                    "SELECT kind, speaker, target, text FROM turns WHERE game_id = ? ORDER BY seq", (game_id,)
+                ).fetchall()
+            finally:
+                self._db.row_factory = None
+        if row is None:
+            raise KeyError(f"저장된 게임이 없습니다: {game_id}")
+        state = dict(row)
+        state["player_names"] = json.loads(state["player_names"])
+        state["players"] = json.loads(state["players"])
+        if state["rng_state"] is not None:
+            version, internal, gauss_next = json.loads(state["rng_state"])
+            state["rng_state"] = (version, tuple(internal), gauss_next)
+        return state, [Turn(*t) for t in turn_rows]
+
+    def unfinished_games(self, bots_only: bool = False) -> List[str]:
+        """아직 끝나지 않은 게임 id (오래된 순). bots_only면 사람 플레이어가 없는 봇전만"""
+        query = "SELECT id FROM games WHERE game_phase != 'finished'"
+        if bots_only:
+            query += " AND human_name IS NULL"
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY created").fetchall()
+        return [r[0] for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
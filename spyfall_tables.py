@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator, Hashable
+
+from spyfall_engine import SpyfallEngine, BOT_PLAYER_NAMES, DEFAULT_MAX_TURNS, summarize_results
+from spyfall_llm import LLMBackend, LLMResult
+
+# 지금 실행 중인 코루틴이 속한 테이블 (공정 스케줄링 키)
+current_table: contextvars.ContextVar = contextvars.ContextVar("spyfall_table", default=None)
+
+# 기본값: 동시에 날아가는 LLM 요청 최대 16개
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+# --- 1. 동시성 제한 도구 ---
+
+class FairLimiter:
+    """동시에 진행 중인 요청 수를 제한하면서, 빈자리가 나면 기다리는 테이블들에 돌아가며(라운드 로빈) 배분하는 클래스
+
+    한 테이블이 요청을 많이 쌓아도 다른 테이블이 굶지 않습니다.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: Dict[Hashable, deque] = {}
+        self._order: deque = deque()
+
+    async def acquire(self, key: Hashable) -> None:
+        if self.in_flight < self.limit and not self._order:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiters.get(key)
+        if queue is None:
+            queue = self._waiters[key] = deque()
+            self._order.append(key)
+        queue.append(future)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 자리를 받은 직후에 취소되었으면 자리를 돌려줍니다.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self.in_flight < self.limit and self._order:
+            key = self._order.popleft()
+            queue = self._waiters[key]
+            future = queue.popleft()
+            if queue:
+                self._order.append(key)
+            else:
+                del self._waiters[key]
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+
+class TokenBucket:
+    """초당 rate개씩 채워지고 최대 capacity개까지 모이는 토큰 버킷 (요청 속도 제한)"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class ScheduledBackend(LLMBackend):
+    """스케줄러의 전역 동시성 제한과 백엔드별 속도 제한을 거쳐 inner 백엔드를 호출하는 래퍼"""
+
+    def __init__(self, inner: LLMBackend, limiter: FairLimiter, bucket: Optional[TokenBucket]):
+        super().__init__(inner.model)
+        self.inner = inner
+        self.name = inner.name
+        self.limiter = limiter
+        self.bucket = bucket
+
+    async def _admit(self) -> None:
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        await self.limiter.acquire(current_table.get())
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None) -> LLMResult:
+        await self._admit()
+        try:
+            return await self.inner.chat(messages, temperature=temperature, max_tokens=max_tokens,
+                                         stop=stop, tools=tools, tool_choice=tool_choice)
+        finally:
+            self.limiter.release()
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None) -> AsyncIterator[str]:
+        await self._admit()
+        try:
+            async with aclosing(self.inner.stream_chat(messages, temperature=temperature, max_tokens=max_tokens, stop=stop, info=info)) as stream:
+                async for piece in stream:
+                    yield piece
+        finally:
+            self.limiter.release()
+
+
+# --- 2. 테이블 스케줄러 ---
+
+class TableScheduler:
+    """하나의 asyncio 이벤트 루프에서 여러 스파이폴 테이블을 동시에 진행하는 스케줄러"""
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.limiter = FairLimiter(max_in_flight)
+        self._buckets: Dict[tuple, TokenBucket] = {}
+
+    def wrap(self, backend: LLMBackend, requests_per_sec: Optional[float] = None,
+             burst: Optional[float] = None) -> LLMBackend:
+        """backend를 스케줄러 제한 아래에 둡니다. 같은 백엔드/모델은 토큰 버킷 하나를 공유합니다."""
+        bucket = None
+        if requests_per_sec:
+            key = (backend.name, backend.model)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(requests_per_sec, burst)
+        return ScheduledBackend(backend, self.limiter, bucket)
+
+    async def run_table(self, table_id: Hashable, engine: SpyfallEngine,
+                        max_turns: int = DEFAULT_MAX_TURNS) -> Dict[str, Any]:
+        token = current_table.set(table_id)
+        try:
+            return await engine.arun_to_completion(max_turns=max_turns)
+        finally:
+            current_table.reset(token)
+
+    async def run_bot_tables(self, backend: LLMBackend, num_tables: int, max_turns: int = DEFAULT_MAX_TURNS,
+                             pack: Optional[str] = None, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+        """AI 8명 테이블 num_tables개를 동시에 끝까지 진행합니다. backend는 wrap()으로 감싼 것이어야 합니다."""
+        engines = [SpyfallEngine(backend, player_names=BOT_PLAYER_NAMES, human_name=None, pack=pack,
+                                 seed=None if seed is None else seed + i)
+                   for i in range(num_tables)]
+        return await asyncio.gather(*(self.run_table(i, engine, max_turns) for i, engine in enumerate(engines)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    import sys
+    from dotenv import load_dotenv
+    from spyfall_llm import create_backend, backend_missing_config
+
+    parser = argparse.ArgumentParser(description="여러 스파이폴 봇전 테이블을 한 프로세스에서 동시에 진행")
+    parser.add_argument("--tables", type=int, default=50, help="동시에 진행할 테이블 수")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="게임당 최대 턴 수")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="동시에 진행 중인 LLM 요청 최대 수")
+    parser.add_argument("--rps", type=float, default=None, help="백엔드당 초당 요청 수 제한")
+    parser.add_argument("--burst", type=float, default=None, help="토큰 버킷 최대 크기")
+    parser.add_argument("--backend", default=None, help="LLM 백엔드 (openai / ollama / stub)")
+    parser.add_argument("--model", default=None, help="모델 이름")
+    parser.add_argument("--batch-max", type=int, default=None, help="마이크로 배치 최대 크기 (1이면 끔)")
+    parser.add_argument("--pack", default=None, help="장소 팩 이름")
+    parser.add_argument("--seed", type=int, default=None, help="난수 시드 (테이블 i는 seed + i)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    missing = backend_missing_config(args.backend)
+    if missing:
+        print(f"환경 변수 '{missing}'를 찾을 수 없습니다.", file=sys.stderr)
+        sys.exit(1)
+
+    async def run() -> Dict[str, Any]:
+        scheduler = TableScheduler(args.max_in_flight)
+        backend = scheduler.wrap(create_backend(args.backend, args.model, batch_max=args.batch_max), args.rps, args.burst)
+        started = time.time()
+        results = await scheduler.run_bot_tables(backend, args.tables, args.max_turns, args.pack, args.seed)
+        return summarize_results(results, time.time() - started)
+
+    stats = asyncio.run(run())
+    print(f"테이블 수: {stats['games']} | 스파이 승률: {stats['spy_win_rate']:.1%} | "
+          f"평균 턴: {stats['avg_turns']:.1f} | 소요 시간: {stats['elapsed_sec']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+
+from spyfall_history import count_tokens, count_message_tokens
+from spyfall_llm import LLMBackend, LLMResult, StreamInfo
+
+# --- 1. 설정 ---
+
+# LLM 호출 기록을 한 줄에 하나씩(JSONL) 덧붙일 파일 경로 (지정하지 않으면 메모리 집계만 합니다)
+DEFAULT_TELEMETRY_LOG = os.environ.get("SPYFALL_TELEMETRY_LOG")
+# Prometheus 텍스트 형식 지표를 내보낼 HTTP 포트 (지정하면 /metrics를 엽니다)
+DEFAULT_METRICS_PORT = int(os.environ["SPYFALL_METRICS_PORT"]) if os.environ.get("SPYFALL_METRICS_PORT") else None
+# 게임별 집계를 들고 있을 최근 게임 수 (오래된 게임부터 버립니다)
+MAX_GAME_ROLLUPS = 256
+# 지연 시간 히스토그램 구간(초)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+# 모델별 1천 토큰당 가격(USD): (프롬프트, 응답). 목록에 없는 모델(로컬 모델 등)은 0으로 칩니다.
+PRICE_PER_1K_TOKENS = {
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+@dataclass
+class CallRecord:
+    """LLM 호출 한 번의 측정값
+
+    ttft는 첫 조각이 도착하기까지 걸린 시간입니다. 스트리밍하지 않는 호출은 전체 응답이 첫 조각이므로 latency와 같습니다.
+    토큰 수를 백엔드가 알려 주지 않으면(스트리밍, 스텁) spyfall_history.count_tokens로 어림하고 usage_source를 "estimate"로 남깁니다.
+    cancelled는 부르는 쪽이 호출을 취소한 경우(미리 생성한 질문을 버릴 때 등)이며 오류로 세지 않습니다.
+    """
+    ts: float
+    game_id: Optional[str]
+    player: str
+    phase: str  # "question" 또는 "answer"
+    backend: str
+    model: str
+    stream: bool
+    prompt_tokens: int
+    completion_tokens: int
+    usage_source: str  # "backend" 또는 "estimate"
+    ttft: float
+    latency: float
+    retries: int
+    cost: float
+    error: Optional[str] = None
+    cancelled: bool = False
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = PRICE_PER_1K_TOKENS.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+# --- 2. 집계 ---
+
+class _Rollup:
+    """호출 수, 오류, 재시도, 토큰, 비용, 지연 시간 합계 (라벨 조합 하나 또는 게임 하나의 (단계, 플레이어)별)
+
+    취소된 호출은 호출 수와 토큰/비용에는 넣지만, 끝까지 기다린 호출이 아니므로 지연 시간/TTFT 통계에서는 뺍니다.
+    """
+
+    __slots__ = ("calls", "errors", "cancelled", "retries", "prompt_tokens", "completion_tokens", "cost",
+                 "latency_sum", "ttft_sum", "latency_max", "latency_buckets", "ttft_buckets")
+
+    def __init__(self):
+        self.calls = self.errors = self.cancelled = self.retries = self.prompt_tokens = self.completion_tokens = 0
+        self.cost = self.latency_sum = self.ttft_sum = self.latency_max = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.ttft_buckets = [0] * len(LATENCY_BUCKETS)
+
+    @property
+    def timed(self) -> int:
+        """지연 시간 통계에 들어간 호출 수"""
+        return self.calls - self.cancelled
+
+    def add(self, record: CallRecord) -> None:
+        self.calls += 1
+        self.errors += record.error is not None
+        self.retries += record.retries
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cost += record.cost
+        if record.cancelled:
+            self.cancelled += 1
+            return
+        self.latency_sum += record.latency
+        self.ttft_sum += record.ttft
+        self.latency_max = max(self.latency_max, record.latency)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            self.latency_buckets[i] += record.latency <= bound
+            self.ttft_buckets[i] += record.ttft <= bound
+
+    def as_row(self) -> Dict[str, Any]:
+        calls = self.timed or 1
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "retries": self.retries,
+            "avg_ttft_ms": self.ttft_sum / calls * 1000,
+            "avg_latency_ms": self.latency_sum / calls * 1000,
+            "max_latency_ms": self.latency_max * 1000,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": self.cost,
+        }
+
+
+class Telemetry:
+    """LLM 호출 기록을 받아 라벨별 누적 지표, 게임별 집계, JSONL 로그로 나눠 담는 클래스
+
+    기록 하나는 O(히스토그램 구간 수)로 반영되고, 대화 기록이나 이전 호출을 다시 읽지 않습니다.
+    여러 게임/스레드가 함께 쓰므로 잠금 하나로 보호합니다.
+    """
+
+    def __init__(self, log_path: Optional[str] = DEFAULT_TELEMETRY_LOG, max_games: int = MAX_GAME_ROLLUPS):
+        self.log_path = log_path
+        self.max_games = max_games
+        self._lock = threading.Lock()
+        # (backend, model, phase, player) -> 누적 지표 (Prometheus 내보내기용)
+        self._series: Dict[Tuple[str, str, str, str], _Rollup] = {}
+        # game_id -> (phase, player) -> 집계
+        self._games: "OrderedDict[str, Dict[Tuple[str, str], _Rollup]]" = OrderedDict()
+        self._log = open(log_path, "a", encoding="utf-8") if log_path else None
+
+    def record(self, record: CallRecord) -> None:
+        key = (record.backend, record.model, record.phase, record.player)
+        with self._lock:
+            self._series.setdefault(key, _Rollup()).add(record)
+            if record.game_id is not None:
+                game = self._games.get(record.game_id)
+                if game is None:
+                    game = self._games[record.game_id] = {}
+                    while len(self._games) > self.max_games:
+                        self._games.popitem(last=False)
+                game.setdefault((record.phase, record.player), _Rollup()).add(record)
+            if self._log is not None:
+                self._log.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+                self._log.flush()
+
+    def game_rollup(self, game_id: str) -> List[Dict[str, Any]]:
+        """game_id 게임의 (단계, 플레이어)별 집계 행 목록 (총 지연 시간이 큰 순)"""
+        with self._lock:
+            game = self._games.get(game_id, {})
+            rows = [{"phase": phase, "player": player, **rollup.as_row()} for (phase, player), rollup in game.items()]
+        return sorted(rows, key=lambda row: row["avg_latency_ms"] * (row["calls"] - row["cancelled"]), reverse=True)
+
+    def prometheus_text(self) -> str:
+        """누적 지표를 Prometheus 텍스트 노출 형식으로 만듭니다."""
+        with self._lock:
+            series = [(key, rollup.as_row(), list(rollup.latency_buckets), list(rollup.ttft_buckets),
+                       rollup.latency_sum, rollup.ttft_sum, rollup.timed)
+                      for key, rollup in sorted(self._series.items())]
+
+        lines = []
+        counters = (
+            ("spyfall_llm_calls_total", "LLM 호출 수", "calls"),
+            ("spyfall_llm_errors_total", "실패한 LLM 호출 수", "errors"),
+            ("spyfall_llm_cancelled_total", "취소된 LLM 호출 수 (지연 시간 히스토그램에서 제외)", "cancelled"),
+            ("spyfall_llm_retries_total", "LLM 재시도 수", "retries"),
+            ("spyfall_llm_prompt_tokens_total", "프롬프트 토큰 수", "prompt_tokens"),
+            ("spyfall_llm_completion_tokens_total", "응답 토큰 수", "completion_tokens"),
+            ("spyfall_llm_cost_usd_total", "추정 비용(USD)", "cost_usd"),
+        )
+        for name, help_text, field in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f"{name}{{{_labels(key)}}} {row[field]}" for key, row, *_ in series]
+
+        histograms = (
+            ("spyfall_llm_latency_seconds", "LLM 호출 전체 지연 시간 (취소된 호출 제외)", 2, 4),
+            ("spyfall_llm_ttft_seconds", "첫 조각까지 걸린 시간 (취소된 호출 제외)", 3, 5),
+        )
+        for name, help_text, bucket_field, sum_field in histograms:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for entry in series:
+                key, timed = entry[0], entry[6]
+                labels = _labels(key)
+                for bound, count in zip(LATENCY_BUCKETS, entry[bucket_field]):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {timed}')
+                lines.append(f"{name}_sum{{{labels}}} {entry[sum_field]}")
+                lines.append(f"{name}_count{{{labels}}} {timed}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """node_exporter textfile 수집기용 파일로 씁니다. (임시 파일에 쓴 뒤 교체)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+def _labels(key: Tuple[str, str, str, str]) -> str:
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(("backend", "model", "phase", "player"), key))
+
+
+# 프로세스 전체에서 공유하는 기본 수집기 (SpyfallEngine이 따로 받지 않으면 이것을 씁니다)
+TELEMETRY = Telemetry()
+
+
+# --- 3. 측정하며 LLM 호출 ---
+
+def _finish(telemetry: Telemetry, backend: LLMBackend, messages, game_id: Optional[str], player: str, phase: str,
+            stream: bool, started: float, first_token: Optional[float], content: str,
+            result: Optional[LLMResult] = None, error: Optional[BaseException] = None,
+            cancelled: bool = False, info: Optional[StreamInfo] = None) -> None:
+    now = time.perf_counter()
+    if result is not None and (result.prompt_tokens or result.completion_tokens):
+        prompt_tokens, completion_tokens, usage_source = result.prompt_tokens, result.completion_tokens, "backend"
+    else:
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(content) if content else 0
+        usage_source = "estimate"
+    telemetry.record(CallRecord(
+        ts=time.time(),
+        game_id=game_id,
+        player=player,
+        phase=phase,
+        backend=backend.name,
+        model=backend.model,
+        stream=stream,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        usage_source=usage_source,
+        ttft=(first_token if first_token is not None else now) - started,
+        latency=now - started,
+        retries=result.retries if result is not None else info.retries if info is not None else 0,
+        cost=call_cost(backend.model, prompt_tokens, completion_tokens),
+        error=None if error is None else f"{type(error).__name__}: {error}".rstrip(": "),
+        cancelled=cancelled,
+    ))
+
+async def timed_chat(telemetry: Optional[Telemetry], backend: LLMBackend, messages: List[Dict[str, str]],
+                     game_id: Optional[str], player: str, phase: str, **kwargs) -> LLMResult:
+    """backend.chat을 부르고 측정값을 telemetry에 남깁니다. 예외는 기록한 뒤 그대로 올려 보냅니다."""
+    if telemetry is None:
+        return await backend.chat(messages, **kwargs)
+    started = time.perf_counter()
+    try:
+        result = await backend.chat(messages, **kwargs)
+    except asyncio.CancelledError:
+        _finish(telemetry, backend, messages, game_id, player, phase, False, started, None, "", cancelled=True)
+        raise
+    except BaseException as e:
+        _finish(telemetry, backend, messages, game_id, player, phase, False, started, None, "", error=e)
+        raise
+    _finish(telemetry, backend, messages, game_id, player, phase, False, started, None, result.content, result)
+    return result
+
+async def timed_stream(telemetry: Optional[Telemetry], backend: LLMBackend, messages: List[Dict[str, str]],
+                       game_id: Optional[str], player: str, phase: str, info: Optional[StreamInfo] = None,
+                       **kwargs) -> AsyncIterator[str]:
+    """backend.stream_chat을 그대로 흘려보내며 첫 조각 도착 시간과 전체 시간을 잽니다.
+
+    받는 쪽이 중간에 멈추면(aclose) 그때까지 받은 내용으로 기록합니다.
+    재시도 횟수는 stream_chat에 넘긴 StreamInfo로 받습니다. info를 넘기면 그것을 그대로 백엔드에 넘깁니다.
+    """
+    if telemetry is None:
+        async with aclosing(backend.stream_chat(messages, info=info, **kwargs)) as stream:
+            async for piece in stream:
+                yield piece
+        return
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    info = info or StreamInfo()
+    try:
+        async with aclosing(backend.stream_chat(messages, info=info, **kwargs)) as stream:
+            async for piece in stream:
+                if first_token is None and piece:
+                    first_token = time.perf_counter()
+                parts.append(piece)
+                yield piece
+    except GeneratorExit:
+        # 생성 정책이 충분한 답을 받고 일찍 닫은 경우: 오류가 아니라 그때까지의 정상 응답입니다.
+        _finish(telemetry, backend, messages, game_id, player, phase, True, started, first_token, "".join(parts),
+                info=info)
+        raise
+    except asyncio.CancelledError:
+        # 부르는 쪽이 작업을 취소한 경우: 백엔드 오류가 아니므로 취소로 남깁니다.
+        _finish(telemetry, backend, messages, game_id, player, phase, True, started, first_token, "".join(parts),
+                cancelled=True, info=info)
+        raise
+    except BaseException as e:
+        _finish(telemetry, backend, messages, game_id, player, phase, True, started, first_token, "".join(parts),
+                error=e, info=info)
+        raise
+    _finish(telemetry, backend, messages, game_id, player, phase, True, started, first_token, "".join(parts),
+            info=info)
+
+
+# --- 4. Prometheus 노출 ---
+
+def start_metrics_server(port: int, telemetry: Optional[Telemetry] = None, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """백그라운드 스레드에서 GET /metrics에 Prometheus 텍스트 형식으로 응답하는 서버를 엽니다."""
+    telemetry = telemetry or TELEMETRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="spyfall-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 모듈이 저장소 최상위에 평평하게 있으므로, pytest를 어디서 실행해도 가져올 수 있게 경로를 더합니다.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,56 @@
+from spyfall_actions import ActionDecider
+from spyfall_engine import SpyfallEngine, BOT_PLAYER_NAMES, DEFAULT_MAX_TURNS
+from spyfall_history import Turn
+from spyfall_llm import StubBackend
+
+LOCATIONS = {
+    "병원": ["의사", "간호사", "환자"],
+    "학교": ["선생님", "학생", "교장"],
+    "공항": ["조종사", "승무원", "승객"],
+}
+PLAYERS = ["가", "나", "다", "라"]
+
+
+def tracker_with(decider, lines):
+    tracker = decider.new_tracker(PLAYERS)
+    for speaker, text in lines:
+        tracker.observe(Turn("answer", speaker, None, text))
+    return tracker
+
+
+def player(name, is_spy):
+    return {"name": name, "is_spy": is_spy}
+
+
+def test_accuse_fires_on_off_location_clues():
+    decider = ActionDecider(LOCATIONS)
+    tracker = tracker_with(decider, [("나", "나는 간호사라서 바빠"), ("다", "공항 조종사랑 승무원"), ("라", "환자가 많아")])
+    decision = decider.decide(tracker, player("가", False), "병원", turn_count=6)
+    assert decision is not None
+    assert (decision.action_type, decision.action_data) == ("accuse_spy", "다")
+
+
+def test_guess_fires_on_location_clues():
+    decider = ActionDecider(LOCATIONS)
+    tracker = tracker_with(decider, [("나", "학교 종이 울려"), ("다", "학생들이 시끄러워"), ("라", "교장 선생님이 오셨어")])
+    decision = decider.decide(tracker, player("가", True), None, turn_count=6)
+    assert decision is not None
+    assert (decision.action_type, decision.action_data) == ("guess_location", "학교")
+
+
+def test_thresholds_are_configurable():
+    lines = [("나", "나는 간호사라서 바빠"), ("다", "공항 조종사랑 승무원"), ("라", "환자가 많아")]
+    strict = ActionDecider(LOCATIONS, accuse_min_score=10.0)
+    assert strict.decide(tracker_with(strict, lines), player("가", False), "병원", turn_count=6) is None
+    assert ActionDecider(LOCATIONS).decide(tracker_with(strict, lines), player("가", False), "병원", turn_count=2) is None
+
+
+def test_seeded_stub_games_end_by_action():
+    early = 0
+    for seed in range(10):
+        engine = SpyfallEngine(StubBackend(), player_names=BOT_PLAYER_NAMES, human_name=None, seed=seed)
+        engine.run_to_completion()
+        if engine.turn_count < DEFAULT_MAX_TURNS:
+            assert any(turn.kind == "action" for turn in engine.turns)
+            early += 1
+    assert early > 0
@@ -0,0 +1,20 @@
+from spyfall_bench import compare_to_baseline, run_bench
+from spyfall_llm import StubBackend
+
+
+def test_bench_on_unchanged_tree_has_no_regressions():
+    baseline = run_bench(StubBackend(), [0, 1, 2])
+    report = run_bench(StubBackend(), [0, 1, 2])
+    assert report["transcripts"] == baseline["transcripts"]
+    assert compare_to_baseline(report, baseline) == []
+
+
+def test_timing_jitter_is_not_a_regression():
+    baseline = {"prompt_tokens_per_turn": 400.0, "step_latency_p95_ms": 1.0, "wall_per_game_ms": 13.0}
+    jittery = {"prompt_tokens_per_turn": 400.0, "step_latency_p95_ms": 1.4, "wall_per_game_ms": 15.5}
+    assert compare_to_baseline(jittery, baseline) == []
+
+    slower = {**jittery, "wall_per_game_ms": 40.0}
+    bigger = {**jittery, "prompt_tokens_per_turn": 460.0}
+    assert [r.split(":")[0] for r in compare_to_baseline(slower, baseline)] == ["wall_per_game_ms"]
+    assert [r.split(":")[0] for r in compare_to_baseline(bigger, baseline)] == ["prompt_tokens_per_turn"]
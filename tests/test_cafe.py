@@ -0,0 +1,155 @@
+import random
+
+import pytest
+
+pytest.importorskip("pygame")
+np = pytest.importorskip("numpy")
+
+import cafe_tycoon as ct
+import cafe_batch as cb
+
+
+def legacy_parse(order_text):
+    """레시피 서명 도입 전의 문자열 검사 파서"""
+    steps = {}
+    text = order_text.lower()
+    if 'ice' in text or '아이스' in text or '에이드' in text or '스무디' in text:
+        steps['ICE'] = 1
+    if '아메리카노' in text:
+        steps['WATER'] = 1
+        steps['SHOT'] = 1
+    elif '라떼' in text:
+        steps['MILK'] = 1
+        steps['SHOT'] = 1
+    syrups = []
+    for flavor, key in (('딸기', 'SYRUP_S'), ('망고', 'SYRUP_M'), ('청포도', 'SYRUP_G')):
+        if flavor in text and ('에이드' in text or '스무디' in text):
+            syrups.append(key)
+    if syrups:
+        steps[syrups[0]] = 1
+    if '에이드' in text:
+        steps['SODA'] = 1
+    elif '스무디' in text:
+        steps['WATER'] = steps.get('WATER', 0) + 1
+        steps['BLENDER'] = 1
+    if '휘핑크림' in text:
+        steps['WHIP'] = 1
+    elif '초코칩' in text:
+        steps['CHIP'] = 1
+    return steps
+
+
+def legacy_match(required_steps, contents):
+    """레시피 서명 도입 전의 dict 비교"""
+    required = required_steps.copy()
+    current = contents.copy()
+    if required.get('BLENDER'):
+        if not current.get('BLENDED'):
+            return False
+        del required['BLENDER']
+        current.pop('BLENDED', None)
+    elif current.get('BLENDED'):
+        return False
+    for key, count in required.items():
+        if current.get(key, 0) != count:
+            return False
+    current_keys = {k for k, v in current.items() if v > 0} - {'BLENDED'}
+    return current_keys <= set(required)
+
+
+WORDS = ["ice", "hot", "아이스", "에이드", "스무디", "아메리카노", "라떼", "딸기", "망고", "청포도",
+         "휘핑크림", "초코칩", "주세요", "juice", "토핑"]
+CUP_KEYS = list(ct.RECIPE_KEYS) + ['BLENDER']
+
+
+def random_texts(rng, count):
+    texts = list(ct.generator_menus())
+    texts += [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 6))) for _ in range(count)]
+    return texts
+
+
+def test_parser_matches_legacy():
+    for text in random_texts(random.Random(0), 3000):
+        assert ct.parse_order_to_steps(text) == legacy_parse(text), text
+        assert ct.compile_recipe(text)[0] == legacy_parse(text)
+
+
+def test_signature_matching_matches_legacy():
+    rng = random.Random(1)
+    for text in random_texts(rng, 500):
+        steps = ct.parse_order_to_steps(text)
+        order = ct.Order(text, steps, 0.0)
+        for _ in range(8):
+            exact = [key for key, count in steps.items() for _ in range(count)]
+            if rng.random() < 0.4:
+                sequence = exact
+            elif rng.random() < 0.5:
+                sequence = exact + [rng.choice(CUP_KEYS)]
+            else:
+                sequence = [rng.choice(CUP_KEYS) for _ in range(rng.randint(0, 6))]
+            cup = ct.PlayerCup(0, 0)
+            for key in sequence:
+                cup.add_ingredient(key)
+            assert cup.check_match(order) == legacy_match(steps, cup.contents), (text, sequence)
+
+
+def test_matching_order_finds_oldest_open_order():
+    sim = ct.CafeSimulation(seed=5)
+    while len(sim.orders) < 3:
+        sim.step(0.1)
+    order = sim.orders[-1]
+    for key, count in order.required_steps.items():
+        for _ in range(count):
+            sim.cup.add_ingredient(key)
+    index = sim.matching_order()
+    assert sim.orders[index].signature == order.signature
+    assert sim.serve(index)
+    assert sim.served_count == 1
+
+
+def test_no_serving_after_game_over():
+    sim = ct.CafeSimulation(seed=4)
+    while not sim.game_over:
+        sim.step(0.1)
+    assert sim.orders
+    order = sim.orders[0]
+    for key, count in order.required_steps.items():
+        for _ in range(count):
+            sim.cup.add_ingredient(key)
+    score = sim.score
+    assert not sim.serve(0)
+    assert (sim.score, sim.served_count) == (score, 0)
+
+
+def test_headless_shift_is_deterministic():
+    assert ct.play_bot_shift(ct.CafeSimulation(seed=2)) == ct.play_bot_shift(ct.CafeSimulation(seed=2))
+
+
+def test_batch_agrees_with_bot_shift():
+    scalar = ct.run_headless(300, seed=0)
+    batch = cb.run_batch(3000, seed=0, policy=cb.POLICIES["bot"], workers=1)
+
+    scalar_seconds = np.array([r["seconds"] for r in scalar])
+    scalar_served = np.array([r["served"] for r in scalar])
+    assert abs(batch["seconds"].mean() - scalar_seconds.mean()) < 0.03 * scalar_seconds.mean()
+    assert abs(batch["served"].mean() - scalar_served.mean()) < 0.03 * scalar_served.mean()
+    assert batch["game_over"].all() and all(r["game_over"] for r in scalar)
+
+
+def test_batch_is_independent_of_worker_count():
+    single = cb.run_batch(400, seed=3, workers=1, shard_size=100)
+    pooled = cb.run_batch(400, seed=3, workers=2, shard_size=100)
+    for field in cb.RESULT_FIELDS:
+        assert np.array_equal(single[field], pooled[field])
+
+
+class TightParams(cb.ShiftParams):
+    """주문 칸 수를 일부러 적게 잡은 설정"""
+    order_slots = 1
+
+
+def test_batch_grows_full_order_slots():
+    tight = cb.simulate_batch(200, seed=6, params=TightParams())
+    roomy = cb.simulate_batch(200, seed=6)
+    for field in cb.RESULT_FIELDS:
+        assert np.array_equal(tight[field], roomy[field])
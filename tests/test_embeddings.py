@@ -0,0 +1,12 @@
+import pytest
+
+import spyfall_embeddings
+from spyfall_embeddings import HashingEmbedder, create_embedder
+
+
+def test_missing_sentence_transformers_warns_instead_of_printing(monkeypatch, capsys):
+    monkeypatch.setattr(spyfall_embeddings, "SentenceTransformer", None)
+    with pytest.warns(RuntimeWarning, match="sentence-transformers"):
+        embedder = create_embedder("some-local-model")
+    assert isinstance(embedder, HashingEmbedder)
+    assert capsys.readouterr().out == ""
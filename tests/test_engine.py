@@ -0,0 +1,73 @@
+from spyfall_engine import SpyfallEngine, BOT_PLAYER_NAMES, DEFAULT_MAX_TURNS
+from spyfall_llm import StubBackend
+from spyfall_store import GameStore, STATE_COLUMNS
+
+
+def new_engine(seed, **kwargs):
+    return SpyfallEngine(StubBackend(), player_names=BOT_PLAYER_NAMES, human_name=None, seed=seed, **kwargs)
+
+
+def transcript(engine):
+    return [(t.kind, t.speaker, t.target, t.text) for t in engine.turns]
+
+
+def test_same_seed_replays_same_game():
+    first, second = new_engine(7), new_engine(7)
+    assert first.run_to_completion() == second.run_to_completion()
+    assert transcript(first) == transcript(second)
+
+
+def test_different_seeds_differ():
+    games = [new_engine(seed) for seed in range(4)]
+    for engine in games:
+        engine.run_to_completion()
+    assert len({tuple(transcript(engine)) for engine in games}) > 1
+
+
+def test_store_resume_round_trip(tmp_path):
+    store = GameStore(str(tmp_path / "games.sqlite"))
+    engine = new_engine(3, store=store)
+    engine.start()
+    for _ in range(9):
+        assert engine.step()
+
+    resumed = SpyfallEngine.resume(StubBackend(), store, engine.game_id)
+    assert resumed.players == engine.players
+    assert resumed.chosen_location == engine.chosen_location
+    assert transcript(resumed) == transcript(engine)
+    for column in STATE_COLUMNS:
+        assert getattr(resumed, column) == getattr(engine, column)
+    assert store.unfinished_games(bots_only=True) == [engine.game_id]
+
+    resumed.run_to_completion()
+    assert store.unfinished_games() == []
+    store.close()
+
+
+def test_resumed_game_matches_uninterrupted_game(tmp_path):
+    store = GameStore(str(tmp_path / "games.sqlite"))
+    engine = new_engine(5, store=store)
+    engine.start()
+    for _ in range(9):
+        assert engine.step()
+    resumed = SpyfallEngine.resume(StubBackend(), store, engine.game_id)
+    resumed.run_to_completion()
+    store.close()
+
+    uninterrupted = new_engine(5)
+    uninterrupted.run_to_completion()
+    assert transcript(resumed) == transcript(uninterrupted)
+    assert resumed.winner == uninterrupted.winner
+
+
+def test_speculation_does_not_change_the_game():
+    for seed in range(3):
+        plain, speculative, discarded = new_engine(seed), new_engine(seed, speculative=True), new_engine(seed, speculative=True)
+        plain.run_to_completion()
+        speculative.run_to_completion()
+        # 미리 생성한 질문을 매번 버려도 같은 대상을 다시 고릅니다.
+        discarded.start()
+        while discarded.game_phase != "finished" and discarded.turn_count < DEFAULT_MAX_TURNS:
+            discarded.cancel_speculation()
+            assert discarded.step()
+        assert transcript(plain) == transcript(speculative) == transcript(discarded)
@@ -0,0 +1,48 @@
+from spyfall_generation import OutputShaper, GenerationPolicy
+
+
+def shape_stream(pieces, word_limit=5, grace_words=2):
+    shaper = OutputShaper(word_limit, grace_words)
+    out = []
+    for piece in pieces:
+        out.append(shaper.feed(piece))
+        if shaper.done:
+            break
+    out.append(shaper.finish())
+    return "".join(out), shaper
+
+
+def test_strips_leading_tags_and_quotes():
+    policy = GenerationPolicy(word_limit=10)
+    assert policy.shape('나의 답변: "그냥 일하는 중이야."') == "그냥 일하는 중이야."
+    assert policy.shape("🤖 넉살의 답변: 주로 아침에 와.") == "주로 아침에 와."
+    assert policy.shape("[질문] 여기 자주 와?") == "여기 자주 와?"
+
+
+def test_tag_split_across_chunks():
+    text, _ = shape_stream(["나의", " 답", "변: 응 ", "맞아."], word_limit=10)
+    assert text == "응 맞아."
+
+
+def test_stops_at_newline():
+    text, shaper = shape_stream(["첫 줄이야.\n🕵️ 다음 질문"], word_limit=10)
+    assert text == "첫 줄이야."
+    assert shaper.done
+
+
+def test_word_limit_waits_for_sentence_end_within_grace():
+    text, _ = shape_stream(["하나 둘 셋 넷 다섯 여섯 일곱. 여덟 아홉"], word_limit=5, grace_words=2)
+    assert text == "하나 둘 셋 넷 다섯 여섯 일곱."
+
+
+def test_word_limit_cuts_when_no_sentence_end():
+    text, _ = shape_stream(["하나 둘 셋 넷 다섯 여섯 일곱 여덟 아홉"], word_limit=5, grace_words=2)
+    assert text == "하나 둘 셋 넷 다섯"
+
+
+def test_streaming_matches_whole_text():
+    policy = GenerationPolicy(word_limit=6)
+    whole = '"나의 답변: 여기는 꽤 시끄럽고 사람이 많아. 특히 저녁에 그래."'
+    streamed, _ = shape_stream([whole[i:i + 3] for i in range(0, len(whole), 3)], word_limit=6,
+                               grace_words=policy.grace_words)
+    assert streamed == policy.shape(whole)
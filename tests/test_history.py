@@ -0,0 +1,75 @@
+from spyfall_history import (
+    Turn, TurnLog, HistoryWindow, SUMMARY_HEADER, count_message_tokens
+)
+
+
+def make_log(rounds=30, action_every=3):
+    log = TurnLog()
+    for i in range(rounds):
+        log.append(Turn("question", f"p{i}", "x", "질문 " * 20))
+        log.append(Turn("answer", "x", f"p{i}", "답변 " * 20))
+        if action_every and i % action_every == 0:
+            log.append(Turn("action", f"p{i}", "y", "accuse_spy"))
+    return log
+
+
+def split_view(view):
+    if view and view[0]["content"].startswith(SUMMARY_HEADER):
+        return view[0], view[1:]
+    return None, view
+
+
+def test_turn_log_renders_incrementally():
+    log = TurnLog(human_name="나")
+    log.append(Turn("question", "넉살", "나", "여기 자주 와?"))
+    first = log.messages()
+    log.append(Turn("answer", "나", "넉살", "가끔."))
+    assert len(log.messages()) == 2
+    assert log.messages()[0] is first[0]
+    assert log.messages()[1]["content"] == "🙋‍♂️ 나의 답변: 가끔."
+    assert [t.speaker for t in log.by_player("넉살")] == ["넉살", "나"]
+
+
+def test_short_history_is_returned_as_is():
+    log = make_log(rounds=2, action_every=0)
+    window = HistoryWindow(window_turns=8, token_budget=100_000)
+    assert window.view(log.messages()) == list(log.messages())
+
+
+def test_view_stays_within_budget_including_summary():
+    log = make_log()
+    window = HistoryWindow(window_turns=4, token_budget=900)
+    history = log.messages()
+    for n in range(1, len(history) + 1):
+        view = window.view(history[:n], reserved_tokens=100)
+        assert count_message_tokens(view) <= 800
+
+
+def test_folds_never_split_question_and_answer():
+    log = make_log()
+    window = HistoryWindow(window_turns=3, token_budget=700, fold_turns=1)
+    history = log.messages()
+    for n in range(1, len(history) + 1):
+        _, recent = split_view(window.view(history[:n]))
+        # 원문 부분은 항상 턴 시작(질문 또는 액션)에서 시작합니다.
+        assert not recent or recent[0]["role"] == "user"
+
+
+def test_folded_turns_move_into_summary():
+    log = make_log(rounds=20, action_every=0)
+    window = HistoryWindow(window_turns=2, token_budget=100_000, fold_turns=2)
+    summary, recent = split_view(window.view(log.messages()))
+    assert summary is not None
+    assert len(recent) >= 4
+    assert recent == list(log.messages()[window.folded:])
+
+
+def test_messages_cannot_corrupt_render_cache():
+    log = make_log(rounds=2, action_every=0)
+    messages = log.messages()
+    assert isinstance(messages, tuple)
+    as_list = list(messages)
+    as_list.append({"role": "user", "content": "끼어든 메시지"})
+    log.append(Turn("question", "p9", "x", "새 질문"))
+    assert len(log.messages()) == 5
+    assert log.messages()[-1]["content"].endswith("새 질문")
@@ -0,0 +1,117 @@
+import pytest
+
+from spyfall_llm import (
+    StubBackend, CachedBackend, CacheMiss, LLMResult, StreamInfo, run_sync, iterate_sync
+)
+
+MESSAGES = [{"role": "system", "content": "테스트"}, {"role": "user", "content": "질문 하나 해 줘"}]
+
+
+class CountingBackend(StubBackend):
+    """호출 횟수를 세는 스텁"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def chat(self, messages, **kwargs) -> LLMResult:
+        self.calls += 1
+        return await super().chat(messages, **kwargs)
+
+
+async def collect(agen):
+    return [piece async for piece in agen]
+
+
+def test_stub_is_deterministic():
+    backend = StubBackend()
+    first = run_sync(backend.chat(MESSAGES)).content
+    assert run_sync(backend.chat(MESSAGES)).content == first
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    inner = CountingBackend()
+    recorded = run_sync(CachedBackend(inner, path, mode="record").chat(MESSAGES, max_tokens=32))
+    assert inner.calls == 1
+
+    replay_inner = CountingBackend()
+    replay = CachedBackend(replay_inner, path, mode="replay")
+    assert run_sync(replay.chat(MESSAGES, max_tokens=32)).content == recorded.content
+    assert replay_inner.calls == 0
+    assert replay.stats()["hits"] == 1
+
+    # 생성 옵션이 다르면 다른 요청입니다.
+    with pytest.raises(CacheMiss):
+        run_sync(replay.chat(MESSAGES, max_tokens=64))
+
+
+def test_read_write_reuses_response(tmp_path):
+    inner = CountingBackend()
+    cached = CachedBackend(inner, str(tmp_path / "cache.sqlite"))
+    run_sync(cached.chat(MESSAGES))
+    run_sync(cached.chat(MESSAGES))
+    assert inner.calls == 1
+
+
+def test_stream_is_recorded_and_replayed(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    streamed = run_sync(collect(CachedBackend(StubBackend(), path, mode="record").stream_chat(MESSAGES)))
+    replayed = run_sync(collect(CachedBackend(StubBackend(), path, mode="replay").stream_chat(MESSAGES)))
+    assert "".join(replayed) == "".join(streamed)
+
+
+def test_iterate_sync_closes_generator_on_early_stop():
+    closed = []
+
+    async def pieces():
+        try:
+            for i in range(10):
+                yield str(i)
+        finally:
+            closed.append(True)
+
+    stream = iterate_sync(pieces())
+    assert next(stream) == "0"
+    stream.close()
+    assert closed == [True]
+
+
+def cached_count(path):
+    import sqlite3
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_abandoned_stream_is_not_cached(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cached = CachedBackend(StubBackend(), path)
+    stream = iterate_sync(cached.stream_chat(MESSAGES))
+    next(stream)
+    stream.close()
+    assert cached_count(path) == 0
+
+    # 받는 쪽이 다 받았다고 알리고 닫으면 그때까지의 내용을 저장합니다.
+    info = StreamInfo()
+    stream = iterate_sync(cached.stream_chat(MESSAGES, info=info))
+    first = next(stream)
+    info.complete = True
+    stream.close()
+    assert cached_count(path) == 1
+    assert run_sync(collect(CachedBackend(StubBackend(), path, mode="replay").stream_chat(MESSAGES))) == [first]
+
+
+def test_cache_hits_do_not_write_each_time(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    run_sync(CachedBackend(StubBackend(), path, mode="record").chat(MESSAGES))
+
+    replay = CachedBackend(StubBackend(), path, mode="replay")
+    for _ in range(5):
+        run_sync(replay.chat(MESSAGES))
+    assert replay._db.total_changes == 0
+
+    cached = CachedBackend(StubBackend(), path)
+    for _ in range(5):
+        run_sync(cached.chat(MESSAGES))
+    assert cached._db.total_changes == 0
+    cached.close()
@@ -0,0 +1,133 @@
+import asyncio
+
+from spyfall_llm import LLMBackend, StubBackend, CachedBackend, ResilientBackend, LLMTimeoutError, CircuitOpenError, run_sync
+from spyfall_telemetry import Telemetry, timed_chat, timed_stream
+
+MESSAGES = [{"role": "user", "content": "여기 분위기 어때?"}]
+
+
+class RecordingTelemetry(Telemetry):
+    def __init__(self):
+        super().__init__(log_path=None)
+        self.records = []
+
+    def record(self, record):
+        self.records.append(record)
+        super().record(record)
+
+
+class HangingBackend(LLMBackend):
+    name = "hanging"
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None):
+        await asyncio.sleep(3600)
+
+
+async def cancel_soon(coro):
+    task = asyncio.ensure_future(coro)
+    await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        return True
+    return False
+
+
+async def drain(stream):
+    async for _ in stream:
+        pass
+
+
+def test_cancelled_calls_are_not_errors():
+    telemetry = RecordingTelemetry()
+    assert run_sync(cancel_soon(timed_chat(telemetry, HangingBackend("m"), MESSAGES, "g", "A", "question")))
+    assert run_sync(cancel_soon(drain(timed_stream(telemetry, HangingBackend("m"), MESSAGES, "g", "A", "answer"))))
+    assert [(r.cancelled, r.error) for r in telemetry.records] == [(True, None), (True, None)]
+    assert all(row["errors"] == 0 for row in telemetry.game_rollup("g"))
+
+    # 취소된 호출은 세기만 하고 지연 시간 통계에는 넣지 않습니다.
+    run_sync(timed_chat(telemetry, StubBackend(), MESSAGES, "g", "A", "question"))
+    rows = {row["phase"]: row for row in telemetry.game_rollup("g")}
+    assert (rows["question"]["calls"], rows["question"]["cancelled"]) == (2, 1)
+    assert rows["question"]["avg_latency_ms"] < 5
+    assert (rows["answer"]["cancelled"], rows["answer"]["avg_latency_ms"], rows["answer"]["max_latency_ms"]) == (1, 0, 0)
+
+    text = telemetry.prometheus_text()
+    assert 'spyfall_llm_cancelled_total{backend="hanging",model="m",phase="answer",player="A"} 1' in text
+    assert 'spyfall_llm_latency_seconds_count{backend="hanging",model="m",phase="answer",player="A"} 0' in text
+    assert 'spyfall_llm_latency_seconds_count{backend="stub",model="stub",phase="question",player="A"} 1' in text
+
+
+def test_completed_call_is_recorded_once():
+    telemetry = RecordingTelemetry()
+    run_sync(timed_chat(telemetry, StubBackend(), MESSAGES, "g", "A", "question"))
+    assert len(telemetry.records) == 1
+    assert not telemetry.records[0].cancelled and telemetry.records[0].error is None
+
+
+class FlakyStreamBackend(LLMBackend):
+    name = "flaky"
+
+    def __init__(self, failures):
+        super().__init__("m")
+        self.failures = failures
+
+    async def stream_chat(self, messages, temperature=0.8, max_tokens=None, stop=None, info=None):
+        if self.failures:
+            self.failures -= 1
+            raise LLMTimeoutError("첫 조각이 오지 않았습니다.")
+        yield "안녕"
+
+
+def test_stream_records_retries(tmp_path):
+    backend = ResilientBackend(FlakyStreamBackend(failures=2), max_retries=3)
+    backend._backoff = lambda retry, error: 0.0
+    telemetry = RecordingTelemetry()
+    run_sync(drain(timed_stream(telemetry, CachedBackend(backend, str(tmp_path / "cache.sqlite")), MESSAGES, "g", "A", "answer")))
+    assert [(r.retries, r.error) for r in telemetry.records] == [(2, None)]
+    assert telemetry.game_rollup("g")[0]["retries"] == 2
+
+
+class GatedBackend(LLMBackend):
+    name = "gated"
+
+    def __init__(self):
+        super().__init__("m")
+        self.calls = 0
+        self.failing = True
+        self.release = None
+
+    async def chat(self, messages, temperature=0.8, max_tokens=None, stop=None, tools=None, tool_choice=None):
+        self.calls += 1
+        if self.failing:
+            raise LLMTimeoutError("응답이 없습니다.")
+        await self.release.wait()
+        return await StubBackend().chat(messages)
+
+
+def test_breaker_lets_one_probe_through_after_cooldown():
+    inner = GatedBackend()
+    backend = ResilientBackend(inner, max_retries=0, breaker_threshold=1, breaker_cooldown=0.01)
+
+    async def scenario():
+        inner.release = asyncio.Event()
+        try:
+            await backend.chat(MESSAGES)
+        except LLMTimeoutError:
+            pass
+        await asyncio.sleep(0.02)
+        inner.failing = False
+        inner.calls = 0
+        probe = asyncio.ensure_future(backend.chat(MESSAGES))
+        await asyncio.sleep(0)
+        rejected = await asyncio.gather(*(backend.chat(MESSAGES) for _ in range(3)), return_exceptions=True)
+        inner.release.set()
+        await probe
+        await backend.chat(MESSAGES)
+        return rejected
+
+    rejected = run_sync(scenario())
+    assert all(isinstance(error, CircuitOpenError) for error in rejected)
+    assert inner.calls == 2
+    assert not backend.stats()["breaker_open"]